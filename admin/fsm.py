@@ -2,4 +2,8 @@ from aiogram.fsm.state import StatesGroup, State
 
 class AdminBlockFSM(StatesGroup):
     picking_start = State()
-    picking_end = State()
\ No newline at end of file
+    picking_end = State()
+
+
+class AdminCatalogFSM(StatesGroup):
+    editing_value = State()
@@ -1,21 +1,52 @@
 import logging
-from datetime import date, timedelta
+import os
+from datetime import date, datetime, timedelta
 from aiogram import Router
-from aiogram.types import CallbackQuery, Message
-from aiogram.filters import Command
+from aiogram.types import CallbackQuery, FSInputFile, Message
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 
 from admin.permissions import is_admin
-from admin.keyboards import admin_main_kb, admin_dates_kb, admin_excursions_kb
-from admin.fsm import AdminBlockFSM
-from admin.services import block_date, block_date_range, unblock_date
-from calendar_utils import build_calendar, month_title
-from db import get_blocked_dates, get_excursions, get_available_dates_range
+from admin.keyboards import (
+    admin_main_kb,
+    admin_dates_kb,
+    admin_excursions_kb,
+    admin_catalog_kb,
+    admin_excursion_kb,
+    admin_stats_kb
+)
+from admin.fsm import AdminBlockFSM, AdminCatalogFSM
+from callbacks import (
+    callback_router,
+    AdminMode,
+    AdminExcursion,
+    AdminCalendarPrev,
+    AdminCalendarNext,
+    AdminDate,
+    AdminCatalogExcursion,
+    AdminCatalogToggle,
+    AdminCatalogEdit
+)
+from admin.services import (
+    block_date,
+    block_date_range,
+    unblock_date,
+    list_excursions,
+    parse_excursion_field,
+    edit_excursion,
+    order_stats,
+    STATS_DAYS_AHEAD,
+    parse_export_args
+)
+from calendar_utils import month_title, shift_month
+from calendar_service import calendar_service
+from catalog import catalog
+from db import get_excursions
+from media_cache import media_cache
+from order_export import export_report
 
 router = Router()
 
-MAX_DAYS_AHEAD = 14
-
 
 # ====== Вход в админ-панель ======
 @router.message(Command("admin"))
@@ -32,8 +63,19 @@ async def admin_entry(message: Message, state: FSMContext):
     )
 
 
+# ====== Прогрев картинок (file_id) ======
+@router.message(Command("warmup"))
+async def admin_warmup(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+
+    uploaded = await media_cache.warm_up(message.bot, message.chat.id)
+    await message.answer(f"🖼 Загружено в Telegram: {uploaded} файлов")
+
+
 # ====== Управление датами ======
-@router.callback_query(lambda c: c.data == "admin_dates")
+@callback_router.route("admin_dates")
 async def admin_dates(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔ Нет доступа", show_alert=True)
@@ -49,9 +91,9 @@ async def admin_dates(callback: CallbackQuery, state: FSMContext):
 
 
 # ====== Выбор режима блокировки ======
-@router.callback_query(lambda c: c.data.startswith("admin_mode:"))
-async def admin_choose_excursion(callback: CallbackQuery, state: FSMContext):
-    mode = callback.data.split(":")[1]
+@callback_router.route(AdminMode)
+async def admin_choose_excursion(callback: CallbackQuery, callback_data: AdminMode, state: FSMContext):
+    mode = callback_data.mode
 
     logging.info(f"Выбран режим: {mode}")
 
@@ -74,10 +116,23 @@ async def admin_choose_excursion(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+# ====== Календарь админки ======
+def admin_calendar_prompt(mode: str | None, picking_end: bool = False) -> str:
+    if picking_end:
+        return "📆 <b>Выберите КОНЕЧНУЮ дату диапазона</b>"
+    if mode == "single":
+        return "🔒 <b>Выберите дату для блокировки</b>"
+    if mode == "range":
+        return "📆 <b>Выберите НАЧАЛЬНУЮ дату диапазона</b>"
+    if mode == "unblock":
+        return "🟢 <b>Выберите дату для разблокировки</b>\n\n❌ — заблокированные даты"
+    return "📅 <b>Выберите дату</b>"
+
+
 # ====== Выбор экскурсии ======
-@router.callback_query(lambda c: c.data.startswith("admin_exc:"))
-async def admin_excursion_selected(callback: CallbackQuery, state: FSMContext):
-    excursion_id = callback.data.split(":")[1]
+@callback_router.route(AdminExcursion)
+async def admin_excursion_selected(callback: CallbackQuery, callback_data: AdminExcursion, state: FSMContext):
+    excursion_id = callback_data.excursion_id
 
     logging.info(f"Выбрана экскурсия: {excursion_id}")
 
@@ -86,116 +141,49 @@ async def admin_excursion_selected(callback: CallbackQuery, state: FSMContext):
 
     today = date.today()
     data = await state.get_data()
-    mode = data.get("mode")
-
-    dates = get_available_dates_range(excursion_id, today, MAX_DAYS_AHEAD)
-    blocked = get_blocked_dates(excursion_id)
-
-    if mode == "single":
-        prompt = "🔒 <b>Выберите дату для блокировки</b>"
-    elif mode == "range":
-        prompt = "📆 <b>Выберите НАЧАЛЬНУЮ дату диапазона</b>"
-    elif mode == "unblock":
-        prompt = "🟢 <b>Выберите дату для разблокировки</b>\n\n❌ — заблокированные даты"
-    else:
-        prompt = "📅 <b>Выберите дату</b>"
-
-    await callback.message.edit_text(
-        prompt,
-        parse_mode="HTML",
-        reply_markup=build_calendar(
-            today.year,
-            today.month,
-            dates=dates,
-            blocked_dates=blocked,
-            mode="admin"
-        )
-    )
-    await callback.answer()
-
-
-# ====== Переключение месяцев (PREV) ======
-@router.callback_query(lambda c: c.data.startswith("admin_cal_prev"))
-async def admin_calendar_prev(callback: CallbackQuery, state: FSMContext):
-    _, year, month = callback.data.split(":")
-    year, month = int(year), int(month)
-
-    month -= 1
-    if month == 0:
-        month = 12
-        year -= 1
-
-    data = await state.get_data()
-    excursion_id = data.get("excursion_id")
-    mode = data.get("mode")
-
-    if not excursion_id:
-        await callback.answer("❌ Ошибка: экскурсия не выбрана", show_alert=True)
-        return
-
-    today = date.today()
-    dates = get_available_dates_range(excursion_id, today, MAX_DAYS_AHEAD)
-    blocked = get_blocked_dates(excursion_id)
-
-    if mode == "single":
-        prompt = "🔒 <b>Выберите дату для блокировки</b>"
-    elif mode == "range":
-        prompt = "📆 <b>Выберите НАЧАЛЬНУЮ дату диапазона</b>"
-    elif mode == "unblock":
-        prompt = "🟢 <b>Выберите дату для разблокировки</b>\n\n❌ — заблокированные даты"
-    else:
-        prompt = "📅 <b>Выберите дату</b>"
 
     await callback.message.edit_text(
-        prompt,
+        admin_calendar_prompt(data.get("mode")),
         parse_mode="HTML",
-        reply_markup=build_calendar(year, month, dates, blocked, mode="admin")
+        reply_markup=await calendar_service.keyboard(excursion_id, today.year, today.month, mode="admin")
     )
     await callback.answer()
 
 
-# ====== Переключение месяцев (NEXT) ======
-@router.callback_query(lambda c: c.data.startswith("admin_cal_next"))
-async def admin_calendar_next(callback: CallbackQuery, state: FSMContext):
-    _, year, month = callback.data.split(":")
-    year, month = int(year), int(month)
-
-    month += 1
-    if month == 13:
-        month = 1
-        year += 1
+# ====== Переключение месяцев ======
+@callback_router.route(AdminCalendarPrev)
+@callback_router.route(AdminCalendarNext)
+async def admin_calendar_page(
+    callback: CallbackQuery,
+    callback_data: AdminCalendarPrev | AdminCalendarNext,
+    state: FSMContext
+):
+    delta = -1 if isinstance(callback_data, AdminCalendarPrev) else 1
+    year, month = shift_month(callback_data.year, callback_data.month, delta)
 
     data = await state.get_data()
     excursion_id = data.get("excursion_id")
-    mode = data.get("mode")
 
     if not excursion_id:
         await callback.answer("❌ Ошибка: экскурсия не выбрана", show_alert=True)
         return
 
-    today = date.today()
-    dates = get_available_dates_range(excursion_id, today, MAX_DAYS_AHEAD)
-    blocked = get_blocked_dates(excursion_id)
-
-    if mode == "single":
-        prompt = "🔒 <b>Выберите дату для блокировки</b>"
-    elif mode == "range":
-        prompt = "📆 <b>Выберите НАЧАЛЬНУЮ дату диапазона</b>"
-    elif mode == "unblock":
-        prompt = "🟢 <b>Выберите дату для разблокировки</b>\n\n❌ — заблокированные даты"
-    else:
-        prompt = "📅 <b>Выберите дату</b>"
+    # листаем, выбирая конец диапазона, — раньше начала даты не предлагаем
+    picking_end = await state.get_state() == AdminBlockFSM.picking_end.state
+    dates_from = date.fromisoformat(data["start_date"]) if picking_end else None
 
     await callback.message.edit_text(
-        prompt,
+        admin_calendar_prompt(data.get("mode"), picking_end),
         parse_mode="HTML",
-        reply_markup=build_calendar(year, month, dates, blocked, mode="admin")
+        reply_markup=await calendar_service.keyboard(
+            excursion_id, year, month, mode="admin", dates_from=dates_from
+        )
     )
     await callback.answer()
 
 
 # ====== Кнопка "Назад к выбору экскурсии" ======
-@router.callback_query(lambda c: c.data == "admin_back_to_excursions")
+@callback_router.route("admin_back_to_excursions")
 async def admin_back_to_excursions(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     mode = data.get("mode")
@@ -213,7 +201,7 @@ async def admin_back_to_excursions(callback: CallbackQuery, state: FSMContext):
 
 
 # ====== Назад в админ-панель ======
-@router.callback_query(lambda c: c.data == "admin_back")
+@callback_router.route("admin_back")
 async def admin_back(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.edit_text(
@@ -225,7 +213,7 @@ async def admin_back(callback: CallbackQuery, state: FSMContext):
 
 
 # ====== Закрыть админ-панель ======
-@router.callback_query(lambda c: c.data == "admin_exit")
+@callback_router.route("admin_exit")
 async def admin_exit(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.delete()
@@ -233,12 +221,9 @@ async def admin_exit(callback: CallbackQuery, state: FSMContext):
 
 
 # ====== Выбор даты для блокировки/разблокировки ======
-@router.callback_query(
-    AdminBlockFSM.picking_start,
-    lambda c: c.data.startswith("admin_date:")
-)
-async def admin_pick_start(callback: CallbackQuery, state: FSMContext):
-    picked = callback.data.split(":")[1]
+@callback_router.route(AdminDate, state=AdminBlockFSM.picking_start)
+async def admin_pick_start(callback: CallbackQuery, callback_data: AdminDate, state: FSMContext):
+    picked = callback_data.date
     picked_date = date.fromisoformat(picked)
 
     data = await state.get_data()
@@ -249,7 +234,7 @@ async def admin_pick_start(callback: CallbackQuery, state: FSMContext):
 
     # 🔒 одиночная блокировка
     if mode == "single":
-        block_date(excursion_id, picked, callback.from_user.id, reason="Admin block")
+        await block_date(excursion_id, picked, callback.from_user.id, reason="Admin block")
         await state.clear()
         await callback.answer("🔒 Дата заблокирована")
         await callback.message.edit_text(
@@ -261,25 +246,17 @@ async def admin_pick_start(callback: CallbackQuery, state: FSMContext):
 
     # 🟢 разблокировка даты
     if mode == "unblock":
-        success = unblock_date(excursion_id, picked)
+        success = await unblock_date(excursion_id, picked)
 
         if success:
             # Обновляем календарь после разблокировки
-            dates = get_available_dates_range(excursion_id, date.today(), MAX_DAYS_AHEAD)
-            blocked = get_blocked_dates(excursion_id)
-
             await callback.answer("🟢 Дата разблокирована")
             await callback.message.edit_text(
-                f"🟢 <b>Выберите дату для разблокировки</b>\n\n"
-                f"❌ — заблокированные даты\n\n"
+                f"{admin_calendar_prompt(mode)}\n\n"
                 f"✅ Дата {picked} успешно разблокирована",
                 parse_mode="HTML",
-                reply_markup=build_calendar(
-                    picked_date.year,
-                    picked_date.month,
-                    dates=dates,
-                    blocked_dates=blocked,
-                    mode="admin"
+                reply_markup=await calendar_service.keyboard(
+                    excursion_id, picked_date.year, picked_date.month, mode="admin"
                 )
             )
         else:
@@ -289,44 +266,35 @@ async def admin_pick_start(callback: CallbackQuery, state: FSMContext):
 
     # 📆 начало диапазона
     if mode == "range":
-        await state.update_data(start_date=picked_date)
+        await state.update_data(start_date=picked)  # строкой: состояние хранится в JSON
         await state.set_state(AdminBlockFSM.picking_end)
 
-        dates = get_available_dates_range(excursion_id, picked_date, MAX_DAYS_AHEAD)
-        blocked = get_blocked_dates(excursion_id)
-
         await callback.message.edit_text(
-            "📆 <b>Выберите КОНЕЧНУЮ дату диапазона</b>",
+            admin_calendar_prompt(mode, picking_end=True),
             parse_mode="HTML",
-            reply_markup=build_calendar(
-                picked_date.year,
-                picked_date.month,
-                dates=dates,
-                blocked_dates=blocked,
-                mode="admin"
+            reply_markup=await calendar_service.keyboard(
+                excursion_id, picked_date.year, picked_date.month,
+                mode="admin", dates_from=picked_date
             )
         )
         await callback.answer()
 
 
 # ====== Выбор конечной даты диапазона ======
-@router.callback_query(
-    AdminBlockFSM.picking_end,
-    lambda c: c.data.startswith("admin_date:")
-)
-async def admin_pick_range_end(callback: CallbackQuery, state: FSMContext):
-    picked = callback.data.split(":")[1]
+@callback_router.route(AdminDate, state=AdminBlockFSM.picking_end)
+async def admin_pick_range_end(callback: CallbackQuery, callback_data: AdminDate, state: FSMContext):
+    picked = callback_data.date
     end_date = date.fromisoformat(picked)
 
     data = await state.get_data()
-    start_date = data.get("start_date")
+    start_date = date.fromisoformat(data.get("start_date"))
     excursion_id = data.get("excursion_id")
 
     if end_date < start_date:
         await callback.answer("❗ Конец раньше начала", show_alert=True)
         return
 
-    block_date_range(excursion_id, start_date, end_date, callback.from_user.id, reason="Admin range block")
+    await block_date_range(excursion_id, start_date, end_date, callback.from_user.id, reason="Admin range block")
 
     await state.clear()
     await callback.answer("🔒 Диапазон заблокирован")
@@ -334,4 +302,242 @@ async def admin_pick_range_end(callback: CallbackQuery, state: FSMContext):
         "✅ <b>Диапазон дат заблокирован</b>",
         parse_mode="HTML",
         reply_markup=admin_dates_kb()
-    )
\ No newline at end of file
+    )
+
+
+# =========================
+# 🗺 РЕДАКТИРОВАНИЕ ЭКСКУРСИЙ
+# =========================
+
+EXCURSION_FIELD_NAMES = {
+    "price": "цену, ₽/чел.",
+    "start_time": "время выезда (ЧЧ:ММ)",
+    "title": "название",
+    "description": "описание"
+}
+
+
+def excursion_card(ex: dict) -> str:
+    status = "видна клиентам" if ex["active"] else "🙈 скрыта"
+    return (
+        f"🗺 <b>{ex['title']}</b> ({status})\n\n"
+        f"💵 Цена: {ex['price']} ₽/чел.\n"
+        f"⏰ Выезд: {ex['start_time']}\n"
+        f"🖼 Фото: {len(ex['images'])}, точек маршрута: {len(ex['route'])}\n\n"
+        f"{ex['description']}"
+    )
+
+
+async def show_excursion_card(message: Message, excursion_id: str, edit: bool = True):
+    excursions = {ex["id"]: ex for ex in await list_excursions()}
+    ex = excursions.get(excursion_id)
+    if ex is None:
+        await message.answer("❌ Экскурсия не найдена")
+        return
+
+    send = message.edit_text if edit else message.answer
+    await send(
+        excursion_card(ex),
+        parse_mode="HTML",
+        reply_markup=admin_excursion_kb(ex["id"], ex["active"])
+    )
+
+
+# ====== Список экскурсий ======
+@callback_router.route("admin_catalog")
+async def admin_catalog(callback: CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    await state.clear()
+    await callback.message.edit_text(
+        "🗺 <b>Экскурсии</b>\n\nВыберите экскурсию для редактирования",
+        parse_mode="HTML",
+        reply_markup=admin_catalog_kb(await list_excursions())
+    )
+    await callback.answer()
+
+
+# ====== Карточка экскурсии ======
+@callback_router.route(AdminCatalogExcursion)
+async def admin_catalog_excursion(callback: CallbackQuery, callback_data: AdminCatalogExcursion, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    await state.clear()
+    await show_excursion_card(callback.message, callback_data.excursion_id)
+    await callback.answer()
+
+
+# ====== Скрыть / показать экскурсию ======
+@callback_router.route(AdminCatalogToggle)
+async def admin_catalog_toggle(callback: CallbackQuery, callback_data: AdminCatalogToggle):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    excursion_id = callback_data.excursion_id
+    excursions = {ex["id"]: ex for ex in await list_excursions()}
+    ex = excursions.get(excursion_id)
+    if ex is None:
+        await callback.answer("❌ Экскурсия не найдена", show_alert=True)
+        return
+
+    await edit_excursion(excursion_id, active=int(not ex["active"]))
+    await show_excursion_card(callback.message, excursion_id)
+    await callback.answer("🙈 Скрыта" if ex["active"] else "👁 Видна клиентам")
+
+
+# ====== Выбор поля для правки ======
+@callback_router.route(AdminCatalogEdit)
+async def admin_catalog_edit(callback: CallbackQuery, callback_data: AdminCatalogEdit, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    excursion_id, field = callback_data.excursion_id, callback_data.field
+    if field not in EXCURSION_FIELD_NAMES:
+        # кнопка от старой клавиатуры или подделанная callback_data
+        await callback.answer("❌ Это поле нельзя изменить", show_alert=True)
+        return
+
+    await state.set_state(AdminCatalogFSM.editing_value)
+    await state.update_data(excursion_id=excursion_id, field=field)
+
+    await callback.message.answer(f"✏️ Введите новое значение: {EXCURSION_FIELD_NAMES[field]}")
+    await callback.answer()
+
+
+# ====== Новое значение поля ======
+@router.message(AdminCatalogFSM.editing_value)
+async def admin_catalog_value(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+
+    data = await state.get_data()
+    excursion_id, field = data["excursion_id"], data["field"]
+
+    try:
+        value = parse_excursion_field(field, message.text, excursion_id, await list_excursions())
+    except ValueError as e:
+        await message.answer(f"❗ {e}")
+        return
+
+    await edit_excursion(excursion_id, **{field: value})
+    await state.clear()
+    await message.answer("✅ Сохранено")
+    await show_excursion_card(message, excursion_id, edit=False)
+
+
+# ====== Статистика ======
+def conversion(row: dict) -> str:
+    """Доля подписанных договоров среди созданных заказов"""
+    if not row["orders"]:
+        return "—"
+    return f"{row['signed_orders'] * 100 / row['orders']:.0f}%"
+
+
+def stats_text(by_excursion: list[dict], by_day: list[dict]) -> str:
+    total = {
+        key: sum(row[key] for row in by_excursion)
+        for key in ("orders", "seats", "revenue", "prepaid", "signed_orders", "signed_revenue")
+    }
+
+    lines = [
+        "📊 <b>Статистика</b>\n",
+        f"🧾 Заказов: {total['orders']}, подписано: {total['signed_orders']} "
+        f"(конверсия {conversion(total)})",
+        f"👥 Мест: {total['seats']}",
+        f"💰 Сумма заказов: {total['revenue']} ₽, по договорам: {total['signed_revenue']} ₽",
+        f"💳 Предоплата: {total['prepaid']} ₽",
+    ]
+
+    if by_excursion:
+        lines.append("\n🗺 <b>По экскурсиям</b>")
+    for row in sorted(by_excursion, key=lambda r: -r["orders"]):
+        ex = catalog.get(row["excursion_id"])
+        title = ex.title if ex else row["excursion_id"]
+        lines.append(
+            f"• {title}: {row['orders']} зак., {row['seats']} мест, "
+            f"{row['revenue']} ₽, конверсия {conversion(row)}"
+        )
+
+    lines.append(f"\n📅 <b>Ближайшие {STATS_DAYS_AHEAD} дней</b>")
+    if not by_day:
+        lines.append("Заказов нет")
+    for row in by_day:
+        day = date.fromisoformat(row["date"])
+        lines.append(f"• {day:%d.%m}: {row['orders']} зак., {row['seats']} мест, подписано {row['signed_orders']}")
+
+    return "\n".join(lines)
+
+
+@callback_router.route("admin_stats")
+async def admin_stats(callback: CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    await state.clear()
+    by_excursion, by_day = await order_stats()
+    await callback.message.edit_text(
+        stats_text(by_excursion, by_day),
+        parse_mode="HTML",
+        reply_markup=admin_stats_kb()
+    )
+    await callback.answer()
+
+
+# =========================
+# 📤 ВЫГРУЗКА ЗАКАЗОВ
+# =========================
+
+EXPORT_HELP = (
+    "Фильтры — в любом порядке:\n"
+    "<code>/export csv 01.10.2026 31.10.2026 Подписан</code>\n"
+    "формат xlsx/csv, одна или две даты экскурсии, id экскурсии, статус Создан/Подписан"
+)
+
+
+async def send_report(message: Message, fmt: str = "xlsx", **filters):
+    progress = await message.answer("⏳ Готовлю выгрузку…")
+
+    path, count = await export_report(fmt, **filters)
+    try:
+        await message.answer_document(
+            FSInputFile(path, filename=f"orders_{datetime.now():%Y%m%d_%H%M}.{fmt}"),
+            caption=f"📤 Заказов в выгрузке: {count}"
+        )
+    finally:
+        os.remove(path)
+        await progress.delete()
+
+
+@router.message(Command("export"))
+async def admin_export_command(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ У вас нет доступа")
+        return
+
+    excursion_ids = {ex["id"] for ex in await list_excursions()}
+    try:
+        filters = parse_export_args(command.args, excursion_ids)
+    except ValueError as e:
+        ids = ", ".join(sorted(excursion_ids))
+        await message.answer(f"❗ {e}\n\n{EXPORT_HELP}\n\nЭкскурсии: {ids}", parse_mode="HTML")
+        return
+
+    await send_report(message, **filters)
+
+
+@callback_router.route("admin_export")
+async def admin_export(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа", show_alert=True)
+        return
+
+    await callback.answer()
+    await send_report(callback.message)
+    await callback.message.answer(f"ℹ️ Все заказы. {EXPORT_HELP}", parse_mode="HTML")
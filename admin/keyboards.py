@@ -1,12 +1,16 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from callbacks import AdminMode, AdminExcursion, AdminCatalogExcursion, AdminCatalogToggle, AdminCatalogEdit
+
 
 def admin_main_kb():
     """Главное меню админ-панели"""
     kb = InlineKeyboardBuilder()
     kb.button(text="📅 Управление датами", callback_data="admin_dates")
+    kb.button(text="🗺 Экскурсии", callback_data="admin_catalog")
     kb.button(text="📊 Статистика", callback_data="admin_stats")
+    kb.button(text="📤 Выгрузка заказов", callback_data="admin_export")
     kb.button(text="❌ Закрыть", callback_data="admin_exit")
     kb.adjust(1)
     return kb.as_markup()
@@ -19,19 +23,19 @@ def admin_dates_kb():
     # 🔒 Блокировка одной даты
     kb.button(
         text="🔒 Заблокировать дату",
-        callback_data="admin_mode:single"  # ✅ ИСПРАВЛЕНО
+        callback_data=AdminMode(mode="single").pack()
     )
 
     # 📆 Блокировка диапазона
     kb.button(
         text="📆 Заблокировать диапазон",
-        callback_data="admin_mode:range"  # ✅ ИСПРАВЛЕНО
+        callback_data=AdminMode(mode="range").pack()
     )
 
     # 🟢 Разблокировка
     kb.button(
         text="🟢 Разблокировать дату",
-        callback_data="admin_mode:unblock"
+        callback_data=AdminMode(mode="unblock").pack()
     )
 
     kb.button(text="⬅️ Назад", callback_data="admin_back")
@@ -49,11 +53,47 @@ def admin_excursions_kb(excursions: list):
     for exc_id, title in excursions:
         kb.button(
             text=title,
-            callback_data=f"admin_exc:{exc_id}"
+            callback_data=AdminExcursion(excursion_id=exc_id).pack()
         )
 
     # ✅ ДОБАВЛЯЕМ кнопку "Назад"
     kb.button(text="⬅️ Назад", callback_data="admin_dates")
 
     kb.adjust(1)  # по 1 кнопке в ряд
-    return kb.as_markup()
\ No newline at end of file
+    return kb.as_markup()
+
+
+def admin_catalog_kb(excursions: list[dict]):
+    """Список экскурсий для редактирования (включая скрытые)"""
+    kb = InlineKeyboardBuilder()
+
+    for ex in excursions:
+        mark = "" if ex["active"] else "🙈 "
+        kb.button(text=f"{mark}{ex['title']}", callback_data=AdminCatalogExcursion(excursion_id=ex["id"]).pack())
+
+    kb.button(text="⬅️ Назад", callback_data="admin_back")
+    kb.adjust(1)
+    return kb.as_markup()
+
+
+def admin_excursion_kb(excursion_id: str, active: bool):
+    """Что поменять в экскурсии"""
+    kb = InlineKeyboardBuilder()
+
+    kb.button(text="💵 Цена", callback_data=AdminCatalogEdit(excursion_id=excursion_id, field="price").pack())
+    kb.button(text="⏰ Время выезда", callback_data=AdminCatalogEdit(excursion_id=excursion_id, field="start_time").pack())
+    kb.button(text="✏️ Название", callback_data=AdminCatalogEdit(excursion_id=excursion_id, field="title").pack())
+    kb.button(text="📝 Описание", callback_data=AdminCatalogEdit(excursion_id=excursion_id, field="description").pack())
+    kb.button(
+        text="🙈 Скрыть от клиентов" if active else "👁 Показать клиентам",
+        callback_data=AdminCatalogToggle(excursion_id=excursion_id).pack()
+    )
+    kb.button(text="⬅️ Назад", callback_data="admin_catalog")
+    kb.adjust(2, 2, 1, 1)
+    return kb.as_markup()
+
+
+def admin_stats_kb():
+    kb = InlineKeyboardBuilder()
+    kb.button(text="⬅️ Назад", callback_data="admin_back")
+    return kb.as_markup()
@@ -1,75 +1,141 @@
-import sqlite3
-from datetime import date, timedelta
+from datetime import date, datetime
 import logging
 
-DB_PATH = "orders.db"
+from db import (
+    block_date as _block_date,
+    unblock_date as _unblock_date,
+    block_season,
+    load_catalog,
+    update_excursion,
+    get_order_stats
+)
+from catalog import catalog
+from order_export import REPORT_FORMATS
 
 
-def block_date(excursion_id: str, date_str: str, admin_id: int, reason: str = ""):
+async def block_date(excursion_id: str, date_str: str, admin_id: int, reason: str = ""):
     """Блокировка одной даты"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute("""
-            INSERT INTO blocked_dates (excursion_id, date, blocked_by, reason)
-            VALUES (?, ?, ?, ?)
-        """, (excursion_id, date_str, admin_id, reason))
-
-        conn.commit()
+    blocked = await _block_date(excursion_id, date_str, admin_id, reason)
+    if blocked:
         logging.info(f"✅ Дата {date_str} заблокирована для {excursion_id}")
-        return True
-    except sqlite3.IntegrityError:
+    else:
         logging.warning(f"⚠️ Дата {date_str} уже заблокирована")
-        return False
-    finally:
-        conn.close()
+    return blocked
+
+
+async def block_date_range(excursion_id: str, start_date: date, end_date: date, admin_id: int, reason: str = ""):
+    """Блокировка диапазона дат одной транзакцией"""
+    result = await block_season([excursion_id], start_date, end_date, admin_id, reason)
+
+    if result.existing:
+        logging.warning(f"⚠️ Уже были заблокированы: {result.existing} дат")
+    logging.info(f"✅ Заблокировано {result.inserted} дат для {excursion_id}")
+    return result.inserted
+
+
+async def unblock_date(excursion_id: str, date_str: str):
+    """Разблокировка одной даты"""
+    unblocked = await _unblock_date(excursion_id, date_str)
+    if unblocked:
+        logging.info(f"✅ Дата {date_str} разблокирована для {excursion_id}")
+    else:
+        logging.warning(f"⚠️ Дата {date_str} не была заблокирована")
+    return unblocked
 
 
-def block_date_range(excursion_id: str, start_date: date, end_date: date, admin_id: int, reason: str = ""):
-    """Блокировка диапазона дат"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# ===== Каталог экскурсий =====
+async def list_excursions() -> list[dict]:
+    """Все экскурсии, включая скрытые"""
+    _, excursions = await load_catalog(include_inactive=True)
+    return excursions
 
-    current = start_date
-    blocked_count = 0
 
-    while current <= end_date:
+def parse_excursion_field(field: str, text: str, excursion_id: str, excursions: list[dict]):
+    """
+    Значение поля из сообщения админа; ValueError — с понятным текстом.
+    excursions — все экскурсии, включая скрытые (для проверки названия)
+    """
+    text = (text or "").strip()
+    if not text:
+        raise ValueError("Значение не может быть пустым")
+
+    if field == "price":
+        if not (text.isascii() and text.isdigit()) or int(text) <= 0:
+            raise ValueError("Цена — целое число рублей, например 3500")
+        return int(text)
+
+    if field == "start_time":
         try:
-            cursor.execute("""
-                INSERT INTO blocked_dates (excursion_id, date, blocked_by, reason)
-                VALUES (?, ?, ?, ?)
-            """, (excursion_id, current.isoformat(), admin_id, reason))
-            blocked_count += 1
-        except sqlite3.IntegrityError:
-            logging.warning(f"⚠️ Дата {current} уже заблокирована")
+            hours, minutes = map(int, text.split(":"))
+        except ValueError:
+            raise ValueError("Время в формате ЧЧ:ММ, например 08:00")
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError("Время в формате ЧЧ:ММ, например 08:00")
+        return f"{hours:02d}:{minutes:02d}"
 
-        current += timedelta(days=1)
+    if field == "title" and any(ex["title"] == text and ex["id"] != excursion_id for ex in excursions):
+        raise ValueError("Экскурсия с таким названием уже есть")
 
-    conn.commit()
-    conn.close()
+    return text
 
-    logging.info(f"✅ Заблокировано {blocked_count} дат для {excursion_id}")
-    return blocked_count
 
+async def edit_excursion(excursion_id: str, **fields) -> bool:
+    """Меняет экскурсию и сразу перечитывает каталог"""
+    updated = await update_excursion(excursion_id, **fields)
+    if updated:
+        await catalog.reload()
+        logging.info(f"✏️ Экскурсия {excursion_id} изменена: {', '.join(fields)}")
+    return updated
 
-def unblock_date(excursion_id: str, date_str: str):
-    """Разблокировка одной даты"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        DELETE FROM blocked_dates
-        WHERE excursion_id = ? AND date = ?
-    """, (excursion_id, date_str))
+# ===== Статистика =====
+STATS_DAYS_AHEAD = 7
 
-    deleted = cursor.rowcount
-    conn.commit()
-    conn.close()
 
-    if deleted > 0:
-        logging.info(f"✅ Дата {date_str} разблокирована для {excursion_id}")
-        return True
-    else:
-        logging.warning(f"⚠️ Дата {date_str} не была заблокирована")
-        return False
\ No newline at end of file
+async def order_stats() -> tuple[list[dict], list[dict]]:
+    """Итоги по экскурсиям и по ближайшим дням (из агрегатов)"""
+    return await get_order_stats(date.today(), STATS_DAYS_AHEAD)
+
+
+# ===== Выгрузка заказов =====
+ORDER_STATUSES = ("Создан", "Подписан")
+
+
+def parse_report_date(text: str) -> date | None:
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_export_args(args: str | None, excursion_ids: set[str]) -> dict:
+    """
+    Аргументы /export в любом порядке: формат (xlsx/csv), одна или две
+    даты (ДД.ММ.ГГГГ), id экскурсии, статус. ValueError — с понятным текстом.
+    """
+    filters = {"fmt": "xlsx"}
+    dates = []
+
+    for token in (args or "").split():
+        lowered = token.lower()
+        if lowered in REPORT_FORMATS:
+            filters["fmt"] = lowered
+        elif (day := parse_report_date(token)) is not None:
+            dates.append(day)
+        elif token in excursion_ids:
+            filters["excursion_id"] = token
+        elif lowered in (s.lower() for s in ORDER_STATUSES):
+            filters["status"] = lowered.capitalize()
+        else:
+            raise ValueError(f"Не понял «{token}»")
+
+    if len(dates) > 2:
+        raise ValueError("Нужно не больше двух дат: начало и конец")
+    if dates:
+        filters["date_from"], filters["date_to"] = dates[0], dates[-1]
+        if filters["date_from"] > filters["date_to"]:
+            raise ValueError("Конец раньше начала")
+
+    return filters
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from calendar_utils import invalidate_calendar_cache
+from config import AVAILABILITY_TTL, BOOKING_DAYS_AHEAD
+from db import get_availability_snapshot, on_availability_change
+from metrics import metrics
+
+
+@dataclass
+class _Snapshot:
+    free: dict = field(default_factory=dict)      # {date_str: свободных мест}
+    blocked: set = field(default_factory=set)     # {date_str, ...}
+    loaded_at: float = 0.0
+    loaded_on: date | None = None                 # окно дат считается от этого дня
+
+
+class AvailabilityCache:
+    """
+    Доступность по экскурсиям в памяти.
+    Снимок загружается одним запросом и дальше обновляется
+    записями в БД (book_places, block_date*, unblock_date) — write-through.
+    Через ttl секунд снимок перечитывается: так подхватываются
+    изменения, сделанные другими процессами.
+    В снимок попадают только даты, открытые для бронирования:
+    с сегодняшнего дня на days_ahead дней вперёд. Остальные
+    в календаре всё равно недоступны; со сменой дня снимок
+    перечитывается.
+    """
+
+    def __init__(self, ttl: float = AVAILABILITY_TTL, days_ahead: int = BOOKING_DAYS_AHEAD):
+        self.ttl = ttl
+        self.days_ahead = days_ahead
+        self.hits = 0
+        self.misses = 0
+        self._snapshots: dict[str, _Snapshot] = {}
+        self._versions: dict[str, int] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        # (экскурсия, год, месяц) -> (версия, свободные даты, блокировки)
+        self._months: dict[tuple[str, int, int], tuple[int, dict, set]] = {}
+
+    def _fresh(self, excursion_id: str) -> _Snapshot | None:
+        snap = self._snapshots.get(excursion_id)
+        if (
+            snap is not None
+            and snap.loaded_on == date.today()
+            and time.monotonic() - snap.loaded_at < self.ttl
+        ):
+            return snap
+        return None
+
+    async def _snapshot(self, excursion_id: str) -> _Snapshot:
+        snap = self._fresh(excursion_id)
+        if snap is not None:
+            self.hits += 1
+            return snap
+
+        # один загрузчик на экскурсию, остальные ждут его результат
+        lock = self._locks.setdefault(excursion_id, asyncio.Lock())
+        async with lock:
+            snap = self._fresh(excursion_id)
+            if snap is not None:
+                self.hits += 1
+                return snap
+
+            self.misses += 1
+            while True:
+                version = self.version(excursion_id)
+                today = date.today()
+                free, blocked = await get_availability_snapshot(
+                    excursion_id, today, today + timedelta(days=self.days_ahead)
+                )
+                # пока читали, прошла запись — прочитанное уже устарело
+                if self.version(excursion_id) == version:
+                    break
+
+            snap = _Snapshot(free=free, blocked=blocked, loaded_at=time.monotonic(), loaded_on=today)
+            self._snapshots[excursion_id] = snap
+            self._bump(excursion_id)
+            return snap
+
+    def _bump(self, excursion_id: str) -> int:
+        version = self._versions.get(excursion_id, 0) + 1
+        self._versions[excursion_id] = version
+        return version
+
+    def version(self, excursion_id: str) -> int:
+        return self._versions.get(excursion_id, 0)
+
+    @staticmethod
+    def _window(snap: _Snapshot, start_date: date, days_ahead: int) -> dict:
+        start = start_date.isoformat()
+        end = (start_date + timedelta(days=days_ahead)).isoformat()
+
+        return {
+            date_str: free
+            for date_str, free in snap.free.items()
+            if start <= date_str <= end
+            and free > 0
+            and date_str not in snap.blocked  # ❌ админ-блок
+        }
+
+    async def get_available_dates_range(
+        self,
+        excursion_id: str,
+        start_date: date,
+        days_ahead: int = 14
+    ) -> dict:
+        snap = await self._snapshot(excursion_id)
+        return self._window(snap, start_date, days_ahead)
+
+    async def month_view(self, excursion_id: str, year: int, month: int) -> tuple[dict, set, int]:
+        """
+        Свободные даты и блокировки одного месяца и версия снимка.
+        Срез месяца запоминается и отдаётся повторно, пока версия
+        экскурсии не изменилась
+        """
+        snap = await self._snapshot(excursion_id)
+        version = self.version(excursion_id)
+
+        key = (excursion_id, year, month)
+        cached = self._months.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2], version
+
+        prefix = f"{year:04d}-{month:02d}-"
+        blocked = {d for d in snap.blocked if d.startswith(prefix)}
+        free = {
+            date_str: places
+            for date_str, places in snap.free.items()
+            if date_str.startswith(prefix) and places > 0 and date_str not in blocked
+        }
+        self._months[key] = (version, free, blocked)
+        return free, blocked, version
+
+    async def get_blocked_dates(self, excursion_id: str) -> set[str]:
+        snap = await self._snapshot(excursion_id)
+        return set(snap.blocked)
+
+    def apply(
+        self,
+        excursion_id: str,
+        *,
+        free: dict | None = None,
+        blocked: list | None = None,
+        unblocked: list | None = None,
+        reload: bool = False
+    ):
+        """Применяет к снимку изменение, которое только что записали в БД"""
+        snap = self._snapshots.get(excursion_id)
+        if snap is None or reload:
+            self.invalidate(excursion_id)
+            return
+
+        if free:
+            snap.free.update(free)
+        if blocked:
+            # блокировка сезона может быть длиннее окна — в снимок только окно
+            first = snap.loaded_on.isoformat()
+            last = (snap.loaded_on + timedelta(days=self.days_ahead)).isoformat()
+            snap.blocked.update(d for d in blocked if first <= d <= last)
+        if unblocked:
+            snap.blocked.difference_update(unblocked)
+
+        self._bump(excursion_id)
+
+    def invalidate(self, excursion_id: str | None = None):
+        if excursion_id is None:
+            for ex_id in list(self._snapshots):
+                self.invalidate(ex_id)
+            return
+
+        self._snapshots.pop(excursion_id, None)
+        for key in [k for k in self._months if k[0] == excursion_id]:
+            del self._months[key]
+        self._bump(excursion_id)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "excursions": len(self._snapshots)
+        }
+
+
+availability = AvailabilityCache()
+on_availability_change(availability.apply)
+on_availability_change(invalidate_calendar_cache)
+metrics.register_stats("availability", availability.stats)
@@ -0,0 +1,1055 @@
+"""
+Бенчмарки изменений производительности.
+
+    python benchmarks.py --list
+    python benchmarks.py pool --users 200 --taps 5
+
+Каждый бенчмарк — подкоманда. Он повторяет замер из описания своего
+коммита: текущий код против того, как было раньше (старый вариант
+воспроизведён прямо здесь, рядом с замером). Числа зависят от машины,
+сравнивать имеет смысл только строки одного прогона.
+
+База и все файлы пишутся во временный каталог —
+рабочие orders.db и orders_journal.jsonl не трогаются.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+from loadtest import FAKE_TOKEN, percentile
+
+
+# =========================
+# 🧰 ОБЩЕЕ
+# =========================
+
+BENCHMARKS: dict[str, tuple] = {}
+
+
+def benchmark(name: str, help: str, *arguments: tuple[str, dict]):
+    """Регистрирует async-функцию f(args) как подкоманду name"""
+    def decorator(func):
+        BENCHMARKS[name] = (func, help, arguments)
+        return func
+    return decorator
+
+
+def per_call(func, *args, n: int = 1000) -> float:
+    """Среднее время одного вызова, мкс (первый вызов — прогрев)"""
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(n):
+        func(*args)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def table(headers: list[str], rows: list[tuple]) -> str:
+    widths = [
+        max(len(str(h)), *(len(str(row[i])) for row in rows))
+        for i, h in enumerate(headers)
+    ]
+    lines = ["  ".join(f"{h:>{w}}" for h, w in zip(headers, widths))]
+    lines += ["  ".join(f"{v:>{w}}" for v, w in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+class LoopMonitor:
+    """Самая долгая остановка event loop: насколько опоздал тик в interval секунд"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.worst = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.worst = max(self.worst, time.perf_counter() - start - self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def fake_order(i: int, rng: random.Random, days: int = 365, users: int = 50_000) -> dict:
+    """Правдоподобный заказ: i-й по счёту, дата экскурсии в пределах days дней от сегодня"""
+    excursion_id = rng.choice(("new_year", "pilgrims"))
+    count = rng.randint(1, 5)
+    signed = rng.random() < 0.6
+    return {
+        "booking_id": f"bench-{i:08d}",
+        "tg_id": rng.randint(1, users),
+        "name": f"Иванов Иван {i}",
+        "phone": "+79990000000",
+        "pickup_address": "ул. Ленина, 1",
+        "excursion_id": excursion_id,
+        "excursion": excursion_id,
+        "date": (date.today() + timedelta(days=rng.randint(-days, days))).isoformat(),
+        "start_time": "08:00",
+        "count": count,
+        "price": 3500 * count,
+        "route": '[{"name": "Старт", "address": "ул. Ленина, 1"}]',
+        "order_status": "Подписан" if signed else "Создан",
+        "prepayment": 1000 if signed else 0,
+        "contract_signed": int(signed),
+    }
+
+
+ORDER_COLUMNS = (
+    "booking_id", "tg_id", "name", "phone", "pickup_address", "excursion_id", "excursion",
+    "date", "start_time", "count", "price", "route", "order_status", "prepayment",
+    "contract_signed",
+)
+
+
+def fill_orders(conn: sqlite3.Connection, n: int, rng: random.Random, first: int = 0, **options):
+    """Вставляет n заказов пачками, не держа их все в памяти"""
+    sql = (
+        f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) "
+        f"VALUES ({', '.join('?' * len(ORDER_COLUMNS))})"
+    )
+    for start in range(first, first + n, 50_000):
+        batch = range(start, min(start + 50_000, first + n))
+        conn.executemany(sql, (
+            tuple(order[c] for c in ORDER_COLUMNS)
+            for order in (fake_order(i, rng, **options) for i in batch)
+        ))
+        conn.commit()
+
+
+async def prepare_db():
+    """Схема, каталог и календарь — как при старте бота"""
+    from calendar_horizon import calendar_horizon
+    from catalog import catalog
+    from db import init_db
+
+    await init_db()
+    await catalog.reload(force=True)
+    await calendar_horizon.refresh()
+
+
+# =========================
+# 🔌 ПУЛ СОЕДИНЕНИЙ ПРОТИВ СОЕДИНЕНИЯ НА ЗАПРОС
+# =========================
+
+@benchmark(
+    "pool", "нажатия в календаре: пул соединений против соединения на запрос",
+    ("--users", {"type": int, "default": 200, "help": "пользователей одновременно"}),
+    ("--taps", {"type": int, "default": 5, "help": "нажатий у каждого"}),
+)
+async def bench_pool(args):
+    import db
+
+    await prepare_db()
+    today = date.today()
+    until = today + timedelta(days=14)
+
+    async def tap_pooled():
+        await db.get_available_dates_range("new_year", today, 14)
+        await db.get_blocked_dates("new_year", today, until)
+
+    async def tap_direct():
+        # как было: новое соединение на каждый запрос, прямо в event loop
+        for func, call_args in (
+            (db.get_available_dates_range, ("new_year", today, 14)),
+            (db.get_blocked_dates, ("new_year", today, until)),
+        ):
+            conn = sqlite3.connect(db.DB_NAME)
+            try:
+                func.__wrapped__(conn, *call_args)
+            finally:
+                conn.close()
+            await asyncio.sleep(0)
+
+    rows = []
+    for name, tap in (("соединение на запрос", tap_direct), ("пул", tap_pooled)):
+        latencies = []
+
+        async def user():
+            for _ in range(args.taps):
+                start = time.perf_counter()
+                await tap()
+                latencies.append(time.perf_counter() - start)
+
+        with LoopMonitor() as monitor:
+            await asyncio.gather(*(user() for _ in range(args.users)))
+
+        rows.append((
+            name,
+            f"{percentile(latencies, 0.5) * 1000:.1f}",
+            f"{percentile(latencies, 0.99) * 1000:.1f}",
+            f"{monitor.worst * 1000:.1f}",
+        ))
+
+    print(f"{args.users} пользователей × {args.taps} нажатий "
+          f"(get_available_dates_range + get_blocked_dates)")
+    print(table(["", "p50, мс", "p99, мс", "остановка loop, мс"], rows))
+
+
+# =========================
+# 📒 ЗАПИСЬ ЗАКАЗА: ЖУРНАЛ ПРОТИВ ПЕРЕЗАПИСИ XLSX
+# =========================
+
+@benchmark(
+    "journal", "запись заказа: журнал против перезаписи orders.xlsx",
+    ("--orders", {"type": int, "default": 10_000, "help": "заказов уже в файле"}),
+    ("--new-orders", {"type": int, "default": 2000, "help": "заказов через журнал"}),
+)
+async def bench_journal(args):
+    from openpyxl import load_workbook
+    from order_export import OrderExporter, append_events, build_xlsx, order_event
+
+    rng = random.Random(1)
+    journal_path = os.path.join(args.workdir, "orders_journal.jsonl")
+    excel_path = os.path.join(args.workdir, "orders.xlsx")
+
+    for first in range(0, args.orders, 10_000):
+        append_events(
+            [order_event(fake_order(i, rng)) for i in range(first, min(first + 10_000, args.orders))],
+            journal_path
+        )
+
+    start = time.perf_counter()
+    build_xlsx(excel_path, journal_path)
+    build = time.perf_counter() - start
+
+    # как было: на каждый заказ orders.xlsx читается и сохраняется целиком
+    order = order_event(fake_order(args.orders, rng))
+    start = time.perf_counter()
+    wb = load_workbook(excel_path)
+    wb.active.append(list(order.values()))
+    wb.save(excel_path)
+    old = time.perf_counter() - start
+
+    exporter = OrderExporter(journal_path)
+    exporter.start()
+    orders = [fake_order(args.orders + 1 + i, rng) for i in range(args.new_orders)]
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        for order in orders:
+            exporter.enqueue(order)
+            await asyncio.sleep(0)
+        await exporter.stop()
+        new = (time.perf_counter() - start) / args.new_orders
+
+    print(f"{args.orders} заказов в orders.xlsx")
+    print(table(["", "на заказ"], [
+        ("перезапись orders.xlsx (как было)", f"{old:.2f} с"),
+        ("журнал: очередь + дозапись", f"{new * 1e6:.0f} мкс"),
+    ]))
+    print(f"Полная сборка orders.xlsx из журнала: {build:.2f} с")
+    print(f"Самая долгая остановка event loop при записи в журнал: {monitor.worst * 1000:.1f} мс")
+
+
+# =========================
+# 📄 РЕНДЕРИНГ ДОГОВОРОВ
+# =========================
+
+@benchmark(
+    "contracts", "договоры: пул процессов против рендеринга в event loop",
+    ("--contracts", {"type": int, "default": 200, "help": "сколько договоров"}),
+)
+async def bench_contracts(args):
+    from contracts import ContractRenderer, render_contract_pdf
+
+    rng = random.Random(1)
+    orders = [fake_order(i, rng) for i in range(args.contracts)]
+    signed_at = "01.01.2026 12:00"
+
+    rows = []
+
+    # как было: каждый договор рендерится прямо в обработчике
+    render_contract_pdf(orders[0], signed_at)  # шрифты и стили — до замера
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        for order in orders:
+            render_contract_pdf(order, signed_at)
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+    rows.append(("в event loop", f"{args.contracts / elapsed:.0f}", f"{monitor.worst * 1000:.1f}"))
+
+    renderer = ContractRenderer()
+    renderer.start()
+    await renderer.render(dict(orders[0]), signed=True)  # процессы запущены
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        await asyncio.gather(*(renderer.render(dict(order), signed=True) for order in orders))
+        elapsed = time.perf_counter() - start
+    await renderer.stop()
+    rows.append((f"пул, процессов: {renderer.workers}", f"{args.contracts / elapsed:.0f}",
+                 f"{monitor.worst * 1000:.1f}"))
+
+    print(f"{args.contracts} подписанных договоров, CPU: {os.cpu_count()}")
+    print(table(["", "договоров/с", "остановка loop, мс"], rows))
+
+
+# =========================
+# 🗓 КЭШ КЛАВИАТУР КАЛЕНДАРЯ
+# =========================
+
+@benchmark(
+    "keyboards", "клавиатура календаря: сборка против готовой из кэша",
+    ("-n", {"type": int, "default": 2000, "help": "повторов"}),
+)
+async def bench_keyboards(args):
+    from availability import availability
+    from calendar_utils import build_calendar, build_calendar_cached
+
+    await prepare_db()
+    today = date.today()
+    free, blocked, version = await availability.month_view("new_year", today.year, today.month)
+
+    cold = per_call(build_calendar, today.year, today.month, free, blocked, n=args.n)
+    warm = per_call(
+        build_calendar_cached, "new_year", version, today.year, today.month, free, blocked,
+        n=args.n
+    )
+    same = (
+        build_calendar_cached("new_year", version, today.year, today.month, free, blocked)
+        == build_calendar(today.year, today.month, free, blocked)
+    )
+
+    print(f"Клавиатура текущего месяца, {args.n} повторов")
+    print(table(["", "мкс"], [
+        ("build_calendar (как было)", f"{cold:.1f}"),
+        ("build_calendar_cached", f"{warm:.1f}"),
+    ]))
+    print(f"Ускорение: {cold / warm:.0f}×, клавиатура из кэша совпадает со свежей: {same}")
+
+
+# =========================
+# 📦 МАССОВЫЕ ВСТАВКИ ПО ДАТАМ
+# =========================
+
+@benchmark(
+    "bulk", "календарь и блокировки на сезон: цикл по дням против вставок по диапазону",
+    ("--days", {"type": int, "default": 365, "help": "дней в диапазоне"}),
+    ("--excursions", {"type": int, "default": 20, "help": "экскурсий"}),
+)
+async def bench_bulk(args):
+    import db
+
+    await db.init_db()
+    excursion_ids = [f"bench-{i:02d}" for i in range(args.excursions)]
+
+    def ranges(offset: int) -> tuple[date, date]:
+        # у каждого замера свои даты: все строки вставляются заново
+        start = date.today() + timedelta(days=offset)
+        return start, start + timedelta(days=args.days - 1)
+
+    def per_day_loop(conn, table_sql: str, insert_sql: str, start: date, end: date):
+        # как было: отдельный INSERT на каждый день каждой экскурсии
+        conn.execute(table_sql)
+        for ex_id in excursion_ids:
+            current = start
+            while current <= end:
+                conn.execute(insert_sql, (ex_id, current.isoformat()))
+                current += timedelta(days=1)
+            conn.commit()
+
+    async def timed(coro) -> float:
+        start = time.perf_counter()
+        await coro
+        return (time.perf_counter() - start) * 1000
+
+    conn = sqlite3.connect(db.DB_NAME)
+    start = time.perf_counter()
+    per_day_loop(
+        conn, "SELECT 1",
+        "INSERT OR IGNORE INTO excursion_calendar (excursion_id, date) VALUES (?, ?)",
+        *ranges(1000)
+    )
+    old_calendar = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    # прежняя таблица блокировок: строка на каждый день
+    per_day_loop(
+        conn,
+        "CREATE TABLE IF NOT EXISTS bench_blocked_dates ("
+        "excursion_id TEXT, date TEXT, PRIMARY KEY (excursion_id, date))",
+        "INSERT OR REPLACE INTO bench_blocked_dates (excursion_id, date) VALUES (?, ?)",
+        *ranges(1000)
+    )
+    old_block = (time.perf_counter() - start) * 1000
+    conn.close()
+
+    new_calendar = await timed(db.init_calendar_range(excursion_ids, *ranges(3000)))
+    new_block = await timed(db.block_season(excursion_ids, *ranges(3000), admin_id=1))
+
+    print(f"{args.days} дней × {args.excursions} экскурсий")
+    print(table(["", "цикл по дням, мс", "по диапазону, мс"], [
+        ("календарь (init_calendar_range)", f"{old_calendar:.0f}", f"{new_calendar:.0f}"),
+        ("блокировка (block_season)", f"{old_block:.0f}", f"{new_block:.0f}"),
+    ]))
+
+
+# =========================
+# 🔎 ЗАПРОСЫ К ЗАКАЗАМ С ИНДЕКСАМИ И БЕЗ
+# =========================
+
+ORDER_INDEXES = ("idx_orders_tg_id", "idx_orders_excursion_date", "idx_orders_status")
+
+
+@benchmark(
+    "indexes", "запросы к orders без индексов и с индексами миграций 1–3",
+    ("--orders", {"type": int, "default": 1_000_000, "help": "заказов"}),
+    ("--users", {"type": int, "default": 50_000, "help": "разных пользователей"}),
+    ("-n", {"type": int, "default": 200, "help": "запросов каждого вида"}),
+)
+async def bench_indexes(args):
+    import db
+
+    await db.init_db()
+    conn = sqlite3.connect(db.DB_NAME)
+    # как было: без индексов; триггеры статистики здесь только замедлят наполнение
+    index_sql = {
+        name: sql for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name IN (?, ?, ?)",
+            ORDER_INDEXES
+        )
+    }
+    for name in ORDER_INDEXES:
+        conn.execute(f"DROP INDEX {name}")
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+
+    rng = random.Random(1)
+    start = time.perf_counter()
+    fill_orders(conn, args.orders, rng, users=args.users)
+    print(f"Наполнение: {args.orders} заказов за {time.perf_counter() - start:.1f} с")
+
+    today = date.today()
+    users = [rng.randint(1, args.users) for _ in range(args.n)]
+    days = [(today + timedelta(days=rng.randint(-365, 365))).isoformat() for _ in range(args.n)]
+    last_booking = db.get_last_booking_by_user.__wrapped__
+
+    def measure() -> list[float]:
+        def timed(queries) -> float:
+            start = time.perf_counter()
+            for query in queries:
+                query()
+            return (time.perf_counter() - start) / args.n * 1000
+
+        return [
+            timed(lambda u=u: last_booking(conn, u) for u in users),
+            timed(
+                lambda d=d: conn.execute(
+                    "SELECT COUNT(*) FROM orders WHERE excursion_id = ? AND date = ?", ("new_year", d)
+                ).fetchone()
+                for d in days
+            ),
+            timed(
+                lambda: conn.execute("SELECT COUNT(*) FROM orders WHERE order_status = ?", ("Создан",)).fetchone()
+                for _ in range(args.n)
+            ),
+        ]
+
+    before = measure()
+    start = time.perf_counter()
+    for name in ORDER_INDEXES:
+        conn.execute(index_sql[name])
+    conn.commit()
+    build = time.perf_counter() - start
+    after = measure()
+    conn.close()
+
+    names = ["get_last_booking_by_user", "COUNT по (excursion_id, date)", "COUNT по order_status"]
+    print(table(["", "без индексов, мс", "с индексами, мс"], [
+        (name, f"{b:.2f}", f"{a:.3f}") for name, b, a in zip(names, before, after)
+    ]))
+    print(f"Построение индексов на существующей таблице: {build:.1f} с")
+
+
+# =========================
+# ⚙️ ПРОФИЛИ PRAGMA ПОД НАГРУЗКОЙ
+# =========================
+
+@benchmark(
+    "pragmas", "смешанная нагрузка на каждом профиле SQLITE_PROFILE",
+    ("--seconds", {"type": float, "default": 4.0, "help": "длительность на профиль"}),
+    ("--readers", {"type": int, "default": 12, "help": "потоков чтения"}),
+    ("--writers", {"type": int, "default": 4, "help": "потоков записи"}),
+    ("--orders", {"type": int, "default": 10_000, "help": "заказов в базе до начала"}),
+)
+async def bench_pragmas(args):
+    import threading
+    import db
+
+    today = date.today()
+    days = [(today + timedelta(days=i)).isoformat() for i in range(14)]
+    rows = []
+
+    for profile, pragmas in db.PRAGMA_PROFILES.items():
+        # у каждого профиля своя база: journal_mode хранится в файле
+        pool = db.ConnectionPool(
+            os.path.join(args.workdir, f"{profile}.db"),
+            args.readers + args.writers,
+            pragmas
+        )
+        pool.run(db.init_db.__wrapped__)
+        pool.run(db._init_calendar_range.__wrapped__, ["new_year", "pilgrims"], today, today + timedelta(days=14))
+        pool.run(lambda conn: (conn.execute("UPDATE excursion_calendar SET total_places = 1000000000"), conn.commit()))
+        pool.run(fill_orders, args.orders, random.Random(1))
+
+        latencies = {"read": [], "write": []}
+        stop = time.perf_counter() + args.seconds
+        counter = iter(range(args.orders, 10 ** 9))
+
+        def reader(rng: random.Random):
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                pool.run(db.get_availability_snapshot.__wrapped__,
+                         rng.choice(("new_year", "pilgrims")), today, today + timedelta(days=14))
+                pool.run(db.get_last_booking_by_user.__wrapped__, rng.randint(1, 50_000))
+                latencies["read"].append(time.perf_counter() - start)
+
+        def writer(rng: random.Random):
+            while time.perf_counter() < stop:
+                order = fake_order(next(counter), rng)
+                order["date"] = rng.choice(days)
+                start = time.perf_counter()
+                pool.run(db._reserve_places.__wrapped__, order["excursion_id"], order["date"], 1)
+                pool.run(db._save_order.__wrapped__, order)
+                latencies["write"].append(time.perf_counter() - start)
+
+        threads = [
+            threading.Thread(target=reader, args=(random.Random(i),)) for i in range(args.readers)
+        ] + [
+            threading.Thread(target=writer, args=(random.Random(100 + i),)) for i in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pool.close()
+
+        rows.append((
+            profile,
+            f"{len(latencies['read']) / args.seconds:.0f}",
+            f"{percentile(latencies['read'], 0.99) * 1000:.1f}",
+            f"{len(latencies['write']) / args.seconds:.0f}",
+            f"{percentile(latencies['write'], 0.99) * 1000:.1f}",
+        ))
+
+    print(f"{args.readers} читателей (снимок доступности + последний заказ), "
+          f"{args.writers} писателей (book_places + save_order), {args.seconds:.0f} с на профиль")
+    print(table(["профиль", "чтений/с", "p99, мс", "записей/с", "p99, мс"], rows))
+
+
+# =========================
+# 📊 ЭКРАН СТАТИСТИКИ ЗАКАЗОВ
+# =========================
+
+def _stats_tables(conn) -> tuple[list, list]:
+    return (
+        conn.execute("SELECT * FROM order_stats_daily ORDER BY excursion_id, date").fetchall(),
+        conn.execute("SELECT * FROM order_stats_excursion ORDER BY excursion_id").fetchall(),
+    )
+
+
+@benchmark(
+    "stats", "экран статистики: агрегаты на триггерах против GROUP BY по orders",
+    ("--orders", {"type": int, "default": 200_000, "help": "заказов"}),
+    ("--ops", {"type": int, "default": 2000, "help": "операций с заказами в замерах записи"}),
+)
+async def bench_stats(args):
+    import db
+
+    await db.init_db()
+    conn = sqlite3.connect(db.DB_NAME)
+    cur = conn.cursor()
+    triggers = [name for (name,) in cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")]
+
+    def drop_triggers():
+        for name in triggers:
+            cur.execute(f"DROP TRIGGER {name}")
+
+    rng = random.Random(1)
+    drop_triggers()
+    fill_orders(conn, args.orders, rng)
+
+    # миграция 6 на существующих заказах: триггеры + пересчёт в одной транзакции
+    start = time.perf_counter()
+    cur.execute("BEGIN IMMEDIATE")
+    db._create_order_stats_triggers(cur)
+    db._rebuild_order_stats(cur)
+    conn.commit()
+    backfill = time.perf_counter() - start
+
+    today = date.today()
+    columns = ", ".join(f"SUM({value.format(row='o')})" for value in db._ORDER_STATS_VALUES)
+
+    def group_by_orders():
+        # как было бы без агрегатов: каждый раз проход по всем заказам
+        cur.execute(f"SELECT o.excursion_id, {columns} FROM orders o GROUP BY o.excursion_id").fetchall()
+        cur.execute(
+            f"SELECT o.date, {columns} FROM orders o WHERE o.date >= ? AND o.date < ? GROUP BY o.date",
+            (today.isoformat(), (today + timedelta(days=7)).isoformat())
+        ).fetchall()
+
+    screen = per_call(db.get_order_stats.__wrapped__, conn, today, 7, n=200)
+    naive = per_call(group_by_orders, n=3)
+
+    def insert_and_sign(first: int) -> float:
+        orders = [fake_order(first + i, rng) for i in range(args.ops)]
+        start = time.perf_counter()
+        for order in orders:
+            db._save_order.__wrapped__(conn, order)
+            db._sign_contract.__wrapped__(conn, order["booking_id"])
+        return (time.perf_counter() - start) / args.ops * 1e6
+
+    first = args.orders
+    with_triggers = insert_and_sign(first)
+    drop_triggers()
+    without_triggers = insert_and_sign(first + args.ops)
+    first += 2 * args.ops
+
+    cur.execute("BEGIN IMMEDIATE")
+    db._create_order_stats_triggers(cur)
+    db._rebuild_order_stats(cur)
+    conn.commit()
+
+    # случайные вставки, подписи, переносы дат и удаления — агрегаты против пересчёта
+    booking_ids = [f"bench-{i:08d}" for i in range(first)]
+    for i in range(args.ops):
+        op = rng.random()
+        if op < 0.4:
+            order = fake_order(first + i, rng)
+            db._save_order.__wrapped__(conn, order)
+            booking_ids.append(order["booking_id"])
+        elif op < 0.7:
+            db._sign_contract.__wrapped__(conn, rng.choice(booking_ids))
+        elif op < 0.9:
+            cur.execute(
+                "UPDATE orders SET date = ?, count = ? WHERE booking_id = ?",
+                ((today + timedelta(days=rng.randint(0, 30))).isoformat(), rng.randint(1, 5),
+                 rng.choice(booking_ids))
+            )
+            conn.commit()
+        else:
+            cur.execute("DELETE FROM orders WHERE booking_id = ?", (rng.choice(booking_ids),))
+            conn.commit()
+    incremental = _stats_tables(conn)
+    cur.execute("BEGIN IMMEDIATE")
+    db._rebuild_order_stats(cur)
+    conn.commit()
+    consistent = incremental == _stats_tables(conn)
+    conn.close()
+
+    print(f"{args.orders} заказов")
+    print(f"Пересчёт агрегатов при миграции: {backfill:.2f} с")
+    print(table(["", "мкс"], [
+        ("экран статистики: агрегаты", f"{screen:.0f}"),
+        ("экран статистики: GROUP BY по orders", f"{naive:.0f}"),
+        ("заказ + подпись с триггерами", f"{with_triggers:.0f}"),
+        ("заказ + подпись без триггеров", f"{without_triggers:.0f}"),
+    ]))
+    print(f"После {args.ops} случайных операций агрегаты совпадают с пересчётом: {consistent}")
+
+
+# =========================
+# 📤 ВЫГРУЗКА ЗАКАЗОВ: ВРЕМЯ И ПАМЯТЬ
+# =========================
+
+def _export_child(db_path: str, fmt: str, results):
+    """Выгрузка в свежем процессе: пик RSS не смешан с наполнением базы"""
+    import resource
+
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    from order_export import export_report
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    path, count = asyncio.run(export_report(fmt))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    os.remove(path)
+    results.put((elapsed, count, rss_before / 1024, rss_after / 1024))
+
+
+@benchmark(
+    "export", "выгрузка заказов в CSV/XLSX: время и пик памяти",
+    ("--orders", {"type": int, "nargs": "+", "default": [100_000, 500_000], "help": "размеры выгрузки"}),
+)
+async def bench_export(args):
+    import multiprocessing
+    import db
+    from order_export import build_report
+
+    await db.init_db()
+    conn = sqlite3.connect(db.DB_NAME)
+    # агрегаты статистики здесь не нужны, без триггеров база наполняется быстрее
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+
+    rng = random.Random(1)
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    filled = 0
+    for size in sorted(args.orders):
+        fill_orders(conn, size - filled, rng, first=filled)
+        filled = size
+
+        for fmt in ("csv", "xlsx"):
+            results = ctx.Queue()
+            process = ctx.Process(target=_export_child, args=(db.DB_NAME, fmt, results))
+            process.start()
+            elapsed, count, rss_before, rss_peak = results.get()
+            process.join()
+            rows.append((f"{count}", fmt, f"{elapsed:.1f}", f"{rss_before:.0f}", f"{rss_peak:.0f}"))
+
+    # отфильтрованная выгрузка — столько же строк, сколько даёт COUNT
+    today = date.today()
+    filters = {"date_from": today, "date_to": today + timedelta(days=30),
+               "excursion_id": "new_year", "status": "Подписан"}
+    exported = build_report(os.path.join(args.workdir, "filtered.csv"), "csv", **filters)
+    expected = conn.execute(
+        "SELECT COUNT(*) FROM orders WHERE date BETWEEN ? AND ? AND excursion_id = ? AND order_status = ?",
+        (today.isoformat(), filters["date_to"].isoformat(), "new_year", "Подписан")
+    ).fetchone()[0]
+    conn.close()
+
+    print(table(["заказов", "формат", "время, с", "RSS до, МБ", "пик RSS, МБ"], rows))
+    print(f"Отфильтрованная выгрузка: {exported} строк, COUNT: {expected}")
+
+
+# =========================
+# 🔀 МАРШРУТИЗАЦИЯ CALLBACK-КНОПОК
+# =========================
+
+def _callback_update(update_id: int, data: str):
+    from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+    user = User(id=1000, is_bot=False, first_name="Bench")
+    chat = Chat(id=1000, type="private")
+    message = Message(message_id=1, date=0, chat=chat, from_user=user, text="🗓")
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance="bench", message=message, data=data
+    ))
+
+
+def _callback_dispatcher(kind: str, handlers: int):
+    """Dispatcher с handlers кнопками "btn<i>:<число>", зарегистрированными по-старому или через таблицу"""
+    from types import new_class
+
+    from aiogram import Dispatcher, F
+    from aiogram.filters.callback_data import CallbackData
+
+    from callbacks import CallbackRouter
+
+    async def noop(callback, **kwargs):
+        pass
+
+    dp = Dispatcher()
+    router = CallbackRouter()
+    for i in range(handlers):
+        prefix = f"btn{i}"
+        if kind == "lambda":
+            # как было: синхронный фильтр на каждый обработчик
+            dp.callback_query.register(noop, lambda c, p=f"{prefix}:": c.data.startswith(p))
+        elif kind == "filter":
+            dp.callback_query.register(noop, F.data.startswith(f"{prefix}:"))
+        else:
+            data_class = new_class(
+                f"Btn{i}", (CallbackData,), {"prefix": prefix},
+                lambda ns: ns.update({"__annotations__": {"value": int}})
+            )
+            router.route(data_class)(noop)
+    if kind == "table":
+        router.setup(dp)
+    return dp
+
+
+@benchmark(
+    "dispatch", "маршрутизация callback-кнопок: цепочка фильтров против таблицы",
+    ("--handlers", {"type": int, "nargs": "+", "default": [5, 25, 50, 100, 200], "help": "число обработчиков"}),
+    ("-n", {"type": int, "default": 300, "help": "апдейтов на замер"}),
+)
+async def bench_dispatch(args):
+    from aiogram import Bot
+    from aiogram.dispatcher.event.bases import UNHANDLED
+
+    bot = Bot(FAKE_TOKEN)
+    columns = [
+        ("lambda", "mid"), ("lambda", "last"),
+        ("filter", "mid"), ("filter", "last"),
+        ("table", "mid"), ("table", "last"),
+    ]
+    rows = []
+    try:
+        for handlers in args.handlers:
+            row = [handlers]
+            for kind, position in columns:
+                dp = _callback_dispatcher(kind, handlers)
+                target = handlers // 2 if position == "mid" else handlers - 1
+                updates = [_callback_update(i, f"btn{target}:42") for i in range(args.n + 1)]
+
+                handled = await dp.feed_update(bot, updates[0])  # прогрев
+                assert handled is not UNHANDLED, f"{kind}: кнопка не дошла до обработчика"
+                start = time.perf_counter()
+                for update in updates[1:]:
+                    await dp.feed_update(bot, update)
+                row.append(f"{(time.perf_counter() - start) / args.n * 1e6:.0f}")
+            rows.append(tuple(row))
+    finally:
+        await bot.session.close()
+
+    print(f"Dispatcher.feed_update, пустой обработчик, мкс на апдейт ({args.n} апдейтов)")
+    print(table(["обработчиков", *(f"{kind}, {position}" for kind, position in columns)], rows))
+
+
+# =========================
+# 🗓 СНИМОК ДОСТУПНОСТИ И ЛИСТАНИЕ КАЛЕНДАРЯ
+# =========================
+
+@benchmark(
+    "calendar", "снимок доступности и листание календаря",
+    ("--season", {"type": int, "default": 360, "help": "дней в заблокированном сезоне"}),
+    ("-n", {"type": int, "default": 2000, "help": "повторов"}),
+)
+async def bench_calendar(args):
+    import db
+    from availability import availability
+    from calendar_service import calendar_service
+    from config import CALENDAR_HORIZON_DAYS
+
+    await prepare_db()  # календарь на CALENDAR_HORIZON_DAYS дней вперёд
+    today = date.today()
+    season_start = today + timedelta(days=15)
+    season_end = season_start + timedelta(days=args.season - 1)
+    await db.block_season(["new_year"], season_start, season_end, admin_id=1)
+
+    conn = sqlite3.connect(db.DB_NAME)
+    # прежняя таблица блокировок: строка на каждый день
+    conn.execute(
+        "CREATE TABLE bench_blocked_dates (excursion_id TEXT, date TEXT, PRIMARY KEY (excursion_id, date))"
+    )
+    conn.executemany(
+        "INSERT INTO bench_blocked_dates VALUES ('new_year', ?)",
+        ((d,) for d in db.date_range_strs(season_start, season_end))
+    )
+    conn.commit()
+
+    def unbounded_snapshot():
+        # как было: всё начиная с сегодняшнего дня
+        since = today.isoformat()
+        free = dict(conn.execute(
+            "SELECT date, MAX(total_places - booked_places, 0) FROM excursion_calendar "
+            "WHERE excursion_id = ? AND date >= ?", ("new_year", since)
+        ).fetchall())
+        blocked = {d for (d,) in conn.execute(
+            "SELECT date FROM bench_blocked_dates WHERE excursion_id = ? AND date >= ?", ("new_year", since)
+        ).fetchall()}
+        return free, blocked
+
+    window_end = today + timedelta(days=availability.days_ahead)
+    old_query = per_call(unbounded_snapshot, n=args.n)
+    new_query = per_call(
+        db.get_availability_snapshot.__wrapped__, conn, "new_year", today, window_end, n=args.n
+    )
+    conn.close()
+
+    async def page_turn(year: int, month: int, cold: bool) -> tuple[float, int]:
+        """мкс на нажатие и сколько раз за замер читалась БД"""
+        misses = availability.misses
+        start = time.perf_counter()
+        for _ in range(args.n):
+            if cold:
+                # снимок устарел — как после AVAILABILITY_TTL
+                availability.invalidate("new_year")
+            await calendar_service.keyboard("new_year", year, month)
+        elapsed = (time.perf_counter() - start) / args.n * 1e6
+        return elapsed, availability.misses - misses
+
+    beyond = today + timedelta(days=120)
+    for day in (today, beyond):  # прогрев
+        await calendar_service.keyboard("new_year", day.year, day.month)
+    warm, warm_queries = await page_turn(today.year, today.month, cold=False)
+    cold_inside, inside_queries = await page_turn(today.year, today.month, cold=True)
+    cold_beyond, beyond_queries = await page_turn(beyond.year, beyond.month, cold=True)
+
+    print(f"Календарь на {CALENDAR_HORIZON_DAYS} дней, заблокирован сезон {args.season} дней, {args.n} повторов")
+    print(table(["", "мкс", "запросов к БД"], [
+        ("снимок: всё с сегодняшнего дня (как было)", f"{old_query:.1f}", ""),
+        (f"снимок: окно {availability.days_ahead} дней", f"{new_query:.1f}", ""),
+        ("листание, кэш прогрет", f"{warm:.1f}", warm_queries),
+        ("листание, снимок устарел, месяц в окне", f"{cold_inside:.1f}", inside_queries),
+        ("листание, снимок устарел, месяц за окном", f"{cold_beyond:.1f}", beyond_queries),
+    ]))
+
+
+# =========================
+# 🚫 БЛОКИРОВКИ: СТРОКА НА ДЕНЬ ПРОТИВ ИНТЕРВАЛОВ
+# =========================
+
+async def _block_history(excursion_id: str, years: int, rng: random.Random) -> list[str]:
+    """
+    Блокировки за years лет назад и на год вперёд: в каждом году два
+    сезона по 60 дней и 100 отдельных дней. Возвращает все заблокированные даты
+    """
+    import db
+
+    blocked = []
+    for k in range(-years, 1):
+        year_start = date.today() + timedelta(days=365 * k)
+        for offset in (30, 200):
+            start = year_start + timedelta(days=offset)
+            end = start + timedelta(days=59)
+            await db.block_season([excursion_id], start, end, admin_id=1, reason="сезон")
+            blocked += db.date_range_strs(start, end)
+
+        seasons = set(range(30, 90)) | set(range(200, 260))
+        for offset in rng.sample([d for d in range(365) if d not in seasons], 100):
+            day = (year_start + timedelta(days=offset)).isoformat()
+            await db.block_date(excursion_id, day, admin_id=1)
+            blocked.append(day)
+    return blocked
+
+
+@benchmark(
+    "blocks", "блокировки дат: строка на день против интервалов",
+    ("--years", {"type": int, "nargs": "+", "default": [1, 10], "help": "лет истории блокировок"}),
+    ("-n", {"type": int, "default": 2000, "help": "повторов"}),
+)
+async def bench_blocks(args):
+    import db
+
+    await db.init_db()
+    today = date.today()
+    days_ahead = 14
+    rng = random.Random(1)
+
+    conn = sqlite3.connect(db.DB_NAME)
+    # прежняя таблица блокировок: строка на каждый день
+    conn.execute(
+        "CREATE TABLE bench_blocked_dates (excursion_id TEXT, date TEXT, PRIMARY KEY (excursion_id, date))"
+    )
+
+    histories = {}
+    for years in args.years:
+        excursion_id = f"bench-{years}y"
+        await db.init_calendar_range([excursion_id], today, today + timedelta(days=60))
+        blocked = await _block_history(excursion_id, years, rng)
+        conn.executemany(
+            "INSERT OR IGNORE INTO bench_blocked_dates VALUES (?, ?)",
+            ((excursion_id, d) for d in blocked)
+        )
+        conn.commit()
+        histories[years] = excursion_id
+
+    def old_blocked_dates(excursion_id: str) -> set[str]:
+        # как было: вся история блокировок экскурсии
+        return {d for (d,) in conn.execute(
+            "SELECT date FROM bench_blocked_dates WHERE excursion_id = ?", (excursion_id,)
+        ).fetchall()}
+
+    def old_available_dates_range(excursion_id: str, start_date: date) -> dict:
+        end_date = start_date + timedelta(days=days_ahead)
+        rows = conn.execute(
+            "SELECT date, total_places, booked_places FROM excursion_calendar "
+            "WHERE excursion_id = ? AND date BETWEEN ? AND ?",
+            (excursion_id, start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
+        blocked = old_blocked_dates(excursion_id)
+        return {
+            date_str: total - booked
+            for date_str, total, booked in rows
+            if date_str not in blocked and total > booked
+        }
+
+    def new_calls(excursion_id: str) -> tuple[float, float]:
+        available = per_call(
+            db.get_available_dates_range.__wrapped__, conn, excursion_id, today, days_ahead, n=args.n
+        )
+        blocked = per_call(
+            db.get_blocked_dates.__wrapped__, conn, excursion_id,
+            today, today + timedelta(days=days_ahead), n=args.n
+        )
+        return available, blocked
+
+    sizes, old, new, same = {}, {}, {}, {}
+    for years, excursion_id in histories.items():
+        sizes[years] = tuple(
+            conn.execute(f"SELECT COUNT(*) FROM {name} WHERE excursion_id = ?", (excursion_id,)).fetchone()[0]
+            for name in ("bench_blocked_dates", "blocked_ranges")
+        )
+        same[years] = (
+            old_available_dates_range(excursion_id, today)
+            == db.get_available_dates_range.__wrapped__(conn, excursion_id, today, days_ahead)
+        )
+        old[years] = (
+            per_call(old_available_dates_range, excursion_id, today, n=args.n),
+            per_call(old_blocked_dates, excursion_id, n=args.n),
+        )
+        new[years] = new_calls(excursion_id)
+    conn.close()
+
+    archived = await db.archive_blocked_before(today)
+    conn = sqlite3.connect(db.DB_NAME)
+    after_archive = {years: new_calls(excursion_id) for years, excursion_id in histories.items()}
+    conn.close()
+
+    print(f"Окно {days_ahead} дней, мкс на вызов, {args.n} повторов")
+    for i, name in enumerate(("get_available_dates_range", "get_blocked_dates")):
+        print(f"\n{name}")
+        print(table(
+            ["лет истории", "строк по дням", "интервалов", "как было", "интервалы", "после архива"],
+            [
+                (years, *sizes[years], f"{old[years][i]:.1f}", f"{new[years][i]:.1f}",
+                 f"{after_archive[years][i]:.1f}")
+                for years in histories
+            ]
+        ))
+    print(f"\nВ архив перенесено интервалов: {archived}")
+    print(f"Свободные даты совпадают со старым запросом: {all(same.values())}")
+
+
+# =========================
+# ▶️ ЗАПУСК
+# =========================
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="benchmarks-")
+    # окружение — до импорта модулей бота: config читается один раз
+    os.environ["DB_PATH"] = os.path.join(workdir, "orders.db")
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    args.workdir = workdir
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    func, _, _ = BENCHMARKS[args.name]
+    try:
+        await func(args)
+    finally:
+        from db import close_db
+        close_db()
+
+    print(f"\nДанные прогона: {workdir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки изменений производительности")
+    parser.add_argument("--list", action="store_true", help="список бенчмарков")
+    subparsers = parser.add_subparsers(dest="name")
+    for name, (_, help, arguments) in BENCHMARKS.items():
+        sub = subparsers.add_parser(name, help=help)
+        for flag, options in arguments:
+            sub.add_argument(flag, **options)
+
+    args = parser.parse_args()
+    if args.list or not args.name:
+        for name, (_, help, _) in BENCHMARKS.items():
+            print(f"{name:<12} {help}")
+    else:
+        asyncio.run(main(args))
@@ -9,37 +9,58 @@ from aiogram import Bot, Dispatcher
 from aiogram.types import (
     Message, ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton,
-    CallbackQuery, FSInputFile
+    CallbackQuery, BufferedInputFile
 )
 from aiogram.filters import Command
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import InputMediaPhoto
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from dotenv import load_dotenv
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from openpyxl import Workbook, load_workbook
-from calendar_utils import build_calendar, month_title
+from calendar_utils import month_title, shift_month
+from calendar_service import calendar_service
 from datetime import date, datetime, timedelta
 from admin.handlers import router as admin_router
-from config import EXCURSIONS
+from order_export import order_exporter, import_legacy_excel, build_xlsx
+from contracts import contract_renderer
+from media_cache import media_cache
+from review_gallery import ReviewGallery
+from callbacks import (
+    callback_router,
+    Paid,
+    PayOnPlace,
+    ViewContract,
+    SignContract,
+    PickDate,
+    CalendarPrev,
+    CalendarNext,
+    ReviewsPage
+)
+from fsm_storage import SQLiteStorage
+from webhook import run_webhook
+from calendar_horizon import calendar_horizon
+from notifications import notifier
+from catalog import catalog
+from metrics import metrics, setup_metrics
+from config import (
+    MEDIA_WARMUP_CHAT_ID,
+    FSM_FLUSH_INTERVAL,
+    FSM_SESSION_TTL_HOURS,
+    RUN_MODE,
+    METRICS_LOG_INTERVAL,
+    BOOKING_DAYS_AHEAD,
+    MAX_BOOKING_COUNT
+)
 from db import (
     init_db,
     save_order,
     sign_contract,
     get_last_booking_by_user,
+    get_order_by_id,
     mark_paid,
-    init_calendar_for_month,
-    get_available_dates_range,
-    get_blocked_dates,
-    book_places
+    book_places,
+    BookingStatus,
+    close_db
 )
 # ======================
 # НАСТРОЙКИ
@@ -50,16 +71,20 @@ TOKEN = os.getenv("BOT_TOKEN")
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=SQLiteStorage(
+    flush_interval=FSM_FLUSH_INTERVAL,
+    session_ttl=FSM_SESSION_TTL_HOURS * 3600
+))
 dp.include_router(admin_router)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-EXCEL_FILE = os.path.join(BASE_DIR, "orders.xlsx")
+callback_router.setup(dp)
+setup_metrics(dp, bot)
+metrics.register_stats("fsm", dp.storage.stats)
 
 # ======================
 # 🔥 НАСТРОЙКИ КАЛЕНДАРЯ
 # ======================
 
-MAX_DAYS_AHEAD = 14
+MAX_DAYS_AHEAD = BOOKING_DAYS_AHEAD
 
 BLOCKED_DATES = {
     # пример:
@@ -140,6 +165,11 @@ REVIEWS = [
     }
 ]
 
+AVATAR_PHOTO = "images/avatar.jpg"
+
+media_cache.register(AVATAR_PHOTO, *[review["photo"] for review in REVIEWS])
+review_gallery = ReviewGallery(REVIEWS)
+
 CONTACT_TEXT = (
     "📞 <b>Связаться с нами</b>\n\n"
     "Федеральный номер:\n"
@@ -161,15 +191,6 @@ DRIVERS = [
     }
 ]
 
-EXECUTOR = {
-    "name": "ИП Шин Сергей Тимофеевич",
-    "inn": "621200217989",
-    "city": "Москва",
-    "car": "GAC M8",
-    "car_type": "M1",
-    "plate": "В412УМ62"
-}
-
 # ======================
 # FSM
 # ======================
@@ -196,30 +217,27 @@ main_kb = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-def excursion_kb():
-    buttons = [[KeyboardButton(text=ex["title"])] for ex in EXCURSIONS]
-    buttons.append([KeyboardButton(text="⬅️ Назад")])
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-
 def book_kb():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📅 Забронировать", callback_data="start_booking")]
     ])
 
-def payment_kb(amount: int):
+def payment_kb(booking_id: str, amount: int):
     return InlineKeyboardMarkup(inline_keyboard=[
-        #[InlineKeyboardButton(text=f"💳 Оплатить 30% ({amount} ₽)", callback_data="paid")],
-        [InlineKeyboardButton(text="💰 Оплата на месте (картой или наличными)", callback_data="pay_on_place")],
-        #[InlineKeyboardButton(text="✅ Я оплатил", callback_data="paid")]
+        #[InlineKeyboardButton(text=f"💳 Оплатить 30% ({amount} ₽)", callback_data=Paid(booking_id=booking_id).pack())],
+        [InlineKeyboardButton(text="💰 Оплата на месте", callback_data=PayOnPlace(booking_id=booking_id).pack())],
+        #[InlineKeyboardButton(text="✅ Я оплатил", callback_data=Paid(booking_id=booking_id).pack())]
     ])
 
-view_contract_kb = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text="📄 Ознакомиться с договором", callback_data="view_contract")]
-])
+def view_contract_kb(booking_id: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📄 Ознакомиться с договором", callback_data=ViewContract(booking_id=booking_id).pack())]
+    ])
 
-sign_contract_kb = InlineKeyboardMarkup(inline_keyboard=[
-    [InlineKeyboardButton(text="✍️ Подписать договор", callback_data="sign_contract")]
-])
+def sign_contract_kb(booking_id: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✍️ Подписать договор", callback_data=SignContract(booking_id=booking_id).pack())]
+    ])
 
 def calendar_kb(dates):
     kb = InlineKeyboardBuilder()
@@ -228,181 +246,20 @@ def calendar_kb(dates):
         day = date[-2:]
         kb.button(
             text=f"{day} ({free})",
-            callback_data=f"date:{date}"
+            callback_data=PickDate(date=date).pack()
         )
 
     kb.adjust(3)
     return kb.as_markup()
 # ======================
-# PDF
-# ======================
-
-PAGE_WIDTH, PAGE_HEIGHT = A4
-
-pdfmetrics.registerFont(TTFont("DejaVu", "DejaVuSans.ttf"))
-pdfmetrics.registerFont(TTFont("DejaVu-Bold", "DejaVuSans-Bold.ttf"))
-
-def generate_contract_pdf(order: dict, signed=False) -> str:
-    filename = f"contract_{order['booking_id']}.pdf"
-
-    doc = SimpleDocTemplate(
-        filename,
-        pagesize=A4,
-        rightMargin=40,
-        leftMargin=40,
-        topMargin=40,
-        bottomMargin=40
-    )
-
-    styles = getSampleStyleSheet()
-
-    styles.add(ParagraphStyle(
-        name="TitleCenter",
-        fontName="DejaVu-Bold",
-        fontSize=13,
-        alignment=TA_CENTER,
-        spaceAfter=12
-    ))
-
-    styles.add(ParagraphStyle(
-        name="Justify",
-        fontName="DejaVu",
-        fontSize=11,
-        alignment=TA_JUSTIFY,
-        leading=15,
-        spaceAfter=10
-    ))
-
-    styles.add(ParagraphStyle(
-        name="Section",
-        fontName="DejaVu-Bold",
-        fontSize=11,
-        spaceBefore=15,
-        spaceAfter=8
-    ))
-
-    story = []
-
-    # ===== ЗАГОЛОВОК =====
-    story.append(Paragraph(
-        f"Договор фрахтования № {order['booking_id']}",
-        styles["TitleCenter"]
-    ))
-
-    story.append(Paragraph(
-        "транспортного средства для перевозки пассажиров по заказу",
-        styles["TitleCenter"]
-    ))
-
-    # ===== ВВОДНЫЙ ТЕКСТ =====
-    story.append(Paragraph(
-        f"{EXECUTOR['name']}, ИНН {EXECUTOR['inn']}, именуемый в дальнейшем "
-        f"Фрахтовщик, и {order['name']}, именуемый в дальнейшем Фрахтователь, "
-        f"заключили настоящий договор о нижеследующем:",
-        styles["Justify"]
-    ))
-
-    # ===== МАРШРУТ (ТОЛЬКО АДРЕСА) =====
-    PICKUP_ADDRESSES = {
-        "opalikha": "Московская обл., Красногорск, станция Опалиха",
-        "tsum": "г. Москва, ул. Петровка, 2"
-    }
-    route_points = json.loads(order["route"])
-    order["pickup_address"] = PICKUP_ADDRESSES["opalikha"]
-    route_addresses = [
-                          order["pickup_address"]
-                      ] + [p["address"] for p in route_points]
-    full_route = " — ".join(route_addresses)
-
-    story.append(Paragraph(
-        f"1.1. Фрахтовщик обязуется за плату в размере {order['price']} рублей "
-        f"предоставить Фрахтователю всю вместимость транспортного средства для перевозки пассажиров и багажа.",
-        styles["Justify"]
-    ))
-
-    story.append(Paragraph(
-        f"<b>1.2. Место подачи:</b> {order['pickup_address']} (со стороны ЖК Опалиха О3)",
-        styles["Justify"]
-    ))
-
-    story.append(Paragraph(
-        f"<b>1.3. Маршрут перевозки:</b> {full_route}.",
-        styles["Justify"]
-    ))
-
-    story.append(Paragraph(
-        f"<b>1.4. Срок выполнения перевозки:</b> {order['date']}.",
-        styles["Justify"]
-    ))
-
-    # ===== ТРАНСПОРТ =====
-    story.append(Paragraph("1.5. Транспортное средство:", styles["Section"]))
-
-    story.append(Paragraph(
-        f"Марка и модель: {EXECUTOR['car']}<br/>"
-        f"Тип ТС: {EXECUTOR['car_type']}<br/>"
-        f"Государственный номер: {EXECUTOR['plate']}",
-        styles["Justify"]
-    ))
-
-    # ===== РЕКВИЗИТЫ =====
-    story.append(Spacer(1, 20))
-    story.append(Paragraph("Реквизиты сторон", styles["TitleCenter"]))
-
-    story.append(Paragraph(
-        f"<b>Фрахтовщик:</b><br/>"
-        f"{EXECUTOR['name']}<br/>"
-        f"ИНН: {EXECUTOR['inn']}<br/>",
-        # + ( "Подписано простой электронной подписью" if signed else "" ),
-        styles["Justify"]
-    ))
-
-    story.append(Paragraph(
-        f"<b>Фрахтователь:</b><br/>"
-        f"ФИО: {order['name']}<br/>"
-        f"Телефон: {order['phone']}<br/>",
-       # + ( "Подписано простой электронной подписью" if signed else "" ),
-        styles["Justify"]
-    ))
-
-    if signed:
-        story.append(Spacer(1, 15))
-        story.append(Paragraph(
-            f"Подписано простой электронной подписью {datetime.now().strftime('%d.%m.%Y %H:%M')}",
-            styles["Justify"]
-        ))
-
-    doc.build(story)
-    return filename
-
-
-
-
-    # ===== ОТМЕТКА О ПОДПИСИ =====
-    if signed:
-        y = base_y - 90
-        c.setFont("DejaVu-Bold", 10)
-        c.drawCentredString(
-            PAGE_WIDTH / 2,
-            y,
-            f"Подписано ПЭП {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-        )
-
-    c.save()
-    return filename
-
-# ======================
 # Небольшой helper для получения экскурсии по id
 # ======================
-def get_excursion_by_id(excursion_id: str):
-    return next((ex for ex in EXCURSIONS if ex["id"] == excursion_id), None)
-
 # ======================
 # Helper для отправки уведомлений водителю при бронировании экскурсии
 # ======================
 async def notify_drivers(order: dict):
-    excursion = get_excursion_by_id(order["excursion_id"])
-    start_time = excursion["start_time"] if excursion else "уточняется"
+    excursion = catalog.get(order["excursion_id"])
+    start_time = excursion.start_time if excursion else "уточняется"
 
     route = json.loads(order["route"])
     route_text = " → ".join([p["address"] for p in route])
@@ -421,65 +278,12 @@ async def notify_drivers(order: dict):
         f"💰 <b>Сумма:</b> {order['price']} ₽"
     )
 
-    for driver in DRIVERS:
-        try:
-            await bot.send_message(
-                driver["telegram_id"],
-                text,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logging.error(
-                f"Не удалось отправить уведомление водителю "
-                f"{driver['name']} ({driver['telegram_id']}): {e}"
-            )
-# ======================
-# Helper для сохранения заказов в эксель
-# ======================
-
-def save_order_to_excel(order: dict):
-    file_exists = os.path.exists(EXCEL_FILE)
-
-    if file_exists:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb.active
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.append([
-            "Дата бронирования",
-            "ID бронирования",
-            "Экскурсия",
-            "Дата экскурсии",
-            "Время",
-            "ФИО",
-            "Телефон",
-            "Кол-во чел",
-            "Сумма",
-            "Предоплата",
-            "Место подачи",
-            "Маршрут",
-            "Статус"
-        ])
-
-    ws.append([
-        datetime.now().strftime("%d.%m.%Y %H:%M"),
-        order["booking_id"],
-        order["excursion"],
-        order["date"],
-        order.get("start_time", ""),
-        order["name"],
-        order["phone"],
-        order["count"],
-        order["price"],
-        order.get("prepayment", 0),  # ← пока всегда 0
-        order["pickup_address"],
-        " → ".join([p["address"] for p in json.loads(order["route"])]),
-        order["order_status"] # ← "Создан" или "Подписан"
-    ])
-
-    wb.save(EXCEL_FILE)
-
+    # отправка — в фоне через очередь, клиент её не ждёт
+    await notifier.notify(
+        [driver["telegram_id"] for driver in DRIVERS],
+        text,
+        parse_mode="HTML"
+    )
 # ======================
 # ХЕНДЛЕРЫ
 # ======================
@@ -499,52 +303,55 @@ async def go_back(message: Message, state: FSMContext):
 
 @dp.message(lambda m: m.text == "🚗 Выбрать экскурсию")
 async def choose_excursion(message: Message, state: FSMContext):
-    await message.answer("Выберите экскурсию:", reply_markup=excursion_kb())
+    await message.answer("Выберите экскурсию:", reply_markup=catalog.keyboard)
     await state.set_state(BookingStates.choose_excursion)
 
 @dp.message(BookingStates.choose_excursion)
 async def show_excursion(message: Message, state: FSMContext):
-    selected = next((ex for ex in EXCURSIONS if ex["title"] == message.text), None)
+    selected = catalog.by_title(message.text)
     if not selected:
         await message.answer("Выберите экскурсию из списка.")
         return
 
     await state.update_data(
-        excursion_id=selected["id"],
-        excursion=selected["title"],
-        start_time=selected["start_time"],  # 🔥 ВАЖНО
-        price_per_person=selected["price"],
-        prepayment_percent=selected["prepayment_percent"],
-        pickup_address=(
-            f"{selected['pickup']['title']}, "
-            f"{selected['pickup']['address']} "
-            f"({selected['pickup']['gis']})"
-        ),
-        route=json.dumps(selected["route"], ensure_ascii=False)
+        excursion_id=selected.id,
+        excursion=selected.title,
+        start_time=selected.start_time,  # 🔥 ВАЖНО
+        price_per_person=selected.price,
+        prepayment_percent=selected.prepayment_percent,
+        pickup_address=selected.pickup_text,
+        route=selected.route_json()
     )
 
-    images = selected["images"][:10]
-    media = []
-    for img in images[:-1]:
-        media.append(InputMediaPhoto(media=FSInputFile(img)))
-
-    media.append(
-        InputMediaPhoto(
-            #media=FSInputFile(selected["images"][-1]),
-            media=FSInputFile(images[-1]),  # ✅ ТОЛЬКО images
-            caption=(
-                f"<b>{selected['title']}</b>\n\n"
-                f"{selected['description']}"
-            ),
-            parse_mode="HTML"
-        )
+    images = list(selected.images[:10])
+    await media_cache.answer_album(
+        message,
+        images,  # ✅ ТОЛЬКО images
+        caption=(
+            f"<b>{selected.title}</b>\n\n"
+            f"{selected.description}"
+        ),
+        parse_mode="HTML"
     )
 
-    await message.answer_media_group(media)
     await message.answer("Готовы забронировать?", reply_markup=book_kb())
-    #await message.answer(selected["description"], reply_markup=book_kb())
+    #await message.answer(selected.description, reply_markup=book_kb())
+
+def calendar_text(year: int, month: int, first: bool = False) -> str:
+    return (
+        "📅 <b>Выберите дату экскурсии</b>\n\n"
+        + (f"Бронирование доступно на {MAX_DAYS_AHEAD} дней вперёд\n\n" if first else "")
+        + f"Текущий месяц: <b>{month_title(year, month)}</b>\n\n"
+        "🟢 4–5 мест\n"
+        "🟡 2–3 места\n"
+        "🔴 1 место\n"
+        "🚫 нет мест\n"
+        "❌ заблокировано для брони\n"
+        "⚪️ недоступно"
+    )
 
-@dp.callback_query(lambda c: c.data == "start_booking")
+
+@callback_router.route("start_booking")
 async def start_booking(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     now = date.today()
@@ -552,39 +359,15 @@ async def start_booking(callback: CallbackQuery, state: FSMContext):
     # 🔥 excursion_id обязательно берём из state
     excursion_id = data.get("excursion_id")
 
-    # 🔥 Получаем доступные даты для выбранной экскурсии
-    dates = get_available_dates_range(
-        excursion_id=excursion_id,
-        start_date=now,
-        days_ahead=MAX_DAYS_AHEAD
-    )
-
     await state.update_data(
         cal_year=now.year,
         cal_month=now.month
     )
 
-    text = (
-        "📅 <b>Выберите дату экскурсии</b>\n\n"
-        "Бронирование доступно на 14 дней вперёд\n\n"
-        f"Текущий месяц: <b>{month_title(now.year, now.month)}</b>\n\n"
-        "🟢 4–5 мест\n"
-        "🟡 2–3 места\n"
-        "🔴 1 место\n"
-        "🚫 нет мест\n"
-        "⚪️ недоступно"
-    )
-
     await callback.message.answer(
-        text,
+        calendar_text(now.year, now.month, first=True),
         parse_mode="HTML",
-        reply_markup=build_calendar(
-            year=now.year,
-            month=now.month,
-            dates=dates,
-            blocked_dates=get_blocked_dates(excursion_id=excursion_id),  # 🔥
-            mode="user"
-        )
+        reply_markup=await calendar_service.keyboard(excursion_id, now.year, now.month)
     )
 
     await state.set_state(BookingStates.date)
@@ -597,9 +380,9 @@ async def start_booking(callback: CallbackQuery, state: FSMContext):
 # 🔥 ВЫБОР ДАТЫ (ИЗМЕНЕНО)
 # ======================
 
-@dp.callback_query(lambda c: c.data.startswith("date:"))
-async def select_date(callback: CallbackQuery, state: FSMContext):
-    selected_date = callback.data.split(":")[1]
+@callback_router.route(PickDate)
+async def select_date(callback: CallbackQuery, callback_data: PickDate, state: FSMContext):
+    selected_date = callback_data.date
     today = date.today()
     max_date = today + timedelta(days=MAX_DAYS_AHEAD)
 
@@ -622,91 +405,19 @@ async def select_date(callback: CallbackQuery, state: FSMContext):
 # 🔥 ПЕРЕКЛЮЧЕНИЕ МЕСЯЦЕВ ДЛЯ ПОЛЬЗОВАТЕЛЕЙ
 # ======================
 
-@dp.callback_query(lambda c: c.data.startswith("cal_prev") and not c.data.startswith("cal_prev_admin"))
-async def calendar_prev(callback: CallbackQuery, state: FSMContext):
-    _, year, month = callback.data.split(":")
-    year, month = int(year), int(month)
-
-    month -= 1
-    if month == 0:
-        month = 12
-        year -= 1
+@callback_router.route(CalendarPrev)
+@callback_router.route(CalendarNext)
+async def calendar_page(callback: CallbackQuery, callback_data: CalendarPrev | CalendarNext, state: FSMContext):
+    delta = -1 if isinstance(callback_data, CalendarPrev) else 1
+    year, month = shift_month(callback_data.year, callback_data.month, delta)
 
     data = await state.get_data()
     excursion_id = data.get("excursion_id")
 
-    today = date.today()
-    dates = get_available_dates_range(
-        excursion_id=excursion_id,
-        start_date=today,
-        days_ahead=MAX_DAYS_AHEAD
-    )
-
-    text = (
-        "📅 <b>Выберите дату экскурсии</b>\n\n"
-        f"Текущий месяц: <b>{month_title(year, month)}</b>\n\n"
-        "🟢 4–5 мест\n"
-        "🟡 2–3 места\n"
-        "🔴 1 место\n"
-        "🚫 нет мест\n"
-        "⚪️ недоступно"
-    )
-
-    await callback.message.edit_text(
-        text,
-        parse_mode="HTML",
-        reply_markup=build_calendar(
-            year=year,
-            month=month,
-            dates=dates,
-            blocked_dates=get_blocked_dates(excursion_id=excursion_id),
-            mode="user"
-        )
-    )
-    await callback.answer()
-
-
-@dp.callback_query(lambda c: c.data.startswith("cal_next") and not c.data.startswith("cal_next_admin"))
-async def calendar_next(callback: CallbackQuery, state: FSMContext):
-    _, year, month = callback.data.split(":")
-    year, month = int(year), int(month)
-
-    month += 1
-    if month == 13:
-        month = 1
-        year += 1
-
-    data = await state.get_data()
-    excursion_id = data.get("excursion_id")
-
-    today = date.today()
-    dates = get_available_dates_range(
-        excursion_id=excursion_id,
-        start_date=today,
-        days_ahead=MAX_DAYS_AHEAD
-    )
-
-    text = (
-        "📅 <b>Выберите дату экскурсии</b>\n\n"
-        f"Текущий месяц: <b>{month_title(year, month)}</b>\n\n"
-        "🟢 4–5 мест\n"
-        "🟡 2–3 места\n"
-        "🔴 1 место\n"
-        "🚫 нет мест\n"
-        "❌ заблокировано для брони\n"
-        "⚪️ недоступно"
-    )
-
     await callback.message.edit_text(
-        text,
+        calendar_text(year, month),
         parse_mode="HTML",
-        reply_markup=build_calendar(
-            year=year,
-            month=month,
-            dates=dates,
-            blocked_dates=get_blocked_dates(excursion_id=excursion_id),
-            mode="user"
-        )
+        reply_markup=await calendar_service.keyboard(excursion_id, year, month)
     )
     await callback.answer()
 
@@ -731,26 +442,46 @@ async def book_phone(message: Message, state: FSMContext):
 
 @dp.message(BookingStates.count)
 async def book_count(message: Message, state: FSMContext):
-    count = int(message.text)
+    text = (message.text or "").strip()
+    # isdigit() пропускает надстрочные цифры («²»), а int() на них падает
+    if not (text.isascii() and text.isdigit()) or not 0 < int(text) <= MAX_BOOKING_COUNT:
+        await message.answer(
+            f"Введите количество человек числом от 1 до {MAX_BOOKING_COUNT}, например: 2"
+        )
+        return
+
+    count = int(text)
     data = await state.get_data()
 
     booking_id = str(uuid.uuid4())
-    total_price = data["price_per_person"] * count
-    prepayment_amount = int(total_price * data["prepayment_percent"] / 100)
-
-    success = book_places(
+    # цену берём из каталога: админ мог изменить её, пока клиент оформлял заказ
+    excursion = catalog.get(data["excursion_id"])
+    price_per_person = excursion.price if excursion else data["price_per_person"]
+    prepayment_percent = excursion.prepayment_percent if excursion else data["prepayment_percent"]
+    total_price = price_per_person * count
+    prepayment_amount = int(total_price * prepayment_percent / 100)
+
+    result = await book_places(
         data["excursion_id"],
         data["date"],
         count
     )
 
-    if not success:
+    if result.status is BookingStatus.NOT_INITIALIZED:
         await message.answer(
-            "❌ Недостаточно свободных мест на выбранную дату.\n"
+            "❌ Бронирование на выбранную дату пока недоступно.\n"
             "Пожалуйста, выберите другую дату."
         )
         return
 
+    if result.status is BookingStatus.SOLD_OUT:
+        await message.answer(
+            "❌ Недостаточно свободных мест на выбранную дату.\n"
+            f"Свободно мест: {result.free_places}.\n"
+            "Пожалуйста, укажите меньшее количество или выберите другую дату."
+        )
+        return
+
     order_data = {
         "booking_id": booking_id,
         "tg_id": message.from_user.id,
@@ -768,8 +499,8 @@ async def book_count(message: Message, state: FSMContext):
         "prepayment": 0  # 🔹 поле для предоплаты
     }
 
-    save_order(order_data) # Сохранение в БД
-    save_order_to_excel(order_data)  # 🔥 Сохранение в Excel
+    await save_order(order_data) # Сохранение в БД
+    order_exporter.enqueue(order_data)  # 🔥 Журнал заказов для Excel
 
     await message.answer(
         text=(
@@ -779,27 +510,49 @@ async def book_count(message: Message, state: FSMContext):
             f"✅ Кол-во человек: {count}\n"
             f"💵 Итоговая сумма к оплате: {total_price} ₽"
         ),
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💰 Оплата на месте", callback_data="pay_on_place")]
-        ])
+        reply_markup=payment_kb(booking_id, total_price)
     )
 
     await state.set_state(BookingStates.payment)
 
-@dp.callback_query(lambda c: c.data == "paid")
-async def paid(callback: CallbackQuery):
-    booking = get_last_booking_by_user(callback.from_user.id)
-    mark_paid(booking["booking_id"], booking["prepayment"])
+async def callback_booking(callback: CallbackQuery, callback_data: CallbackData | None) -> dict | None:
+    """
+    Заказ, к которому относится кнопка.
+    Старые кнопки (без booking_id, отправленные до обновления бота)
+    по-прежнему работают с последним заказом пользователя.
+    """
+    if callback_data is None:
+        booking = await get_last_booking_by_user(callback.from_user.id)
+    else:
+        booking = await get_order_by_id(callback_data.booking_id)
+        # callback_data присылает клиент — чужой заказ не отдаём
+        if booking is not None and booking["tg_id"] != callback.from_user.id:
+            booking = None
+
+    if booking is None:
+        await callback.answer("Заказ не найден", show_alert=True)
+    return booking
+
+@callback_router.route(Paid)
+@callback_router.route("paid")  # старые кнопки без booking_id
+async def paid(callback: CallbackQuery, callback_data: Paid | None = None):
+    booking = await callback_booking(callback, callback_data)
+    if booking is None:
+        return
+    await mark_paid(booking["booking_id"], booking["prepayment"])
     await callback.message.answer(
         "Оплата получена ✅\nТеперь вы можете ознакомиться с договором.",
-        reply_markup=view_contract_kb
+        reply_markup=view_contract_kb(booking["booking_id"])
     )
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "pay_on_place")
-async def pay_on_place(callback: CallbackQuery):
-    booking = get_last_booking_by_user(callback.from_user.id)
-    mark_paid(booking["booking_id"], 0)
+@callback_router.route(PayOnPlace)
+@callback_router.route("pay_on_place")  # старые кнопки без booking_id
+async def pay_on_place(callback: CallbackQuery, callback_data: PayOnPlace | None = None):
+    booking = await callback_booking(callback, callback_data)
+    if booking is None:
+        return
+    await mark_paid(booking["booking_id"], 0)
 
 
 
@@ -807,31 +560,41 @@ async def pay_on_place(callback: CallbackQuery):
         "Вы выбрали оплату на месте ✅\n"
         #"Водитель уведомлён.\n\n"
         "Теперь вы можете ознакомиться с договором.",
-        reply_markup=view_contract_kb
+        reply_markup=view_contract_kb(booking["booking_id"])
     )
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "view_contract")
-async def view_contract_handler(callback: CallbackQuery):
-    booking = get_last_booking_by_user(callback.from_user.id)
-    pdf = generate_contract_pdf(booking, signed=False)
-    await callback.message.answer_document(FSInputFile(pdf))
-    await callback.message.answer("После ознакомления вы можете подписать договор:", reply_markup=sign_contract_kb)
+@callback_router.route(ViewContract)
+@callback_router.route("view_contract")  # старые кнопки без booking_id
+async def view_contract_handler(callback: CallbackQuery, callback_data: ViewContract | None = None):
+    booking = await callback_booking(callback, callback_data)
+    if booking is None:
+        return
+    pdf = await contract_renderer.render(booking, signed=False)
+    await callback.message.answer_document(
+        BufferedInputFile(pdf, filename=f"contract_{booking['booking_id']}.pdf")
+    )
+    await callback.message.answer("После ознакомления вы можете подписать договор:", reply_markup=sign_contract_kb(booking["booking_id"]))
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "sign_contract")
-async def sign_contract_handler(callback: CallbackQuery):
-    booking = get_last_booking_by_user(callback.from_user.id)
-    sign_contract(booking["booking_id"])
+@callback_router.route(SignContract)
+@callback_router.route("sign_contract")  # старые кнопки без booking_id
+async def sign_contract_handler(callback: CallbackQuery, callback_data: SignContract | None = None):
+    booking = await callback_booking(callback, callback_data)
+    if booking is None:
+        return
+    await sign_contract(booking["booking_id"])
     booking["order_status"] = "Подписан"
     booking["prepayment"] = 0
 
-    save_order_to_excel(booking)
-    pdf = generate_contract_pdf(booking, signed=True)
-    await callback.message.answer_document(FSInputFile(pdf))
+    order_exporter.enqueue(booking)
+    pdf = await contract_renderer.render(booking, signed=True)
+    await callback.message.answer_document(
+        BufferedInputFile(pdf, filename=f"contract_{booking['booking_id']}.pdf")
+    )
 
-    excursion = get_excursion_by_id(booking["excursion_id"])
-    start_time = excursion["start_time"] if excursion else "уточняется"
+    excursion = catalog.get(booking["excursion_id"])
+    start_time = excursion.start_time if excursion else "уточняется"
 
     await notify_drivers(booking)  # 🔥 Отправка уведомления водителю
     await callback.message.answer(
@@ -849,7 +612,7 @@ async def sign_contract_handler(callback: CallbackQuery):
 
     await callback.answer()
 
-@dp.callback_query(lambda c: c.data == "ignore")
+@callback_router.route("ignore")
 async def ignore_callback(callback: CallbackQuery):
     await callback.answer()
 
@@ -859,23 +622,23 @@ async def faq(message: Message):
 
 @dp.message(lambda m: m.text == "ℹ️ О нас")
 async def about(message: Message):
-    photo = FSInputFile("images/avatar.jpg")
-
-    await message.answer_photo(
-        photo=photo,
+    await media_cache.answer_photo(
+        message,
+        AVATAR_PHOTO,
         caption=ABOUT_TEXT,
         parse_mode="HTML"
     )
 
 @dp.message(lambda m: m.text == "⭐ Отзывы")
 async def reviews(message: Message):
-    for review in REVIEWS:
-        photo = FSInputFile(review["photo"])
-        await message.answer_photo(
-            photo=photo,
-            caption=review["text"],
-            parse_mode="HTML"
-        )
+    await review_gallery.send(message)
+
+@callback_router.route(ReviewsPage)
+async def reviews_page(callback: CallbackQuery, callback_data: ReviewsPage):
+    # старые кнопки листания убираем, новые придут под следующим альбомом
+    await callback.message.delete()
+    await review_gallery.send(callback.message, callback_data.number)
+    await callback.answer()
 
 @dp.message(lambda m: m.text == "📞 Связаться")
 async def contact(message: Message):
@@ -886,11 +649,46 @@ async def contact(message: Message):
 # ======================
 
 async def main():
-    init_db()
-    now = datetime.now()
-    for ex in EXCURSIONS:
-        init_calendar_for_month(ex["id"], now.year, now.month)
-    await dp.start_polling(bot)
+    await init_db()
+    await catalog.reload(force=True)
+    await calendar_horizon.refresh()
+
+    await media_cache.load()
+    warm_up = None
+    if MEDIA_WARMUP_CHAT_ID:
+        warm_up = asyncio.create_task(media_cache.warm_up(bot, MEDIA_WARMUP_CHAT_ID))
+
+    await asyncio.to_thread(import_legacy_excel)
+    order_exporter.start()
+    contract_renderer.start()
+    calendar_horizon.start()
+    catalog.start()
+    notifier.start(bot)
+    metrics.start_log_dump(METRICS_LOG_INTERVAL)
+    try:
+        if RUN_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if warm_up is not None:
+            # прогрев не должен слать сообщения после закрытия сессии бота
+            warm_up.cancel()
+            try:
+                await warm_up
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logging.error(f"Прогрев картинок завершился ошибкой: {e}")
+        await catalog.stop()
+        await calendar_horizon.stop()
+        await notifier.stop()
+        await metrics.stop()
+        await contract_renderer.stop()
+        await order_exporter.stop()
+        # 📊 orders.xlsx собирается из журнала один раз, а не на каждый заказ
+        await asyncio.to_thread(build_xlsx)
+        close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+
+from catalog import catalog
+from config import CALENDAR_HORIZON_DAYS, CALENDAR_KEEP_DAYS
+from db import init_calendar_range, archive_calendar_before, archive_blocked_before
+
+
+class CalendarHorizon:
+    """
+    Скользящее окно календаря.
+    Держит в excursion_calendar строки на horizon_days вперёд для всех
+    экскурсий и раз в сутки, после полуночи, досоздаёт новый день
+    и переносит прошедшие дни и блокировки в архив.
+    Повторный запуск безопасен: существующие строки не трогаются.
+    """
+
+    def __init__(self, horizon_days: int = CALENDAR_HORIZON_DAYS, keep_days: int = CALENDAR_KEEP_DAYS):
+        self.horizon_days = horizon_days
+        self.keep_days = keep_days
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self, today: date | None = None):
+        today = today or date.today()
+
+        result = await init_calendar_range(
+            catalog.ids(),
+            today,
+            today + timedelta(days=self.horizon_days)
+        )
+        keep_from = today - timedelta(days=self.keep_days)
+        archived = await archive_calendar_before(keep_from)
+        archived_blocks = await archive_blocked_before(keep_from)
+
+        logging.info(
+            f"📅 Календарь до {today + timedelta(days=self.horizon_days)}: "
+            f"добавлено {result.inserted} дней, в архив {archived} дней "
+            f"и {archived_blocks} блокировок"
+        )
+        return result, archived
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    @staticmethod
+    def _seconds_to_midnight() -> float:
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+        # небольшой запас, чтобы date.today() уже вернул новый день
+        return (midnight - now).total_seconds() + 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._seconds_to_midnight())
+            try:
+                await self.refresh()
+            except Exception as e:
+                # следующая попытка — через сутки, окно с запасом
+                logging.error(f"Не удалось обновить календарь: {e}")
+
+
+calendar_horizon = CalendarHorizon()
+# у новой экскурсии календарь должен появиться сразу, а не в полночь
+catalog.on_change(lambda _catalog: calendar_horizon.refresh())
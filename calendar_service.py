@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+from aiogram.types import InlineKeyboardMarkup
+
+from availability import availability, AvailabilityCache
+from calendar_utils import build_calendar_cached, month_bounds
+from config import BOOKING_DAYS_AHEAD
+from metrics import metrics
+
+# версия для месяцев вне окна бронирования: их клавиатура
+# не зависит от доступности, все дни в ней недоступны
+OUTSIDE_WINDOW = -1
+
+
+class CalendarService:
+    """
+    Клавиатура календаря на месяц — общая для клиента и админки.
+    Берёт из кэша доступности только срез показываемого месяца.
+    Месяц, целиком лежащий в прошлом или дальше окна бронирования,
+    строится без обращения к доступности и к БД.
+    """
+
+    def __init__(self, cache: AvailabilityCache = availability, days_ahead: int = BOOKING_DAYS_AHEAD):
+        self.cache = cache
+        self.days_ahead = days_ahead
+        self.skipped = 0  # месяцев, построенных без запроса доступности
+
+    def window(self, year: int, month: int, dates_from: date | None = None) -> tuple[date, date] | None:
+        """Даты месяца, которые можно выбрать, или None, если таких нет"""
+        today = date.today()
+        first_day, last_day = month_bounds(year, month)
+
+        start = max(first_day, dates_from or today, today)
+        end = min(last_day, today + timedelta(days=self.days_ahead))
+        return (start, end) if start <= end else None
+
+    def stats(self) -> dict:
+        return {"skipped": self.skipped}
+
+    async def keyboard(
+        self,
+        excursion_id: str,
+        year: int,
+        month: int,
+        mode: str = "user",
+        dates_from: date | None = None
+    ) -> InlineKeyboardMarkup:
+        """
+        mode: "user" или "admin"
+        dates_from: свободными показываются только даты не раньше неё
+        (конец диапазона в админке)
+        """
+        if self.window(year, month, dates_from) is None:
+            self.skipped += 1
+            return build_calendar_cached(
+                excursion_id, OUTSIDE_WINDOW, year, month,
+                dates={}, blocked_dates=set(), mode=mode, dates_from=dates_from
+            )
+
+        free, blocked, version = await self.cache.month_view(excursion_id, year, month)
+        if dates_from:
+            start = dates_from.isoformat()
+            free = {d: places for d, places in free.items() if d >= start}
+
+        return build_calendar_cached(
+            excursion_id, version, year, month,
+            dates=free, blocked_dates=blocked, mode=mode, dates_from=dates_from
+        )
+
+
+calendar_service = CalendarService()
+metrics.register_stats("calendar_outside_window", calendar_service.stats)
@@ -1,6 +1,14 @@
+from collections import OrderedDict
 from datetime import date, timedelta
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from config import BOOKING_DAYS_AHEAD
+from metrics import metrics
+from callbacks import PickDate, CalendarPrev, CalendarNext, AdminDate, AdminCalendarPrev, AdminCalendarNext
+
+# сколько готовых клавиатур календаря держим в памяти
+CALENDAR_CACHE_SIZE = 256
+
 MONTHS_RU = [
     "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
     "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
@@ -12,6 +20,18 @@ def month_title(year: int, month: int) -> str:
     return f"{MONTHS_RU[month - 1]} {year}"
 
 
+def shift_month(year: int, month: int, delta: int) -> tuple[int, int]:
+    """Соседний месяц: delta=-1 — предыдущий, delta=1 — следующий"""
+    index = year * 12 + month - 1 + delta
+    return index // 12, index % 12 + 1
+
+
+def month_bounds(year: int, month: int) -> tuple[date, date]:
+    """Первый и последний день месяца"""
+    next_year, next_month = shift_month(year, month, 1)
+    return date(year, month, 1), date(next_year, next_month, 1) - timedelta(days=1)
+
+
 def build_calendar(
         year: int,
         month: int,
@@ -29,26 +49,22 @@ def build_calendar(
     dates_dict = dates
 
     # Определяем границы месяца
-    first_day = date(year, month, 1)
-    if month == 12:
-        last_day = date(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        last_day = date(year, month + 1, 1) - timedelta(days=1)
+    first_day, last_day = month_bounds(year, month)
 
     # Текущая дата и лимиты бронирования
     today = date.today()
-    max_booking_date = today + timedelta(days=14)
+    max_booking_date = today + timedelta(days=BOOKING_DAYS_AHEAD)
 
     # Начинаем строить клавиатуру
     keyboard = []
 
     # ========== РЯД 1: ЗАГОЛОВОК С ПЕРЕКЛЮЧЕНИЕМ ==========
     if mode == "admin":
-        prev_cb = f"admin_cal_prev:{year}:{month}"
-        next_cb = f"admin_cal_next:{year}:{month}"
+        prev_cb = AdminCalendarPrev(year=year, month=month).pack()
+        next_cb = AdminCalendarNext(year=year, month=month).pack()
     else:
-        prev_cb = f"cal_prev:{year}:{month}"
-        next_cb = f"cal_next:{year}:{month}"
+        prev_cb = CalendarPrev(year=year, month=month).pack()
+        next_cb = CalendarNext(year=year, month=month).pack()
     header_row = [
         InlineKeyboardButton(text="◀️", callback_data=prev_cb),
         InlineKeyboardButton(text = month_title(year, month), callback_data="ignore"),
@@ -101,13 +117,13 @@ def build_calendar(
                 callback = "ignore"
             elif free_places == 1:
                 text = f"{day_num}🔴"
-                callback = f"date:{date_str}"
+                callback = PickDate(date=date_str).pack()
             elif free_places <= 3:
                 text = f"{day_num}🟡"
-                callback = f"date:{date_str}"
+                callback = PickDate(date=date_str).pack()
             else:
                 text = f"{day_num}🟢"
-                callback = f"date:{date_str}"
+                callback = PickDate(date=date_str).pack()
 
 
         # ========== РЕЖИМ АДМИНА ==========
@@ -119,24 +135,24 @@ def build_calendar(
 
             elif is_blocked:
                 text = f"{day_num}❌"
-                callback = f"admin_date:{date_str}"
+                callback = AdminDate(date=date_str).pack()
 
             elif free_places <= 0:
                 # ❗ теперь админ видит, что день "полный"
                 text = f"{day_num}🚫"
-                callback = f"admin_date:{date_str}"
+                callback = AdminDate(date=date_str).pack()
 
             elif free_places == 1:
                 text = f"{day_num}🔴"
-                callback = f"admin_date:{date_str}"
+                callback = AdminDate(date=date_str).pack()
 
             elif free_places <= 3:
                 text = f"{day_num}🟡"
-                callback = f"admin_date:{date_str}"
+                callback = AdminDate(date=date_str).pack()
 
             else:
                 text = f"{day_num}🟢"
-                callback = f"admin_date:{date_str}"
+                callback = AdminDate(date=date_str).pack()
 
         current_row.append(InlineKeyboardButton(text=text, callback_data=callback))
 
@@ -160,4 +176,66 @@ def build_calendar(
             InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back_to_excursions")
         ])
 
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
\ No newline at end of file
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+# ========== КЭШ ГОТОВЫХ КЛАВИАТУР ==========
+_calendar_cache: OrderedDict = OrderedDict()
+_calendar_cache_day = None
+calendar_cache_stats = {"hits": 0, "misses": 0}
+
+
+def build_calendar_cached(
+        excursion_id: str,
+        version: int,
+        year: int,
+        month: int,
+        dates: dict,
+        blocked_dates: set,
+        mode: str = "user",
+        dates_from: date | None = None
+) -> InlineKeyboardMarkup:
+    """
+    То же, что build_calendar, но готовая клавиатура запоминается.
+    Клавиатура зависит только от (экскурсия, год, месяц, режим,
+    версия доступности, начало окна дат, сегодняшний день), поэтому
+    при изменении доступности меняется version и берётся новая запись,
+    а со сменой дня кэш очищается целиком.
+    """
+    global _calendar_cache_day
+
+    today = date.today()
+    if today != _calendar_cache_day:
+        _calendar_cache.clear()
+        _calendar_cache_day = today
+
+    key = (excursion_id, year, month, mode, version, dates_from or today, today)
+    markup = _calendar_cache.get(key)
+    if markup is not None:
+        _calendar_cache.move_to_end(key)
+        calendar_cache_stats["hits"] += 1
+        return markup
+
+    calendar_cache_stats["misses"] += 1
+    markup = build_calendar(year, month, dates, blocked_dates, mode=mode)
+    _calendar_cache[key] = markup
+    if len(_calendar_cache) > CALENDAR_CACHE_SIZE:
+        _calendar_cache.popitem(last=False)  # самая давно использованная
+    return markup
+
+
+def invalidate_calendar_cache(excursion_id: str | None = None, **_changes):
+    """Выбрасывает клавиатуры экскурсии (или все) — вызывается при изменении доступности"""
+    if excursion_id is None:
+        _calendar_cache.clear()
+        return
+
+    for key in [k for k in _calendar_cache if k[0] == excursion_id]:
+        del _calendar_cache[key]
+
+
+def calendar_cache_info() -> dict:
+    return {**calendar_cache_stats, "size": len(_calendar_cache)}
+
+
+metrics.register_stats("calendar_keyboards", calendar_cache_info)
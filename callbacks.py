@@ -0,0 +1,191 @@
+from dataclasses import dataclass
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+
+# ===== Кнопки шагов оформления заказа =====
+# В callback_data зашит booking_id: кнопка относится к своему заказу,
+# даже если у пользователя оформляется несколько заказов сразу.
+# Например: "sign_contract:2f1c...". uuid4 (36 символов) вместе
+# с префиксом укладывается в лимит Telegram 64 байта.
+
+class Paid(CallbackData, prefix="paid"):
+    booking_id: str
+
+
+class PayOnPlace(CallbackData, prefix="pay_on_place"):
+    booking_id: str
+
+
+class ViewContract(CallbackData, prefix="view_contract"):
+    booking_id: str
+
+
+class SignContract(CallbackData, prefix="sign_contract"):
+    booking_id: str
+
+
+# ===== Календарь и отзывы =====
+# Префиксы и порядок полей совпадают со старыми строками
+# ("date:2026-01-20", "cal_prev:2026:1") — кнопки в уже
+# отправленных сообщениях продолжают работать.
+
+class PickDate(CallbackData, prefix="date"):
+    date: str  # ISO, 2026-01-20
+
+
+class CalendarPrev(CallbackData, prefix="cal_prev"):
+    year: int
+    month: int
+
+
+class CalendarNext(CallbackData, prefix="cal_next"):
+    year: int
+    month: int
+
+
+class ReviewsPage(CallbackData, prefix="reviews"):
+    number: int
+
+
+# ===== Админ-панель =====
+
+class AdminMode(CallbackData, prefix="admin_mode"):
+    mode: str  # single / range / unblock
+
+
+class AdminExcursion(CallbackData, prefix="admin_exc"):
+    excursion_id: str
+
+
+class AdminCalendarPrev(CallbackData, prefix="admin_cal_prev"):
+    year: int
+    month: int
+
+
+class AdminCalendarNext(CallbackData, prefix="admin_cal_next"):
+    year: int
+    month: int
+
+
+class AdminDate(CallbackData, prefix="admin_date"):
+    date: str
+
+
+class AdminCatalogExcursion(CallbackData, prefix="admin_cat_exc"):
+    excursion_id: str
+
+
+class AdminCatalogToggle(CallbackData, prefix="admin_cat_toggle"):
+    excursion_id: str
+
+
+class AdminCatalogEdit(CallbackData, prefix="admin_cat_edit"):
+    excursion_id: str
+    field: str
+
+
+# =========================
+# 🔀 МАРШРУТИЗАЦИЯ
+# =========================
+
+@dataclass(slots=True)
+class _Route:
+    data_class: type[CallbackData] | None  # None — кнопка без данных ("ignore")
+    state: str | None
+    handler: HandlerObject
+
+
+class CallbackRouter:
+    """
+    Таблица callback-кнопок: префикс callback_data → обработчики.
+    В aiogram регистрируется один обработчик, и на каждое нажатие
+    выполняется один поиск в dict вместо перебора фильтров всех
+    обработчиков по очереди. callback_data разбирается в типизированный
+    объект и передаётся обработчику как callback_data, остальные
+    аргументы (state, bot...) — как обычно в aiogram.
+
+        @callback_router.route(AdminDate, state=AdminBlockFSM.picking_start)
+        async def handler(callback: CallbackQuery, callback_data: AdminDate): ...
+
+        @callback_router.route("ignore")
+        async def handler(callback: CallbackQuery): ...
+    """
+
+    def __init__(self):
+        self._routes: dict[str, list[_Route]] = {}
+
+    def route(self, key: type[CallbackData] | str, state: State | str | None = None):
+        if isinstance(key, str):
+            prefix, data_class = key, None
+        else:
+            prefix, data_class = key.__prefix__, key
+        if isinstance(state, State):
+            state = state.state
+
+        def decorator(handler):
+            routes = self._routes.setdefault(prefix, [])
+            routes.append(_Route(data_class, state, HandlerObject(callback=handler)))
+            # сначала маршруты с условием на состояние, потом общие
+            routes.sort(key=lambda r: r.state is None)
+            return handler
+
+        return decorator
+
+    def __len__(self) -> int:
+        return sum(len(routes) for routes in self._routes.values())
+
+    async def resolve(self, data: str, state: FSMContext | None = None) -> tuple[_Route, CallbackData | None] | None:
+        routes = self._routes.get(data.partition(":")[0])
+        if not routes:
+            return None
+
+        current_state = None
+        for route in routes:
+            if route.state is not None:
+                # состояние читаем, только если маршрут от него зависит
+                if current_state is None:
+                    current_state = (await state.get_state() if state else None) or ""
+                if current_state != route.state:
+                    continue
+
+            if route.data_class is None:
+                # кнопка без данных совпадает только целиком
+                if ":" not in data:
+                    return route, None
+                continue
+
+            try:
+                return route, route.data_class.unpack(data)
+            except (TypeError, ValueError):
+                # другое число полей или неверный тип — не эта кнопка
+                continue
+        return None
+
+    async def _filter(self, callback: CallbackQuery, state: FSMContext | None = None) -> dict | bool:
+        if not callback.data:
+            return False
+
+        found = await self.resolve(callback.data, state)
+        if found is None:
+            return False
+
+        route, callback_data = found
+        # подменяем handler на обработчик маршрута: по нему
+        # HandlerTimingMiddleware подписывает метрики
+        return {"handler": route.handler, "callback_data": callback_data}
+
+    @staticmethod
+    async def _dispatch(callback: CallbackQuery, handler: HandlerObject, **kwargs):
+        return await handler.call(callback, **kwargs)
+
+    def setup(self, dp: Dispatcher):
+        dp.callback_query.register(self._dispatch, self._filter)
+
+
+callback_router = CallbackRouter()
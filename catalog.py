@@ -0,0 +1,217 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+
+from config import EXCURSIONS, EXCURSIONS_FILE, CATALOG_RELOAD_INTERVAL
+from db import load_catalog, get_catalog_version, save_excursions
+
+
+@dataclass(frozen=True, slots=True)
+class Pickup:
+    title: str
+    address: str
+    gis: str
+
+
+@dataclass(frozen=True, slots=True)
+class RoutePoint:
+    name: str
+    address: str
+
+
+@dataclass(frozen=True, slots=True)
+class Excursion:
+    id: str
+    title: str
+    description: str
+    images: tuple[str, ...]
+    start_time: str
+    price: int
+    prepayment_percent: int
+    pickup: Pickup
+    route: tuple[RoutePoint, ...]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Excursion":
+        return cls(
+            id=data["id"],
+            title=data["title"],
+            description=data["description"],
+            images=tuple(data["images"]),
+            start_time=data["start_time"],
+            price=int(data["price"]),
+            prepayment_percent=int(data["prepayment_percent"]),
+            pickup=Pickup(**data["pickup"]),
+            route=tuple(RoutePoint(**point) for point in data["route"])
+        )
+
+    @property
+    def pickup_text(self) -> str:
+        return f"{self.pickup.title}, {self.pickup.address} ({self.pickup.gis})"
+
+    def route_json(self) -> str:
+        """Маршрут в том виде, в каком он хранится в заказе"""
+        return json.dumps(
+            [{"name": p.name, "address": p.address} for p in self.route],
+            ensure_ascii=False
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class _State:
+    version: int
+    excursions: tuple[Excursion, ...]
+    by_id: dict[str, Excursion]
+    by_title: dict[str, Excursion]
+    keyboard: ReplyKeyboardMarkup
+
+
+class ExcursionCatalog:
+    """
+    Каталог экскурсий в памяти: поиск по id и по названию кнопки за O(1),
+    клавиатура выбора собрана заранее.
+    Источник — таблицы excursions / excursion_images / excursion_route.
+    Каталог перечитывается, когда растёт catalog_version: сразу после
+    правки в этом процессе и раз в reload_interval — после правок в других.
+    EXCURSIONS_FILE (JSON в формате config.EXCURSIONS), если задан,
+    при каждом изменении загружается в БД.
+    До первой загрузки из БД каталог построен по config.EXCURSIONS.
+    Состояние подменяется целиком, читатели никогда не видят его наполовину.
+    """
+
+    def __init__(self, path: str = EXCURSIONS_FILE, reload_interval: float = CATALOG_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime: int | None = None
+        self._listeners = []
+        self._task: asyncio.Task | None = None
+        self._state = self._build(-1, EXCURSIONS)
+
+    @staticmethod
+    def _build(version: int, items: list[dict]) -> _State:
+        excursions = tuple(Excursion.from_dict(item) for item in items)
+
+        buttons = [[KeyboardButton(text=ex.title)] for ex in excursions]
+        buttons.append([KeyboardButton(text="⬅️ Назад")])
+
+        return _State(
+            version=version,
+            excursions=excursions,
+            by_id={ex.id: ex for ex in excursions},
+            by_title={ex.title: ex for ex in excursions},
+            keyboard=ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+        )
+
+    def _read_file(self) -> list[dict]:
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    # ===== чтение =====
+    def __iter__(self):
+        return iter(self._state.excursions)
+
+    def __len__(self) -> int:
+        return len(self._state.excursions)
+
+    def get(self, excursion_id: str) -> Excursion | None:
+        return self._state.by_id.get(excursion_id)
+
+    def by_title(self, title: str | None) -> Excursion | None:
+        return self._state.by_title.get(title)
+
+    def ids(self) -> list[str]:
+        return list(self._state.by_id)
+
+    @property
+    def keyboard(self) -> ReplyKeyboardMarkup:
+        return self._state.keyboard
+
+    @property
+    def version(self) -> int:
+        return self._state.version
+
+    # ===== обновление =====
+    def on_change(self, listener):
+        """listener(catalog) — обычная функция или корутина"""
+        self._listeners.append(listener)
+        return listener
+
+    async def import_file(self) -> bool:
+        """Загружает EXCURSIONS_FILE в БД, если файл изменился"""
+        if not self.path:
+            return False
+
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return False
+            items = await asyncio.to_thread(self._read_file)
+            # проверяем формат до записи в БД
+            for item in items:
+                Excursion.from_dict(item)
+            await save_excursions(items)
+        except Exception as e:
+            # битый файл не должен ронять бота — остаётся прежний каталог
+            logging.error(f"Не удалось загрузить каталог из {self.path}: {e}")
+            return False
+
+        logging.info(f"📥 Каталог из {self.path} загружен в БД")
+        return True
+
+    async def reload(self, force: bool = False) -> bool:
+        """Перечитывает каталог из БД, если он изменился"""
+        await self.import_file()
+
+        try:
+            if not force and await get_catalog_version() == self._state.version:
+                return False
+            first_load = self._state.version < 0
+            version, items = await load_catalog()
+            state = self._build(version, items)
+        except Exception as e:
+            logging.error(f"Не удалось перечитать каталог экскурсий: {e}")
+            return False
+
+        self._state = state
+        logging.info(f"🔄 Каталог экскурсий v{version}: {len(state.excursions)} экскурсий")
+
+        # первая загрузка при старте — не изменение
+        if first_load:
+            return True
+
+        for listener in self._listeners:
+            try:
+                result = listener(self)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logging.error(f"Ошибка обработчика обновления каталога: {e}")
+        return True
+
+    def start(self):
+        if self.reload_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+
+catalog = ExcursionCatalog()
@@ -5,6 +5,79 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Файл базы (пусто — orders.db рядом с кодом бота)
+DB_PATH = os.getenv("DB_PATH", "")
+
+# Размер пула соединений с БД (и потоков для запросов)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# Профиль настроек SQLite: "fast" (WAL, synchronous=NORMAL, mmap),
+# "safe" (WAL, synchronous=FULL) или "default" (как в SQLite по умолчанию)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "fast")
+
+# Через сколько секунд кэш доступности дат перечитывается из БД
+# (подхватывает изменения других процессов бота)
+AVAILABILITY_TTL = float(os.getenv("AVAILABILITY_TTL", "60"))
+
+# На сколько дней вперёд открыто бронирование (календарь дальше
+# показывает даты недоступными и не запрашивает их из БД)
+BOOKING_DAYS_AHEAD = int(os.getenv("BOOKING_DAYS_AHEAD", "14"))
+
+# Больше скольких человек в одном заказе не принимаем. Свободные места
+# на дату проверяет бронирование; это — предел для явно ошибочного ввода
+MAX_BOOKING_COUNT = int(os.getenv("MAX_BOOKING_COUNT", "20"))
+
+# Рендеринг договоров: число процессов и размер очереди заданий
+CONTRACT_WORKERS = int(os.getenv("CONTRACT_WORKERS", "2"))
+CONTRACT_QUEUE_SIZE = int(os.getenv("CONTRACT_QUEUE_SIZE", "32"))
+
+# Уведомления водителям: сколько отправок одновременно, не больше
+# скольких сообщений в секунду (лимит Telegram — около 30) и сколько
+# попыток до того, как уведомление считается неотправляемым
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "4"))
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", "25"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+
+# Чат, в который при старте прогреваются картинки (получаем file_id).
+# Пусто — прогрев только командой /warmup из админки
+MEDIA_WARMUP_CHAT_ID = int(os.getenv("MEDIA_WARMUP_CHAT_ID", "0")) or None
+
+# FSM: как часто сбрасывать состояния в БД и через сколько часов
+# брошенный диалог бронирования удаляется
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+FSM_SESSION_TTL_HOURS = float(os.getenv("FSM_SESSION_TTL_HOURS", "24"))
+
+# Календарь: на сколько дней вперёд держать строки excursion_calendar
+# (не меньше окна бронирования) и сколько дней прошлого оставлять
+# в рабочей таблице перед переносом в архив
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "60"))
+CALENDAR_KEEP_DAYS = int(os.getenv("CALENDAR_KEEP_DAYS", "7"))
+
+# Метрики времени (обработчики, БД, Bot API, договоры, Excel)
+# и счётчики кэшей (доступность, клавиатуры календаря, FSM).
+# В режиме webhook отдаются на /metrics; METRICS_LOG_INTERVAL > 0 —
+# ещё и сводка в лог раз в столько секунд
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "0"))
+
+# Режим получения апдейтов: "polling" или "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+
+# Webhook: публичный адрес (пусто — вебхук в Telegram не регистрируется),
+# путь, секрет для заголовка X-Telegram-Bot-Api-Secret-Token и адрес сервера
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Экскурсии хранятся в БД (при первом запуске туда переносится EXCURSIONS).
+# Раз в CATALOG_RELOAD_INTERVAL секунд каталог проверяет, не изменился ли он.
+# EXCURSIONS_FILE — JSON в формате EXCURSIONS; если задан, при каждом
+# изменении файла экскурсии из него записываются в БД
+EXCURSIONS_FILE = os.getenv("EXCURSIONS_FILE", "")
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "30"))
+
 #Информация по экскурсиям
 EXCURSIONS = [
     {
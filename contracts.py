@@ -0,0 +1,259 @@
+import asyncio
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+
+from config import CONTRACT_WORKERS, CONTRACT_QUEUE_SIZE
+from metrics import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EXECUTOR = {
+    "name": "ИП Шин Сергей Тимофеевич",
+    "inn": "621200217989",
+    "city": "Москва",
+    "car": "GAC M8",
+    "car_type": "M1",
+    "plate": "В412УМ62"
+}
+
+PICKUP_ADDRESSES = {
+    "opalikha": "Московская обл., Красногорск, станция Опалиха",
+    "tsum": "г. Москва, ул. Петровка, 2"
+}
+
+# ======================
+# ШАБЛОН (один раз на процесс)
+# ======================
+
+_styles = None
+
+
+def _init_template():
+    """Регистрирует шрифты и собирает стили — один раз в каждом процессе-рендерере"""
+    global _styles
+    if _styles is not None:
+        return
+
+    pdfmetrics.registerFont(TTFont("DejaVu", os.path.join(BASE_DIR, "DejaVuSans.ttf")))
+    pdfmetrics.registerFont(TTFont("DejaVu-Bold", os.path.join(BASE_DIR, "DejaVuSans-Bold.ttf")))
+
+    styles = getSampleStyleSheet()
+
+    styles.add(ParagraphStyle(
+        name="TitleCenter",
+        fontName="DejaVu-Bold",
+        fontSize=13,
+        alignment=TA_CENTER,
+        spaceAfter=12
+    ))
+
+    styles.add(ParagraphStyle(
+        name="Justify",
+        fontName="DejaVu",
+        fontSize=11,
+        alignment=TA_JUSTIFY,
+        leading=15,
+        spaceAfter=10
+    ))
+
+    styles.add(ParagraphStyle(
+        name="Section",
+        fontName="DejaVu-Bold",
+        fontSize=11,
+        spaceBefore=15,
+        spaceAfter=8
+    ))
+
+    _styles = styles
+
+
+def render_contract_pdf(order: dict, signed_at: str | None = None) -> bytes:
+    """
+    Рендерит договор в память и возвращает байты PDF.
+    signed_at — отметка о подписи, None для неподписанного договора.
+    """
+    _init_template()
+    styles = _styles
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=40,
+        leftMargin=40,
+        topMargin=40,
+        bottomMargin=40
+    )
+
+    story = []
+
+    # ===== ЗАГОЛОВОК =====
+    story.append(Paragraph(
+        f"Договор фрахтования № {order['booking_id']}",
+        styles["TitleCenter"]
+    ))
+
+    story.append(Paragraph(
+        "транспортного средства для перевозки пассажиров по заказу",
+        styles["TitleCenter"]
+    ))
+
+    # ===== ВВОДНЫЙ ТЕКСТ =====
+    story.append(Paragraph(
+        f"{EXECUTOR['name']}, ИНН {EXECUTOR['inn']}, именуемый в дальнейшем "
+        f"Фрахтовщик, и {order['name']}, именуемый в дальнейшем Фрахтователь, "
+        f"заключили настоящий договор о нижеследующем:",
+        styles["Justify"]
+    ))
+
+    # ===== МАРШРУТ (ТОЛЬКО АДРЕСА) =====
+    route_points = json.loads(order["route"])
+    route_addresses = [
+                          order["pickup_address"]
+                      ] + [p["address"] for p in route_points]
+    full_route = " — ".join(route_addresses)
+
+    story.append(Paragraph(
+        f"1.1. Фрахтовщик обязуется за плату в размере {order['price']} рублей "
+        f"предоставить Фрахтователю всю вместимость транспортного средства для перевозки пассажиров и багажа.",
+        styles["Justify"]
+    ))
+
+    story.append(Paragraph(
+        f"<b>1.2. Место подачи:</b> {order['pickup_address']} (со стороны ЖК Опалиха О3)",
+        styles["Justify"]
+    ))
+
+    story.append(Paragraph(
+        f"<b>1.3. Маршрут перевозки:</b> {full_route}.",
+        styles["Justify"]
+    ))
+
+    story.append(Paragraph(
+        f"<b>1.4. Срок выполнения перевозки:</b> {order['date']}.",
+        styles["Justify"]
+    ))
+
+    # ===== ТРАНСПОРТ =====
+    story.append(Paragraph("1.5. Транспортное средство:", styles["Section"]))
+
+    story.append(Paragraph(
+        f"Марка и модель: {EXECUTOR['car']}<br/>"
+        f"Тип ТС: {EXECUTOR['car_type']}<br/>"
+        f"Государственный номер: {EXECUTOR['plate']}",
+        styles["Justify"]
+    ))
+
+    # ===== РЕКВИЗИТЫ =====
+    story.append(Spacer(1, 20))
+    story.append(Paragraph("Реквизиты сторон", styles["TitleCenter"]))
+
+    story.append(Paragraph(
+        f"<b>Фрахтовщик:</b><br/>"
+        f"{EXECUTOR['name']}<br/>"
+        f"ИНН: {EXECUTOR['inn']}<br/>",
+        # + ( "Подписано простой электронной подписью" if signed else "" ),
+        styles["Justify"]
+    ))
+
+    story.append(Paragraph(
+        f"<b>Фрахтователь:</b><br/>"
+        f"ФИО: {order['name']}<br/>"
+        f"Телефон: {order['phone']}<br/>",
+       # + ( "Подписано простой электронной подписью" if signed else "" ),
+        styles["Justify"]
+    ))
+
+    if signed_at:
+        story.append(Spacer(1, 15))
+        story.append(Paragraph(
+            f"Подписано простой электронной подписью {signed_at}",
+            styles["Justify"]
+        ))
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# ======================
+# СЕРВИС РЕНДЕРИНГА
+# ======================
+
+class ContractRenderer:
+    """
+    Рендерит договоры в пуле процессов, не блокируя event loop.
+    Очередь заданий ограничена: когда она заполнена, render() ждёт
+    свободного места (backpressure), а не копит задания без предела.
+    """
+
+    def __init__(self, workers: int = CONTRACT_WORKERS, queue_size: int = CONTRACT_QUEUE_SIZE):
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pool: ProcessPoolExecutor | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_template
+        )
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        if self._pool is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pool.shutdown(wait=True)
+        self._pool = None
+
+    async def render(self, order: dict, signed: bool = False) -> bytes:
+        self.start()
+
+        # в договоре место подачи всегда указывается адресом станции
+        order["pickup_address"] = PICKUP_ADDRESSES["opalikha"]
+        signed_at = datetime.now().strftime("%d.%m.%Y %H:%M") if signed else None
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((dict(order), signed_at, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            order, signed_at, future = await self._queue.get()
+            try:
+                with metrics.timer("contract_render_seconds", "signed" if signed_at else "draft"):
+                    pdf = await loop.run_in_executor(
+                        self._pool, render_contract_pdf, order, signed_at
+                    )
+                if not future.done():
+                    future.set_result(pdf)
+            except Exception as e:
+                logging.error(f"Не удалось сформировать договор {order.get('booking_id')}: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+contract_renderer = ContractRenderer()
@@ -1,15 +1,219 @@
+import asyncio
+import functools
+import queue
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, date, timedelta
 import os
 import calendar
+import logging
+from enum import Enum
+from pathlib import Path
+from typing import NamedTuple
+
+from config import DB_PATH, DB_POOL_SIZE, SQLITE_PROFILE, EXCURSIONS
+from metrics import metrics
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_NAME = os.path.join(BASE_DIR, "orders.db")
+DB_NAME = DB_PATH or os.path.join(BASE_DIR, "orders.db")
 print("DB PATH:", os.path.abspath(DB_NAME))
 
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+# =========================
+# ⚙️ НАСТРОЙКИ SQLITE
+# =========================
+# Профили PRAGMA, применяются к каждому новому соединению пула.
+# journal_mode хранится в самом файле БД, остальное — на соединение.
+# busy_timeout есть в каждом профиле и ставится первым: смена
+# journal_mode ждёт, пока другое соединение отпустит блокировку.
+PRAGMA_PROFILES: dict[str, dict[str, object]] = {
+    # настройки SQLite по умолчанию (как было раньше)
+    "default": {
+        "busy_timeout": 5000,
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+    # WAL: чтения не блокируют запись и наоборот;
+    # каждая транзакция по-прежнему сразу сбрасывается на диск
+    "safe": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+    },
+    # WAL + synchronous=NORMAL: при сбое питания можно потерять
+    # последние транзакции, но база не повреждается
+    "fast": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32768,        # 32 МБ на соединение
+        "mmap_size": 268435456,      # 256 МБ
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: dict[str, object]):
+    # busy_timeout — раньше всех, даже если профиль перечисляет его ниже
+    for name, value in sorted(pragmas.items(), key=lambda item: item[0] != "busy_timeout"):
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+# =========================
+# 🔌 ПУЛ СОЕДИНЕНИЙ
+# =========================
+
+class ConnectionPool:
+    """
+    Ограниченный пул sqlite-соединений.
+    Соединения создаются лениво (не больше size) и переиспользуются —
+    вместе с ними переиспользуется и кэш подготовленных запросов sqlite3.
+    """
+
+    def __init__(self, path: str, size: int, pragmas: dict[str, object] | None = None):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas or {}
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        try:
+            apply_pragmas(conn, self.pragmas)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            # ждём, пока соединение вернут в пул
+            return self._idle.get()
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def run(self, func, *args, **kwargs):
+        conn = self.acquire()
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+if SQLITE_PROFILE not in PRAGMA_PROFILES:
+    raise ValueError(
+        f"Неизвестный SQLITE_PROFILE={SQLITE_PROFILE!r}, "
+        f"доступны: {', '.join(PRAGMA_PROFILES)}"
+    )
+
+_pool = ConnectionPool(DB_NAME, DB_POOL_SIZE, PRAGMA_PROFILES[SQLITE_PROFILE])
+# потоков столько же, сколько соединений — поток никогда не ждёт пул
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+def pooled(func):
+    """
+    Превращает синхронную func(conn, ...) в корутину func(...):
+    запрос выполняется в потоке БД на соединении из пула,
+    event loop при этом не блокируется.
+    """
+    target = func
+    if metrics.enabled:
+        # время запроса на соединении, без ожидания свободного потока
+        @functools.wraps(func)
+        def target(conn, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(conn, *args, **kwargs)
+            finally:
+                metrics.observe("db_query_seconds", func.__name__, time.perf_counter() - start)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _executor,
+            functools.partial(_pool.run, target, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+def close_db():
+    """Закрывает соединения пула при остановке бота"""
+    _executor.shutdown(wait=True)
+    _pool.close()
+
+
+# =========================
+# 🔔 ИЗМЕНЕНИЯ ДОСТУПНОСТИ
+# =========================
+
+_availability_listeners = []
+
+
+def on_availability_change(listener):
+    """
+    Подписка на изменения мест и блокировок.
+    listener(excursion_id, *, free={date: мест}, blocked=[...],
+             unblocked=[...], reload=False) вызывается в event loop
+    после успешной записи в БД.
+    """
+    _availability_listeners.append(listener)
+    return listener
+
+
+def notify_availability_change(excursion_id: str, **changes):
+    for listener in _availability_listeners:
+        try:
+            listener(excursion_id, **changes)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика изменения доступности: {e}")
+
+
+@pooled
+def init_db(conn):
     cur = conn.cursor()
 
     # ===== Заказы =====
@@ -53,43 +257,331 @@ def init_db():
     )
     """)
 
-    # ===== Заблокированные даты =====
+    # ===== Архив прошедших дней календаря =====
     cur.execute("""
-    CREATE TABLE IF NOT EXISTS blocked_dates (
+    CREATE TABLE IF NOT EXISTS excursion_calendar_archive (
         excursion_id TEXT,
         date TEXT,
-        reason TEXT,
-        blocked_by INTEGER,
-        blocked_at TEXT,
+        total_places INTEGER,
+        booked_places INTEGER,
+        archived_at TEXT,
         PRIMARY KEY (excursion_id, date)
     )
     """)
 
+    # ===== Кэш file_id загруженных в Telegram файлов =====
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS media_cache (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER,
+        size INTEGER,
+        file_id TEXT NOT NULL
+    )
+    """)
+
+    # ===== Состояния FSM (диалоги бронирования и админки) =====
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at REAL
+    )
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at
+    ON fsm_storage (updated_at)
+    """)
+
     conn.commit()
-    conn.close()
 
+    _migrate(conn)
 
-# ===== Инициализация календаря на месяц =====
-def init_calendar_for_month(excursion_id: str, year: int, month: int):
-    conn = sqlite3.connect(DB_NAME)
+
+# =========================
+# 🔧 МИГРАЦИИ СХЕМЫ
+# =========================
+# Изменения схемы для уже существующих баз.
+# Шаги применяются строго по порядку, каждый — в своей транзакции;
+# номер последнего применённого шага хранится в schema_version.
+# Новый шаг — только в конец списка, старые не редактируются.
+# Шаг — SQL-строка или функция f(cursor) для переноса данных.
+MIGRATIONS: list[tuple[int, str, list]] = [
+    (1, "индекс заказов по пользователю", [
+        # rowid входит в любой индекс, поэтому
+        # WHERE tg_id = ? ORDER BY rowid DESC читается с конца индекса
+        "CREATE INDEX IF NOT EXISTS idx_orders_tg_id ON orders (tg_id)",
+    ]),
+    (2, "индекс заказов по экскурсии и дате", [
+        "CREATE INDEX IF NOT EXISTS idx_orders_excursion_date ON orders (excursion_id, date)",
+    ]),
+    (3, "индекс заказов по статусу", [
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (order_status)",
+    ]),
+    (4, "очередь исходящих уведомлений", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at TEXT,
+            last_error TEXT
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+        ON notification_outbox (status, next_attempt_at)
+        """,
+    ]),
+    (5, "экскурсии, фото и маршруты в БД", [
+        "ALTER TABLE excursions ADD COLUMN description TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE excursions ADD COLUMN start_time TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE excursions ADD COLUMN price INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE excursions ADD COLUMN prepayment_percent INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE excursions ADD COLUMN pickup_title TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE excursions ADD COLUMN pickup_address TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE excursions ADD COLUMN pickup_gis TEXT NOT NULL DEFAULT ''",
+        "ALTER TABLE excursions ADD COLUMN position INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE excursions ADD COLUMN active INTEGER NOT NULL DEFAULT 1",
+        """
+        CREATE TABLE IF NOT EXISTS excursion_images (
+            excursion_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (excursion_id, position)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS excursion_route (
+            excursion_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            address TEXT NOT NULL,
+            PRIMARY KEY (excursion_id, position)
+        )
+        """,
+        # номер версии каталога: растёт при каждом изменении экскурсий,
+        # по нему процессы бота понимают, что каталог пора перечитать
+        """
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+        # первоначальное наполнение — из config.EXCURSIONS
+        lambda cur: _upsert_excursions(cur, EXCURSIONS),
+    ]),
+    (6, "агрегаты статистики заказов", [
+        """
+        CREATE TABLE IF NOT EXISTS order_stats_daily (
+            excursion_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            seats INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            prepaid INTEGER NOT NULL DEFAULT 0,
+            signed_orders INTEGER NOT NULL DEFAULT 0,
+            signed_seats INTEGER NOT NULL DEFAULT 0,
+            signed_revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (excursion_id, date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS order_stats_excursion (
+            excursion_id TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            seats INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            prepaid INTEGER NOT NULL DEFAULT 0,
+            signed_orders INTEGER NOT NULL DEFAULT 0,
+            signed_seats INTEGER NOT NULL DEFAULT 0,
+            signed_revenue INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # триггеры и пересчёт — в одной транзакции,
+        # поэтому ни один заказ не посчитается дважды
+        lambda cur: _create_order_stats_triggers(cur),
+        lambda cur: _rebuild_order_stats(cur),
+    ]),
+    (7, "блокировки дат интервалами", [
+        # end_date включительно; интервалы одной экскурсии не пересекаются
+        """
+        CREATE TABLE IF NOT EXISTS blocked_ranges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            excursion_id TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            reason TEXT,
+            blocked_by INTEGER,
+            blocked_at TEXT,
+            CHECK (start_date <= end_date)
+        )
+        """,
+        # пересечение с окном: end_date >= начала окна идёт по индексу,
+        # start_date <= конца окна проверяется по нему же, без чтения строк
+        """
+        CREATE INDEX IF NOT EXISTS idx_blocked_ranges_end
+        ON blocked_ranges (excursion_id, end_date, start_date)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS blocked_ranges_archive (
+            id INTEGER PRIMARY KEY,
+            excursion_id TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            reason TEXT,
+            blocked_by INTEGER,
+            blocked_at TEXT,
+            archived_at TEXT
+        )
+        """,
+        lambda cur: _migrate_blocked_dates(cur),
+    ]),
+]
+
+
+def _schema_version(cur) -> int:
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    return cur.fetchone()[0] or 0
+
+
+def _migrate(conn):
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    )
+    """)
+    conn.commit()
+
+    for version, description, statements in MIGRATIONS:
+        if version <= _schema_version(cur):
+            continue
+
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            # другой процесс мог применить шаг, пока ждали блокировку
+            if version <= _schema_version(cur):
+                conn.rollback()
+                continue
+
+            for step in statements:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            cur.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat(timespec="seconds"))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        logging.info(f"🔧 Миграция {version}: {description}")
+
+
+# ===== Массовые вставки по диапазону дат =====
+class BulkResult(NamedTuple):
+    inserted: int  # новых строк
+    existing: int  # строк, которые уже были
+
+
+# ряд дат от start до end включительно, строится прямо в SQLite
+_DATE_SERIES = """
+    WITH RECURSIVE days(d) AS (
+        SELECT :start
+        UNION ALL
+        SELECT date(d, '+1 day') FROM days WHERE d < :end
+    )
+"""
+
+
+@pooled
+def _init_calendar_range(conn, excursion_ids: list[str], start: date, end: date) -> BulkResult:
     cur = conn.cursor()
 
+    before = conn.total_changes
+    cur.executemany("""
+    INSERT OR IGNORE INTO excursion_calendar (excursion_id, date)
+    """ + _DATE_SERIES + """
+    SELECT :excursion_id, d FROM days
+    """, [
+        {"excursion_id": ex_id, "start": start.isoformat(), "end": end.isoformat()}
+        for ex_id in excursion_ids
+    ])
+    inserted = conn.total_changes - before
+
+    conn.commit()
+
+    total = ((end - start).days + 1) * len(excursion_ids)
+    return BulkResult(inserted, total - inserted)
+
+
+async def init_calendar_range(excursion_ids: list[str], start: date, end: date) -> BulkResult:
+    """Заводит строки календаря на все дни диапазона одной транзакцией"""
+    if end < start or not excursion_ids:
+        return BulkResult(0, 0)
+
+    result = await _init_calendar_range(excursion_ids, start, end)
+    if result.inserted:
+        for ex_id in excursion_ids:
+            notify_availability_change(ex_id, reload=True)
+    return result
+
+
+# ===== Инициализация календаря на месяц =====
+async def init_calendar_for_month(excursion_id: str, year: int, month: int) -> BulkResult:
     _, days_in_month = calendar.monthrange(year, month)
+    return await init_calendar_range(
+        [excursion_id],
+        date(year, month, 1),
+        date(year, month, days_in_month)
+    )
+
+
+# ===== Архивирование прошедших дней =====
+@pooled
+def archive_calendar_before(conn, before: date) -> int:
+    """
+    Переносит дни календаря раньше before в архив.
+    Рабочая таблица остаётся маленькой, статистика по прошлым
+    поездкам сохраняется в excursion_calendar_archive.
+    """
+    cur = conn.cursor()
+    before_str = before.isoformat()
 
-    for day in range(1, days_in_month + 1):
-        date_str = f"{year}-{month:02d}-{day:02d}"
+    cur.execute("BEGIN IMMEDIATE")
+    try:
         cur.execute("""
-        INSERT OR IGNORE INTO excursion_calendar (excursion_id, date)
-        VALUES (?, ?)
-        """, (excursion_id, date_str))
+        INSERT OR REPLACE INTO excursion_calendar_archive
+        (excursion_id, date, total_places, booked_places, archived_at)
+        SELECT excursion_id, date, total_places, booked_places, ?
+        FROM excursion_calendar
+        WHERE date < ?
+        """, (datetime.now().isoformat(timespec="seconds"), before_str))
 
-    conn.commit()
-    conn.close()
+        cur.execute("DELETE FROM excursion_calendar WHERE date < ?", (before_str,))
+        archived = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return archived
 
 
 # ===== Получить доступные даты =====
-def get_available_dates_dict(excursion_id: str):
-    conn = sqlite3.connect(DB_NAME)
+@pooled
+def get_available_dates_dict(conn, excursion_id: str):
     cur = conn.cursor()
 
     cur.execute("""
@@ -100,45 +592,117 @@ def get_available_dates_dict(excursion_id: str):
     """, (excursion_id,))
 
     rows = cur.fetchall()
-    conn.close()
 
     return {date: free for date, free in rows}
 
 # ===== Забронировать места =====
-def book_places(excursion_id: str, date: str, count: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+class BookingStatus(str, Enum):
+    RESERVED = "reserved"                # места забронированы
+    SOLD_OUT = "sold_out"                # мест не хватает
+    NOT_INITIALIZED = "not_initialized"  # дата не заведена в календаре
+
+
+@dataclass(frozen=True)
+class BookingResult:
+    status: BookingStatus
+    free_places: int = 0  # сколько мест свободно после попытки
+
+    @property
+    def ok(self) -> bool:
+        return self.status is BookingStatus.RESERVED
+
+
+@pooled
+def _reserve_places(conn, excursion_id: str, date: str, count: int) -> BookingResult:
     cur = conn.cursor()
 
-    cur.execute("""
-    SELECT total_places, booked_places
-    FROM excursion_calendar
-    WHERE excursion_id = ? AND date = ?
-    """, (excursion_id, date))
+    # проверка и списание мест — одна условная запись в IMMEDIATE-транзакции,
+    # поэтому два процесса не могут одновременно пройти проверку
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+        UPDATE excursion_calendar
+        SET booked_places = booked_places + ?
+        WHERE excursion_id = ? AND date = ?
+          AND booked_places + ? <= total_places
+        """, (count, excursion_id, date, count))
+        reserved = cur.rowcount == 1
+
+        cur.execute("""
+        SELECT total_places - booked_places
+        FROM excursion_calendar
+        WHERE excursion_id = ? AND date = ?
+        """, (excursion_id, date))
+        row = cur.fetchone()
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-    row = cur.fetchone()
     if not row:
-        conn.close()
-        return False
+        return BookingResult(BookingStatus.NOT_INITIALIZED)
 
-    total, booked = row
-    if booked + count > total:
-        conn.close()
-        return False
+    free = max(row[0], 0)
+    if not reserved:
+        return BookingResult(BookingStatus.SOLD_OUT, free)
 
-    cur.execute("""
-    UPDATE excursion_calendar
-    SET booked_places = booked_places + ?
-    WHERE excursion_id = ? AND date = ?
-    """, (count, excursion_id, date))
+    return BookingResult(BookingStatus.RESERVED, free)
 
-    conn.commit()
-    conn.close()
-    return True
+
+# замки на (экскурсия, дата) — живут, пока ими кто-то пользуется
+_booking_locks = weakref.WeakValueDictionary()
+
+
+async def book_places(excursion_id: str, date: str, count: int) -> BookingResult:
+    """
+    Атомарно бронирует count мест на дату.
+    Попытки на одну дату внутри процесса выстраиваются в очередь,
+    между процессами гонку исключает условный UPDATE в IMMEDIATE-транзакции.
+    """
+    if count <= 0:
+        raise ValueError(f"count must be positive, got {count}")
+
+    key = (excursion_id, date)
+    lock = _booking_locks.get(key)
+    if lock is None:
+        lock = _booking_locks[key] = asyncio.Lock()
+
+    async with lock:
+        result = await _reserve_places(excursion_id, date, count)
+
+    if result.status is not BookingStatus.NOT_INITIALIZED:
+        notify_availability_change(excursion_id, free={date: result.free_places})
+
+    return result
 
 
 # ===== Заказы =====
-def save_order(data: dict):
-    conn = sqlite3.connect(DB_NAME)
+ORDER_CACHE_SIZE = 1024
+ORDER_CACHE_TTL = 30  # сек; заказ мог изменить другой процесс бота
+
+_ORDER_FIELDS = (
+    "booking_id", "tg_id", "name", "phone",
+    "excursion_id", "excursion",
+    "date", "start_time", "count",
+    "price", "prepayment",
+    "pickup_address", "route",
+    "order_status"
+)
+
+# booking_id -> (заказ, когда положили в кэш)
+_order_cache: OrderedDict = OrderedDict()
+
+
+def _cache_order(order: dict):
+    _order_cache[order["booking_id"]] = ({f: order.get(f) for f in _ORDER_FIELDS}, time.monotonic())
+    _order_cache.move_to_end(order["booking_id"])
+    if len(_order_cache) > ORDER_CACHE_SIZE:
+        _order_cache.popitem(last=False)
+
+
+@pooled
+def _save_order(conn, data: dict):
     cur = conn.cursor()
 
     cur.execute("""
@@ -169,11 +733,15 @@ def save_order(data: dict):
     ))
 
     conn.commit()
-    conn.close()
 
 
-def mark_paid(booking_id: str, amount: int):
-    conn = sqlite3.connect(DB_NAME)
+async def save_order(data: dict):
+    await _save_order(data)
+    _cache_order({**data, "prepayment": data.get("prepayment", 0), "order_status": "Создан"})
+
+
+@pooled
+def _mark_paid(conn, booking_id: str, amount: int):
     cur = conn.cursor()
 
     cur.execute("""
@@ -183,11 +751,15 @@ def mark_paid(booking_id: str, amount: int):
     """, (amount, booking_id))
 
     conn.commit()
-    conn.close()
 
 
-def sign_contract(booking_id: str):
-    conn = sqlite3.connect(DB_NAME)
+async def mark_paid(booking_id: str, amount: int):
+    await _mark_paid(booking_id, amount)
+    _order_cache.pop(booking_id, None)
+
+
+@pooled
+def _sign_contract(conn, booking_id: str):
     cur = conn.cursor()
 
     cur.execute("""
@@ -199,11 +771,45 @@ def sign_contract(booking_id: str):
     """, (datetime.now().isoformat(), booking_id))
 
     conn.commit()
-    conn.close()
 
 
-def get_last_booking_by_user(tg_id: int):
-    conn = sqlite3.connect(DB_NAME)
+async def sign_contract(booking_id: str):
+    await _sign_contract(booking_id)
+    _order_cache.pop(booking_id, None)
+
+
+@pooled
+def _get_order_by_id(conn, booking_id: str) -> dict | None:
+    cur = conn.cursor()
+
+    cur.execute(f"""
+    SELECT {", ".join(_ORDER_FIELDS)}
+    FROM orders
+    WHERE booking_id = ?
+    """, (booking_id,))
+
+    row = cur.fetchone()
+    return dict(zip(_ORDER_FIELDS, row)) if row else None
+
+
+async def get_order_by_id(booking_id: str) -> dict | None:
+    """Заказ по первичному ключу; свежие заказы отдаются из кэша в памяти"""
+    cached = _order_cache.get(booking_id)
+    if cached is not None and time.monotonic() - cached[1] < ORDER_CACHE_TTL:
+        _order_cache.move_to_end(booking_id)
+        return dict(cached[0])  # копия — обработчики меняют заказ на месте
+
+    order = await _get_order_by_id(booking_id)
+    if order is None:
+        _order_cache.pop(booking_id, None)
+        return None
+
+    _cache_order(order)
+    return dict(order)
+
+
+@pooled
+def get_last_booking_by_user(conn, tg_id: int):
     cur = conn.cursor()
 
     cur.execute("""
@@ -219,7 +825,6 @@ def get_last_booking_by_user(tg_id: int):
     """, (tg_id,))
 
     row = cur.fetchone()
-    conn.close()
 
     if not row:
         return None
@@ -239,18 +844,215 @@ def get_last_booking_by_user(tg_id: int):
         "pickup_address": row[11],
         "route": row[12]
     }
+
+
+# ===== Выгрузка заказов =====
+REPORT_ORDER_FIELDS = (
+    "booking_id", "excursion",
+    "date", "start_time",
+    "name", "phone", "count",
+    "price", "prepayment",
+    "pickup_address", "route",
+    "order_status", "signed_at"
+)
+
+
+def open_reader() -> sqlite3.Connection:
+    """
+    Отдельное соединение только для чтения — для долгих выгрузок.
+    Соединения пула остаются бронированиям; в WAL чтение
+    не мешает записи.
+    """
+    uri = f"{Path(DB_NAME).absolute().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def iter_orders(
+    conn,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    excursion_id: str | None = None,
+    status: str | None = None,
+    batch_size: int = 500
+):
+    """
+    Заказы по фильтрам (даты экскурсии включительно), по мере чтения:
+    в памяти не больше batch_size строк. Без ORDER BY — сортировка
+    потребовала бы держать всю выборку.
+    """
+    conditions, params = [], []
+    if excursion_id:
+        conditions.append("excursion_id = ?")
+        params.append(excursion_id)
+    if date_from:
+        conditions.append("date >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        conditions.append("date <= ?")
+        params.append(date_to.isoformat())
+    if status:
+        conditions.append("order_status = ?")
+        params.append(status)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(REPORT_ORDER_FIELDS)} FROM orders {where}", params)
+
+    try:
+        while rows := cur.fetchmany(batch_size):
+            for row in rows:
+                yield dict(zip(REPORT_ORDER_FIELDS, row))
+    finally:
+        cur.close()
+
+
 # =========================
-# 🔥 CALENDAR FUNCTIONS
+# 📊 СТАТИСТИКА ЗАКАЗОВ
 # =========================
+# Агрегаты по заказам ведут триггеры на orders: каждая вставка,
+# изменение или удаление заказа сразу добавляет свою разницу
+# в order_stats_daily (экскурсия + дата) и order_stats_excursion.
+# Экран статистики читает только агрегаты, orders не сканируется.
+ORDER_STATS_COLUMNS = (
+    "orders", "seats", "revenue", "prepaid",
+    "signed_orders", "signed_seats", "signed_revenue"
+)
+
+# вклад одного заказа в каждую колонку; row — NEW или OLD
+_SIGNED = "({row}.order_status IS 'Подписан')"
+_ORDER_STATS_VALUES = (
+    "1",
+    "COALESCE({row}.count, 0)",
+    "COALESCE({row}.price, 0)",
+    "COALESCE({row}.prepayment, 0)",
+    _SIGNED,
+    _SIGNED + " * COALESCE({row}.count, 0)",
+    _SIGNED + " * COALESCE({row}.price, 0)",
+)
+
+_ORDER_STATS_TABLES = {
+    "order_stats_daily": ("excursion_id", "date"),
+    "order_stats_excursion": ("excursion_id",),
+}
+
+
+def _order_stats_delta(row: str, sign: str) -> str:
+    """Добавить (sign='+') или вычесть (sign='-') заказ row из всех агрегатов"""
+    statements = []
+    for table, keys in _ORDER_STATS_TABLES.items():
+        columns = keys + ORDER_STATS_COLUMNS
+        values = [f"{row}.{key}" for key in keys]
+        values += [f"{sign}({value.format(row=row)})" for value in _ORDER_STATS_VALUES]
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in ORDER_STATS_COLUMNS)
+        statements.append(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(values)}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates};"
+        )
+    return "\n".join(statements)
+
+
+def _create_order_stats_triggers(cur):
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_stats_insert
+    AFTER INSERT ON orders
+    BEGIN
+        {_order_stats_delta("NEW", "+")}
+    END
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_stats_update
+    AFTER UPDATE OF excursion_id, date, count, price, prepayment, order_status ON orders
+    BEGIN
+        {_order_stats_delta("OLD", "-")}
+        {_order_stats_delta("NEW", "+")}
+    END
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_order_stats_delete
+    AFTER DELETE ON orders
+    BEGIN
+        {_order_stats_delta("OLD", "-")}
+    END
+    """)
 
-MAX_PLACES_PER_DAY = 5
 
+def _rebuild_order_stats(cur):
+    """Пересчёт агрегатов по всей истории заказов"""
+    columns = ", ".join(ORDER_STATS_COLUMNS)
+    sums = ", ".join(f"SUM({value.format(row='o')})" for value in _ORDER_STATS_VALUES)
 
-def get_free_places_for_date(excursion_id: str, date_str: str) -> int:
+    cur.execute("DELETE FROM order_stats_daily")
+    cur.execute("DELETE FROM order_stats_excursion")
+    cur.execute(f"""
+    INSERT INTO order_stats_daily (excursion_id, date, {columns})
+    SELECT o.excursion_id, o.date, {sums}
+    FROM orders o
+    WHERE o.excursion_id IS NOT NULL AND o.date IS NOT NULL
+    GROUP BY o.excursion_id, o.date
+    """)
+    cur.execute(f"""
+    INSERT INTO order_stats_excursion (excursion_id, {columns})
+    SELECT excursion_id, {", ".join(f"SUM({c})" for c in ORDER_STATS_COLUMNS)}
+    FROM order_stats_daily
+    GROUP BY excursion_id
+    """)
+
+
+@pooled
+def rebuild_order_stats(conn) -> int:
     """
-    Возвращает количество свободных мест на конкретную дату
+    Пересобирает агрегаты с нуля (например, после правки orders
+    вручную с отключёнными триггерами). Возвращает число заказов.
     """
-    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        _rebuild_order_stats(cur)
+        cur.execute("SELECT COALESCE(SUM(orders), 0) FROM order_stats_excursion")
+        total = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logging.info(f"📊 Статистика пересчитана: {total} заказов")
+    return total
+
+
+@pooled
+def get_order_stats(conn, since: date, days: int) -> tuple[list[dict], list[dict]]:
+    """
+    Итоги по экскурсиям и по дням [since, since + days) —
+    строки агрегатов, без обращения к orders
+    """
+    cur = conn.cursor()
+    columns = ", ".join(ORDER_STATS_COLUMNS)
+
+    cur.execute(f"SELECT excursion_id, {columns} FROM order_stats_excursion")
+    by_excursion = [dict(zip(("excursion_id",) + ORDER_STATS_COLUMNS, row)) for row in cur.fetchall()]
+
+    cur.execute(f"""
+    SELECT date, {", ".join(f"SUM({c})" for c in ORDER_STATS_COLUMNS)}
+    FROM order_stats_daily
+    WHERE date >= ? AND date < ?
+    GROUP BY date
+    ORDER BY date
+    """, (since.isoformat(), (since + timedelta(days=days)).isoformat()))
+    by_day = [dict(zip(("date",) + ORDER_STATS_COLUMNS, row)) for row in cur.fetchall()]
+
+    return by_excursion, by_day
+
+
+# =========================
+# 🔥 CALENDAR FUNCTIONS
+# =========================
+
+MAX_PLACES_PER_DAY = 5
+
+
+def _free_places(conn, excursion_id: str, date_str: str) -> int:
     cur = conn.cursor()
 
     cur.execute("""
@@ -260,7 +1062,6 @@ def get_free_places_for_date(excursion_id: str, date_str: str) -> int:
     """, (excursion_id, date_str))
 
     row = cur.fetchone()
-    conn.close()
 
     if not row:
         return 0
@@ -269,11 +1070,19 @@ def get_free_places_for_date(excursion_id: str, date_str: str) -> int:
     return max(total - booked, 0)
 
 
-def get_calendar_load_level(excursion_id: str, date_str: str) -> str:
+@pooled
+def get_free_places_for_date(conn, excursion_id: str, date_str: str) -> int:
+    """
+    Возвращает количество свободных мест на конкретную дату
+    """
+    return _free_places(conn, excursion_id, date_str)
+
+
+async def get_calendar_load_level(excursion_id: str, date_str: str) -> str:
     """
     Используется ТОЛЬКО для UI календаря
     """
-    free = get_free_places_for_date(excursion_id, date_str)
+    free = await get_free_places_for_date(excursion_id, date_str)
 
     if free >= 3:
         return "🟢"
@@ -285,38 +1094,121 @@ def get_calendar_load_level(excursion_id: str, date_str: str) -> str:
         return "❌"
 
 
-def is_date_blocked(excursion_id: str, date_str: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+# ===== Блокировки дат =====
+# Блокировка хранится интервалом [start_date, end_date] в blocked_ranges.
+# Интервалы одной экскурсии не пересекаются, поэтому день заблокирован
+# не больше чем одним интервалом, а окно календаря читает только
+# пересекающие его интервалы — история блокировок на запросы не влияет.
+# Прошедшие интервалы переносятся в blocked_ranges_archive.
+
+_ONE_DAY = timedelta(days=1)
+
+
+def date_range_strs(start: date, end: date) -> list[str]:
+    """Все даты от start до end включительно в ISO-формате"""
+    return [
+        (start + timedelta(days=i)).isoformat()
+        for i in range((end - start).days + 1)
+    ]
+
+
+def _blocked_ranges(conn, excursion_id: str, since: date, until: date) -> list[tuple]:
+    """Интервалы, пересекающие [since, until]: [(id, start, end), ...] по возрастанию"""
     cur = conn.cursor()
 
-    # ручная блокировка для конкретной экскурсии
-    cur.execute(
-        """
-        SELECT 1
+    cur.execute("""
+    SELECT id, start_date, end_date
+    FROM blocked_ranges
+    WHERE excursion_id = ? AND end_date >= ? AND start_date <= ?
+    ORDER BY end_date
+    """, (excursion_id, since.isoformat(), until.isoformat()))
+
+    return [
+        (range_id, date.fromisoformat(start), date.fromisoformat(end))
+        for range_id, start, end in cur.fetchall()
+    ]
+
+
+def _blocked_days(conn, excursion_id: str, since: date, until: date) -> set[str]:
+    """Заблокированные даты только внутри [since, until]"""
+    blocked = set()
+    for _, start, end in _blocked_ranges(conn, excursion_id, since, until):
+        blocked.update(date_range_strs(max(start, since), min(end, until)))
+    return blocked
+
+
+def _insert_blocked_gaps(conn, excursion_id: str, start: date, end: date, admin_id: int, reason: str, blocked_at: str) -> int:
+    """
+    Блокирует дни [start, end], которые ещё не заблокированы:
+    существующие интервалы не трогаются, новые ложатся в промежутки
+    между ними. Возвращает число новых заблокированных дней
+    """
+    gaps = []
+    day = start
+    for _, range_start, range_end in _blocked_ranges(conn, excursion_id, start, end):
+        if range_start > day:
+            gaps.append((day, range_start - _ONE_DAY))
+        day = max(day, range_end + _ONE_DAY)
+    if day <= end:
+        gaps.append((day, end))
+
+    conn.executemany("""
+    INSERT INTO blocked_ranges
+    (excursion_id, start_date, end_date, reason, blocked_by, blocked_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (excursion_id, gap_start.isoformat(), gap_end.isoformat(), reason, admin_id, blocked_at)
+        for gap_start, gap_end in gaps
+    ])
+
+    return sum((gap_end - gap_start).days + 1 for gap_start, gap_end in gaps)
+
+
+def _migrate_blocked_dates(cur):
+    """
+    Переносит строки старой таблицы blocked_dates (одна дата — одна строка)
+    в интервалы: подряд идущие дни с одной причиной и автором — один интервал
+    """
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blocked_dates'")
+    if cur.fetchone() is None:
+        return
+
+    # у дней одного непрерывного отрезка разность
+    # julianday(date) - номер по порядку одинакова
+    cur.execute("""
+    INSERT INTO blocked_ranges
+    (excursion_id, start_date, end_date, reason, blocked_by, blocked_at)
+    SELECT excursion_id, MIN(date), MAX(date), reason, blocked_by, MAX(blocked_at)
+    FROM (
+        SELECT *, julianday(date) - ROW_NUMBER() OVER (
+            PARTITION BY excursion_id, reason, blocked_by ORDER BY date
+        ) AS island
         FROM blocked_dates
-        WHERE excursion_id = ? AND date = ?
-        """,
-        (excursion_id, date_str)
     )
+    GROUP BY excursion_id, reason, blocked_by, island
+    """)
+    cur.execute("DROP TABLE blocked_dates")
 
-    if cur.fetchone():
-        conn.close()
-        return True
-
-    conn.close()
 
-    # либо нет свободных мест
-    return get_free_places_for_date(excursion_id, date_str) <= 0
+@pooled
+def is_date_blocked(conn, excursion_id: str, date_str: str) -> bool:
+    day = date.fromisoformat(date_str)
 
+    # ручная блокировка для конкретной экскурсии
+    if _blocked_ranges(conn, excursion_id, day, day):
+        return True
 
+    # либо нет свободных мест
+    return _free_places(conn, excursion_id, date_str) <= 0
 
 
+@pooled
 def get_available_dates_range(
+    conn,
     excursion_id: str,
     start_date: date,
     days_ahead: int = 14
 ) -> dict:
-    conn = sqlite3.connect(DB_NAME)
     cur = conn.cursor()
 
     end_date = start_date + timedelta(days=days_ahead)
@@ -334,18 +1226,8 @@ def get_available_dates_range(
 
     rows = cur.fetchall()
 
-    # 🔒 блокировки ТОЛЬКО этой экскурсии
-    cur.execute(
-        """
-        SELECT date
-        FROM blocked_dates
-        WHERE excursion_id = ?
-        """,
-        (excursion_id,)
-    )
-    blocked = {row[0] for row in cur.fetchall()}
-
-    conn.close()
+    # 🔒 блокировки ТОЛЬКО этой экскурсии и только в этом окне
+    blocked = _blocked_days(conn, excursion_id, start_date, end_date)
 
     result = {}
     for date_str, total, booked in rows:
@@ -358,89 +1240,501 @@ def get_available_dates_range(
 
     return result
 
-def block_date(excursion_id: str, date_str: str, admin_id: int, reason: str = ""):
-    conn = sqlite3.connect(DB_NAME)
+
+@pooled
+def _block_dates_bulk(
+    conn,
+    excursion_ids: list[str],
+    start: date,
+    end: date,
+    admin_id: int,
+    reason: str = ""
+) -> BulkResult:
     cur = conn.cursor()
 
-    cur.execute("""
-    INSERT OR REPLACE INTO blocked_dates
-    (excursion_id, date, reason, blocked_by, blocked_at)
-    VALUES (?, ?, ?, ?, ?)
-    """, (
-        excursion_id,
-        date_str,
-        reason,
-        admin_id,
-        datetime.now().isoformat()
-    ))
+    blocked_at = datetime.now().isoformat()
+    inserted = 0
 
-    conn.commit()
-    conn.close()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        for ex_id in excursion_ids:
+            inserted += _insert_blocked_gaps(conn, ex_id, start, end, admin_id, reason, blocked_at)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    total = ((end - start).days + 1) * len(excursion_ids)
+    return BulkResult(inserted, total - inserted)
 
 
-def block_date_range(
+async def block_season(
+    excursion_ids: list[str],
+    start: date,
+    end: date,
+    admin_id: int,
+    reason: str = ""
+) -> BulkResult:
+    """
+    Блокирует все дни диапазона сразу для нескольких экскурсий
+    одной транзакцией. Уже заблокированные дни не трогаются.
+    """
+    if end < start or not excursion_ids:
+        return BulkResult(0, 0)
+
+    result = await _block_dates_bulk(excursion_ids, start, end, admin_id, reason)
+    blocked = date_range_strs(start, end)
+    for ex_id in excursion_ids:
+        notify_availability_change(ex_id, blocked=blocked)
+    return result
+
+
+async def block_date_range(
     excursion_id: str,
     start: date,
     end: date,
     admin_id: int,
     reason: str = ""
-):
-    conn = sqlite3.connect(DB_NAME)
+) -> BulkResult:
+    return await block_season([excursion_id], start, end, admin_id, reason)
+
+
+async def block_date(excursion_id: str, date_str: str, admin_id: int, reason: str = "") -> bool:
+    """True — дата заблокирована сейчас, False — уже была заблокирована"""
+    day = date.fromisoformat(date_str)
+    result = await block_season([excursion_id], day, day, admin_id, reason)
+    return result.inserted > 0
+
+
+@pooled
+def _unblock_date(conn, excursion_id: str, date_str: str) -> bool:
+    """Вырезает день из интервала: от интервала остаётся до двух кусков"""
     cur = conn.cursor()
+    day = date.fromisoformat(date_str)
 
-    current = start
-    while current <= end:
+    cur.execute("BEGIN IMMEDIATE")
+    try:
         cur.execute("""
-        INSERT OR REPLACE INTO blocked_dates
-        (excursion_id, date, reason, blocked_by, blocked_at)
-        VALUES (?, ?, ?, ?, ?)
+        SELECT id, start_date, end_date, reason, blocked_by, blocked_at
+        FROM blocked_ranges
+        WHERE excursion_id = ? AND end_date >= ? AND start_date <= ?
+        """, (excursion_id, date_str, date_str))
+        row = cur.fetchone()
+
+        if row is None:
+            conn.rollback()
+            return False
+
+        range_id, start, end, reason, blocked_by, blocked_at = row
+        cur.execute("DELETE FROM blocked_ranges WHERE id = ?", (range_id,))
+
+        pieces = []
+        if start < date_str:
+            pieces.append((start, (day - _ONE_DAY).isoformat()))
+        if date_str < end:
+            pieces.append(((day + _ONE_DAY).isoformat(), end))
+        cur.executemany("""
+        INSERT INTO blocked_ranges
+        (excursion_id, start_date, end_date, reason, blocked_by, blocked_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (excursion_id, piece_start, piece_end, reason, blocked_by, blocked_at)
+            for piece_start, piece_end in pieces
+        ])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return True
+
+
+async def unblock_date(excursion_id: str, date_str: str) -> bool:
+    unblocked = await _unblock_date(excursion_id, date_str)
+    if unblocked:
+        notify_availability_change(excursion_id, unblocked=[date_str])
+    return unblocked
+
+
+@pooled
+def get_blocked_dates(conn, excursion_id: str, since: date, until: date) -> set[str]:
+    """Заблокированные даты экскурсии с since по until включительно"""
+    return _blocked_days(conn, excursion_id, since, until)
+
+
+@pooled
+def archive_blocked_before(conn, before: date) -> int:
+    """
+    Переносит в архив интервалы, закончившиеся раньше before.
+    Интервал, который захватывает before, остаётся целиком
+    """
+    cur = conn.cursor()
+    before_str = before.isoformat()
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+        INSERT OR REPLACE INTO blocked_ranges_archive
+        (id, excursion_id, start_date, end_date, reason, blocked_by, blocked_at, archived_at)
+        SELECT id, excursion_id, start_date, end_date, reason, blocked_by, blocked_at, ?
+        FROM blocked_ranges
+        WHERE end_date < ?
+        """, (datetime.now().isoformat(timespec="seconds"), before_str))
+
+        cur.execute("DELETE FROM blocked_ranges WHERE end_date < ?", (before_str,))
+        archived = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return archived
+
+
+@pooled
+def get_availability_snapshot(conn, excursion_id: str, since: date, until: date) -> tuple[dict, set]:
+    """
+    Свободные места и блокировки экскурсии с since по until
+    включительно — всё, что нужно календарю, за одно обращение к БД
+    """
+    cur = conn.cursor()
+
+    cur.execute("""
+    SELECT date, MAX(total_places - booked_places, 0)
+    FROM excursion_calendar
+    WHERE excursion_id = ? AND date BETWEEN ? AND ?
+    """, (excursion_id, since.isoformat(), until.isoformat()))
+    free = dict(cur.fetchall())
+
+    blocked = _blocked_days(conn, excursion_id, since, until)
+
+    return free, blocked
+
+
+def get_excursions():
+    """Активные экскурсии [(id, title), ...] из кэша каталога"""
+    from catalog import catalog
+    return [(ex.id, ex.title) for ex in catalog]
+
+
+# =========================
+# 🗺 КАТАЛОГ ЭКСКУРСИЙ
+# =========================
+# Экскурсия хранится в excursions, фото — в excursion_images,
+# точки маршрута — в excursion_route. Любое изменение увеличивает
+# catalog_version. Читает всё это catalog.ExcursionCatalog.
+
+# поля, которые можно менять из админки
+EDITABLE_EXCURSION_FIELDS = {"title", "description", "start_time", "price", "prepayment_percent", "active"}
+
+
+def _bump_catalog_version(cur):
+    cur.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+
+
+def _upsert_excursions(cur, items: list[dict]):
+    """Добавляет или перезаписывает экскурсии в формате config.EXCURSIONS"""
+    for position, item in enumerate(items):
+        ex_id = item["id"]
+        pickup = item["pickup"]
+
+        cur.execute("""
+        INSERT INTO excursions (
+            id, title, description, start_time, price, prepayment_percent,
+            pickup_title, pickup_address, pickup_gis, position, active
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (id) DO UPDATE SET
+            title = excluded.title,
+            description = excluded.description,
+            start_time = excluded.start_time,
+            price = excluded.price,
+            prepayment_percent = excluded.prepayment_percent,
+            pickup_title = excluded.pickup_title,
+            pickup_address = excluded.pickup_address,
+            pickup_gis = excluded.pickup_gis,
+            position = excluded.position
         """, (
-            excursion_id,
-            current.isoformat(),
-            reason,
-            admin_id,
-            datetime.now().isoformat()
+            ex_id, item["title"], item["description"], item["start_time"],
+            item["price"], item["prepayment_percent"],
+            pickup["title"], pickup["address"], pickup["gis"], position
         ))
-        current += timedelta(days=1)
+
+        cur.execute("DELETE FROM excursion_images WHERE excursion_id = ?", (ex_id,))
+        cur.executemany(
+            "INSERT INTO excursion_images (excursion_id, position, path) VALUES (?, ?, ?)",
+            [(ex_id, i, path) for i, path in enumerate(item["images"])]
+        )
+
+        cur.execute("DELETE FROM excursion_route WHERE excursion_id = ?", (ex_id,))
+        cur.executemany(
+            "INSERT INTO excursion_route (excursion_id, position, name, address) VALUES (?, ?, ?, ?)",
+            [(ex_id, i, p["name"], p["address"]) for i, p in enumerate(item["route"])]
+        )
+
+    _bump_catalog_version(cur)
+
+
+@pooled
+def save_excursions(conn, items: list[dict]):
+    cur = conn.cursor()
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        _upsert_excursions(cur, items)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+@pooled
+def update_excursion(conn, excursion_id: str, **fields) -> bool:
+    unknown = set(fields) - EDITABLE_EXCURSION_FIELDS
+    if unknown:
+        raise ValueError(f"Эти поля экскурсии менять нельзя: {', '.join(sorted(unknown))}")
+
+    cur = conn.cursor()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            f"UPDATE excursions SET {assignments} WHERE id = ?",
+            (*fields.values(), excursion_id)
+        )
+        updated = cur.rowcount > 0
+        if updated:
+            _bump_catalog_version(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return updated
+
+
+@pooled
+def get_catalog_version(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+@pooled
+def load_catalog(conn, include_inactive: bool = False) -> tuple[int, list[dict]]:
+    """Версия каталога и экскурсии в формате config.EXCURSIONS (+ поле active)"""
+    cur = conn.cursor()
+
+    # версия и данные — из одного снимка БД
+    cur.execute("BEGIN")
+    try:
+        cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+        version = cur.fetchone()[0]
+
+        cur.execute("""
+        SELECT id, title, description, start_time, price, prepayment_percent,
+               pickup_title, pickup_address, pickup_gis, active
+        FROM excursions
+        WHERE active = 1 OR ?
+        ORDER BY position, id
+        """, (include_inactive,))
+        rows = cur.fetchall()
+
+        images: dict[str, list] = {}
+        cur.execute("SELECT excursion_id, path FROM excursion_images ORDER BY excursion_id, position")
+        for ex_id, path in cur.fetchall():
+            images.setdefault(ex_id, []).append(path)
+
+        route: dict[str, list] = {}
+        cur.execute("SELECT excursion_id, name, address FROM excursion_route ORDER BY excursion_id, position")
+        for ex_id, name, address in cur.fetchall():
+            route.setdefault(ex_id, []).append({"name": name, "address": address})
+    finally:
+        conn.rollback()
+
+    return version, [
+        {
+            "id": row[0],
+            "title": row[1],
+            "description": row[2],
+            "start_time": row[3],
+            "price": row[4],
+            "prepayment_percent": row[5],
+            "pickup": {"title": row[6], "address": row[7], "gis": row[8]},
+            "active": bool(row[9]),
+            "images": images.get(row[0], []),
+            "route": route.get(row[0], [])
+        }
+        for row in rows
+    ]
+
+
+# =========================
+# 🖼 MEDIA CACHE
+# =========================
+
+@pooled
+def get_media_file_ids(conn) -> dict:
+    cur = conn.cursor()
+
+    cur.execute("SELECT path, mtime_ns, size, file_id FROM media_cache")
+
+    return {
+        path: (mtime_ns, size, file_id)
+        for path, mtime_ns, size, file_id in cur.fetchall()
+    }
+
+
+@pooled
+def save_media_file_id(conn, path: str, mtime_ns: int, size: int, file_id: str):
+    cur = conn.cursor()
+
+    cur.execute("""
+    INSERT OR REPLACE INTO media_cache (path, mtime_ns, size, file_id)
+    VALUES (?, ?, ?, ?)
+    """, (path, mtime_ns, size, file_id))
 
     conn.commit()
-    conn.close()
 
 
-def unblock_date(excursion_id: str, date_str: str):
-    conn = sqlite3.connect(DB_NAME)
+@pooled
+def delete_media_file_ids(conn, paths: list[str]):
     cur = conn.cursor()
 
-    cur.execute(
-        """
-        DELETE FROM blocked_dates
-        WHERE excursion_id = ? AND date = ?
-        """,
-        (excursion_id, date_str)
+    cur.executemany(
+        "DELETE FROM media_cache WHERE path = ?",
+        [(path,) for path in paths]
     )
 
     conn.commit()
-    conn.close()
 
 
-def get_blocked_dates(excursion_id: str) -> set[str]:
-    conn = sqlite3.connect(DB_NAME)
+# =========================
+# 💬 FSM STORAGE
+# =========================
+
+@pooled
+def load_fsm_record(conn, key: str):
     cur = conn.cursor()
 
     cur.execute(
-        "SELECT date FROM blocked_dates WHERE excursion_id = ?",
-        (excursion_id,)
+        "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?",
+        (key,)
     )
 
-    rows = cur.fetchall()
-    conn.close()
+    return cur.fetchone()
 
-    return {row[0] for row in rows}
 
-def get_excursions():
+@pooled
+def save_fsm_records(conn, records: list[tuple]):
+    """
+    records: [(key, state, data_json, updated_at), ...]
+    Пустые записи (нет состояния и данных) удаляются.
+    Строку, которую другой процесс записал позже, запись не затирает.
+    """
+    cur = conn.cursor()
+
+    cur.executemany(
+        "DELETE FROM fsm_storage WHERE key = ? AND updated_at <= ?",
+        [(r[0], r[3]) for r in records if r[1] is None and r[2] == "{}"]
+    )
+    cur.executemany("""
+    INSERT INTO fsm_storage (key, state, data, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        state = excluded.state,
+        data = excluded.data,
+        updated_at = excluded.updated_at
+    WHERE excluded.updated_at >= fsm_storage.updated_at
+    """, [r for r in records if not (r[1] is None and r[2] == "{}")])
+
+    conn.commit()
+
+
+@pooled
+def delete_expired_fsm_records(conn, before: float) -> int:
+    cur = conn.cursor()
+
+    cur.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (before,))
+    deleted = cur.rowcount
+
+    conn.commit()
+    return deleted
+
+
+# =========================
+# 📨 ОЧЕРЕДЬ УВЕДОМЛЕНИЙ
+# =========================
+# Отправленные уведомления удаляются, неотправляемые остаются
+# со статусом 'failed' и текстом последней ошибки
+
+@pooled
+def enqueue_notifications(conn, chat_ids: list[int], text: str, parse_mode: str | None = None) -> int:
+    cur = conn.cursor()
+
+    cur.executemany("""
+    INSERT INTO notification_outbox (chat_id, text, parse_mode, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    """, [
+        (chat_id, text, parse_mode, time.time(), datetime.now().isoformat(timespec="seconds"))
+        for chat_id in chat_ids
+    ])
+
+    conn.commit()
+    return len(chat_ids)
+
+
+@pooled
+def claim_notifications(conn, limit: int, lease: float) -> list[tuple]:
     """
-    Возвращает список экскурсий из конфига
-    НЕ из БД — экскурсии хранятся в коде!
+    Забирает уведомления, которым пора уходить, и откладывает их на lease секунд —
+    так другой процесс бота не отправит их второй раз. Если отправитель упадёт,
+    уведомление снова станет доступным, когда истечёт lease.
     """
-    from config import EXCURSIONS
-    return [(ex["id"], ex["title"]) for ex in EXCURSIONS]
\ No newline at end of file
+    cur = conn.cursor()
+    now = time.time()
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+        SELECT id, chat_id, text, parse_mode, attempts
+        FROM notification_outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at
+        LIMIT ?
+        """, (now, limit))
+        rows = cur.fetchall()
+
+        cur.executemany(
+            "UPDATE notification_outbox SET next_attempt_at = ? WHERE id = ?",
+            [(now + lease, row[0]) for row in rows]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return rows
+
+
+@pooled
+def complete_notification(conn, notification_id: int):
+    conn.execute("DELETE FROM notification_outbox WHERE id = ?", (notification_id,))
+    conn.commit()
+
+
+@pooled
+def retry_notification(conn, notification_id: int, next_attempt_at: float | None, error: str):
+    """next_attempt_at=None — больше не пытаться (статус 'failed')"""
+    conn.execute("""
+    UPDATE notification_outbox
+    SET attempts = attempts + 1,
+        status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END,
+        next_attempt_at = COALESCE(?, next_attempt_at),
+        last_error = ?
+    WHERE id = ?
+    """, (next_attempt_at, next_attempt_at, error, notification_id))
+    conn.commit()
@@ -0,0 +1,208 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db import load_fsm_record, save_fsm_records, delete_expired_fsm_records
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: dict = field(default_factory=dict)
+    loaded_at: float = 0.0    # когда сверяли с БД или меняли (monotonic)
+    updated_at: float = 0.0   # последнее изменение (time.time), как в БД
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в SQLite вместо MemoryStorage.
+
+    - переживает перезапуск бота;
+    - изменения копятся в памяти и пишутся в БД пачкой раз в flush_interval;
+    - пока изменение не записано, ключ читается только из памяти;
+    - запись, которую сверяли с БД или меняли меньше flush_interval
+      назад, тоже читается из памяти без запроса к БД;
+    - более старые записи сверяют updated_at со строкой в БД
+      и перечитывают её, если другой процесс записал более новую;
+    - диалоги, которые не трогали дольше session_ttl, считаются брошенными
+      и удаляются; записи, к которым не обращались cache_ttl секунд,
+      выбрасываются из памяти.
+
+    Несколько процессов на одной базе видят изменения друг друга
+    не позже чем через 2 × flush_interval после изменения: до flush_interval
+    изменение ждёт записи в БД и ещё до flush_interval другой процесс
+    читает свою копию из памяти. Изменения одного диалога не сливаются:
+    если два процесса поменяли его одновременно, в БД остаётся более
+    позднее по updated_at.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = 0.5,
+        cache_ttl: float = 600,
+        session_ttl: float = 24 * 3600,
+        purge_interval: float = 600
+    ):
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.session_ttl = session_ttl
+        self.purge_interval = purge_interval
+
+        self._cache: dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._flushing: set[str] = set()  # уже отданы на запись, но ещё не записаны
+        self._task: asyncio.Task | None = None
+        self._last_purge = time.monotonic()
+        self.hits = 0    # чтений из памяти без запроса к БД
+        self.misses = 0  # чтений со сверкой с БД
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            # поле есть в StorageKey только с aiogram 3.5
+            getattr(key, "business_connection_id", None),
+            key.destiny
+        ))
+
+    def _pending(self, k: str) -> bool:
+        """Есть изменения, которых ещё нет в БД — память новее"""
+        return k in self._dirty or k in self._flushing
+
+    async def _entry(self, key: StorageKey) -> tuple[str, _Entry]:
+        k = self._key(key)
+
+        entry = self._cache.get(k)
+        if entry is not None and (
+            self._pending(k)
+            or time.monotonic() - entry.loaded_at < self.flush_interval
+        ):
+            self.hits += 1
+            return k, entry
+
+        self.misses += 1
+        row = await load_fsm_record(k)
+        # пока читали, ключ могли изменить в этом же процессе
+        if self._pending(k):
+            return k, self._cache[k]
+
+        now = time.monotonic()
+        if entry is not None and (
+            (row is not None and row[2] == entry.updated_at)
+            or (row is None and entry.state is None and not entry.data)
+        ):
+            entry.loaded_at = now
+            return k, entry
+
+        entry = _Entry(loaded_at=now)
+        if row is not None:
+            state, data, updated_at = row
+            if time.time() - updated_at < self.session_ttl:
+                entry.state = state
+                entry.data = json.loads(data) if data else {}
+                entry.updated_at = updated_at
+
+        self._cache[k] = entry
+        return k, entry
+
+    def _touch(self, k: str, entry: _Entry):
+        entry.updated_at = time.time()
+        entry.loaded_at = time.monotonic()
+        self._dirty.add(k)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._touch(k, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k, entry = await self._entry(key)
+        entry.data = copy.deepcopy(dict(data))
+        self._touch(k, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        return copy.deepcopy(entry.data)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+
+        keys, self._dirty = self._dirty, set()
+        # до конца записи ключи читаются из памяти, а не из старой строки в БД
+        self._flushing |= keys
+        try:
+            records = []
+            for k in keys:
+                entry = self._cache[k]
+                try:
+                    data = json.dumps(entry.data, ensure_ascii=False)
+                except (TypeError, ValueError) as e:
+                    # повтор не поможет — остальные ключи пачки всё равно пишем
+                    logging.error(f"FSM-состояние {k} не сохраняется в JSON: {e}")
+                    continue
+                records.append((k, entry.state, data, entry.updated_at))
+
+            try:
+                await save_fsm_records(records)
+            except Exception as e:
+                logging.error(f"Не удалось сохранить {len(records)} FSM-состояний: {e}")
+                self._dirty |= {record[0] for record in records}
+        finally:
+            self._flushing -= keys
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._cache)
+        }
+
+    async def purge_expired(self) -> int:
+        """Удаляет брошенные диалоги из БД и давно не нужные записи из памяти"""
+        deleted = await delete_expired_fsm_records(time.time() - self.session_ttl)
+
+        stale = time.monotonic() - self.cache_ttl
+        for k in [k for k, e in self._cache.items() if not self._pending(k) and e.loaded_at < stale]:
+            del self._cache[k]
+
+        if deleted:
+            logging.info(f"🧹 Удалено брошенных FSM-сессий: {deleted}")
+        return deleted
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+            if time.monotonic() - self._last_purge >= self.purge_interval:
+                self._last_purge = time.monotonic()
+                await self.purge_expired()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,319 @@
+"""
+Нагрузочный прогон бота без Telegram.
+
+    python loadtest.py --users 1000 --concurrency 100 --api-latency 30
+
+Поднимает локальный поддельный Bot API (aiohttp), направляет на него
+bot.py как есть и прогоняет виртуальных пользователей по всему сценарию:
+/start → экскурсия → календарь → дата → ФИО → телефон → кол-во →
+оплата на месте → договор → подпись. Пользователь «нажимает» кнопки,
+которые бот ему прислал. В конце — p50/p99 по шагам, пропускная
+способность и время запросов к БД.
+
+База, журнал заказов и FSM пишутся во временный каталог —
+рабочие orders.db и orders_journal.jsonl не трогаются.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+FAKE_TOKEN = "123456:LOADTEST-LOADTEST-LOADTEST-LOADTEST"
+
+
+# =========================
+# 🧪 ПОДДЕЛЬНЫЙ BOT API
+# =========================
+
+class FakeBotAPI:
+    """
+    Принимает запросы бота вида /bot<token>/<method>, отвечает
+    правдоподобными объектами и запоминает последнюю inline-клавиатуру
+    в каждом чате — по ней виртуальный пользователь выбирает, что нажать.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.markups: dict[int, dict] = {}
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _message(self, chat_id, **extra) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **extra
+        }
+
+    def _photo(self, sent) -> list[dict]:
+        # отправили по file_id — Telegram возвращает тот же file_id
+        if isinstance(sent, str) and not sent.startswith("attach://"):
+            file_id = sent
+        else:
+            file_id = f"photo-{next(self._file_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        form = await request.post()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = form.get("chat_id", 0)
+        if "reply_markup" in form:
+            markup = json.loads(form["reply_markup"])
+            if "inline_keyboard" in markup:
+                self.markups[int(chat_id)] = markup
+
+        if method in ("sendmessage", "editmessagetext"):
+            result = self._message(chat_id, text=form.get("text", ""))
+        elif method == "sendphoto":
+            result = self._message(chat_id, photo=self._photo(form.get("photo")))
+        elif method == "senddocument":
+            n = next(self._file_ids)
+            result = self._message(chat_id, document={"file_id": f"doc-{n}", "file_unique_id": f"d{n}"})
+        elif method == "sendmediagroup":
+            result = [
+                self._message(chat_id, photo=self._photo(item["media"]))
+                for item in json.loads(form["media"])
+            ]
+        elif method == "getme":
+            result = {"id": 123456, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot"}
+        else:
+            result = True  # answerCallbackQuery, deleteMessage и т.п.
+
+        return web.json_response({"ok": True, "result": result})
+
+    def buttons(self, chat_id: int, prefix: str) -> list[str]:
+        markup = self.markups.get(chat_id, {})
+        return [
+            button["callback_data"]
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+            if button.get("callback_data", "").startswith(prefix)
+        ]
+
+
+# =========================
+# 👥 ВИРТУАЛЬНЫЕ ПОЛЬЗОВАТЕЛИ
+# =========================
+
+class Simulation:
+    def __init__(self, bot_module, api: FakeBotAPI):
+        self.bot_module = bot_module
+        self.api = api
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.outcomes = Counter()
+        self.errors = Counter()
+        self.updates = 0
+        self._update_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    async def _feed(self, step: str, update: dict):
+        from aiogram.types import Update
+
+        update["update_id"] = next(self._update_ids)
+        start = time.perf_counter()
+        try:
+            await self.bot_module.dp.feed_update(self.bot_module.bot, Update.model_validate(update))
+        except Exception as e:
+            self.errors[f"{step}: {type(e).__name__}: {e}"] += 1
+            raise
+        finally:
+            self.latencies[step].append(time.perf_counter() - start)
+            self.updates += 1
+
+    async def message(self, step: str, user_id: int, text: str):
+        await self._feed(step, {"message": {
+            "message_id": next(self._update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text
+        }})
+
+    async def tap(self, step: str, user_id: int, data: str):
+        await self._feed(step, {"callback_query": {
+            "id": str(next(self._update_ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "…"
+            }
+        }})
+
+    def _button(self, user_id: int, prefix: str) -> str | None:
+        buttons = self.api.buttons(user_id, prefix)
+        return random.choice(buttons) if buttons else None
+
+    async def user_flow(self, user_id: int, excursion_titles: list[str]):
+        await self.message("start", user_id, "/start")
+        await self.message("menu", user_id, "🚗 Выбрать экскурсию")
+        await self.message("excursion", user_id, random.choice(excursion_titles))
+        await self.tap("calendar", user_id, "start_booking")
+
+        date_button = self._button(user_id, "date:")
+        if date_button is None:
+            self.outcomes["нет свободных дат"] += 1
+            return
+
+        await self.tap("date", user_id, date_button)
+        await self.message("name", user_id, f"Иванов Иван {user_id}")
+        await self.message("phone", user_id, "+79990000000")
+        await self.message("count", user_id, "1")
+
+        pay_button = self._button(user_id, "pay_on_place:")
+        if pay_button is None:
+            self.outcomes["мест не осталось"] += 1
+            return
+
+        await self.tap("pay", user_id, pay_button)
+        await self.tap("contract", user_id, self._button(user_id, "view_contract:"))
+        await self.tap("sign", user_id, self._button(user_id, "sign_contract:"))
+        self.outcomes["договор подписан"] += 1
+
+    async def run(self, users: int, concurrency: int, first_user_id: int = 10_000_000):
+        from catalog import catalog
+
+        titles = [ex.title for ex in catalog]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(user_id: int):
+            async with semaphore:
+                try:
+                    await self.user_flow(user_id, titles)
+                except Exception:
+                    self.outcomes["ошибка"] += 1
+
+        await asyncio.gather(*(one(first_user_id + i) for i in range(users)))
+
+
+# =========================
+# 📋 ОТЧЁТ
+# =========================
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def report(sim: Simulation, api: FakeBotAPI, elapsed: float, metrics) -> str:
+    lines = [
+        f"Пользователей: {sum(sim.outcomes.values())}, апдейтов: {sim.updates}, время: {elapsed:.1f} с",
+        f"Пропускная способность: {sim.updates / elapsed:.0f} апдейтов/с, "
+        f"{sim.outcomes['договор подписан'] / elapsed:.1f} подписанных договоров/с",
+        "Итоги: " + ", ".join(f"{k} — {v}" for k, v in sim.outcomes.most_common()),
+        "",
+        f"{'шаг':<10} {'n':>6} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9}",
+    ]
+    for step, values in sim.latencies.items():
+        lines.append(
+            f"{step:<10} {len(values):>6} "
+            f"{percentile(values, 0.5) * 1000:>9.1f} "
+            f"{percentile(values, 0.99) * 1000:>9.1f} "
+            f"{max(values) * 1000:>9.1f}"
+        )
+
+    lines += ["", "Bot API: " + ", ".join(f"{m} — {n}" for m, n in api.calls.most_common())]
+
+    db_lines = [line for line in metrics.summary() if line.startswith("db_query_seconds")]
+    if db_lines:
+        lines += ["", "БД (время на соединении, включая ожидание блокировок):"] + db_lines
+
+    if sim.errors:
+        lines += ["", "Ошибки:"] + [f"{n} × {e}" for e, n in sim.errors.most_common(10)]
+    return "\n".join(lines)
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    # окружение — до импорта бота: config читается один раз
+    os.environ["DB_PATH"] = os.path.join(workdir, "orders.db")
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    os.environ.setdefault("METRICS_ENABLED", "1")
+    os.environ["RUN_MODE"] = "polling"
+
+    import bot as bot_module
+    from aiogram.client.telegram import TelegramAPIServer
+    from calendar_horizon import calendar_horizon
+    from catalog import catalog
+    from contracts import contract_renderer
+    from db import DB_NAME, close_db, init_db
+    from availability import availability
+    from metrics import metrics
+    from notifications import notifier
+    from order_export import order_exporter
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    bot_module.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+
+    await init_db()
+    await catalog.reload(force=True)
+    await calendar_horizon.refresh()
+    if args.places:
+        # мест побольше, чтобы пользователи не упирались в распроданные даты
+        with sqlite3.connect(DB_NAME) as conn:
+            conn.execute("UPDATE excursion_calendar SET total_places = ?", (args.places,))
+        availability.invalidate()
+
+    order_exporter.journal_path = os.path.join(workdir, "orders_journal.jsonl")
+    order_exporter.start()
+    contract_renderer.start()
+    notifier.start(bot_module.bot)
+
+    sim = Simulation(bot_module, api)
+    start = time.perf_counter()
+    try:
+        await sim.run(args.users, args.concurrency)
+        elapsed = time.perf_counter() - start
+    finally:
+        await notifier.stop()
+        await contract_renderer.stop()
+        await order_exporter.stop()
+        await bot_module.dp.storage.close()
+        await bot_module.bot.session.close()
+        await runner.cleanup()
+        close_db()
+
+    print(report(sim, api, elapsed, metrics))
+    print(f"\nДанные прогона: {workdir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота на поддельном Bot API")
+    parser.add_argument("--users", type=int, default=500, help="сколько пользователей проходят сценарий")
+    parser.add_argument("--concurrency", type=int, default=50, help="сколько пользователей одновременно")
+    parser.add_argument("--places", type=int, default=100000, help="мест на дату (0 — как в базе)")
+    parser.add_argument("--api-latency", type=float, default=0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--port", type=int, default=8081, help="порт поддельного Bot API")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,160 @@
+import logging
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from catalog import catalog
+from db import get_media_file_ids, save_media_file_id, delete_media_file_ids
+
+
+class MediaCache:
+    """
+    file_id картинок, уже загруженных в Telegram.
+    Ключ — путь к файлу; запись действительна, пока у файла
+    не изменились mtime и размер. Повторно файл не загружается.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[int, int, str]] = {}
+        self._extra_assets: list[str] = []
+
+    async def load(self):
+        self._entries = await get_media_file_ids()
+
+    def register(self, *paths: str):
+        """Добавляет файлы (отзывы, аватар), которые тоже нужно прогревать"""
+        self._extra_assets.extend(paths)
+
+    def assets(self) -> list[str]:
+        paths = [img for ex in catalog for img in ex.images[:10]]
+        return list(dict.fromkeys(paths + self._extra_assets))
+
+    @staticmethod
+    def _fingerprint(path: str) -> tuple[int, int]:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def file_id(self, path: str) -> str | None:
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+
+        try:
+            if entry[:2] != self._fingerprint(path):
+                return None  # файл заменили — нужно загрузить заново
+        except OSError:
+            pass  # файла на диске нет, но в Telegram он уже есть
+
+        return entry[2]
+
+    def input_file(self, path: str) -> str | FSInputFile:
+        return self.file_id(path) or FSInputFile(path)
+
+    async def remember(self, path: str, message: Message):
+        if not message.photo:
+            return
+
+        file_id = message.photo[-1].file_id
+        if self.file_id(path) == file_id:
+            return
+
+        try:
+            mtime_ns, size = self._fingerprint(path)
+        except OSError:
+            return
+
+        self._entries[path] = (mtime_ns, size, file_id)
+        await save_media_file_id(path, mtime_ns, size, file_id)
+
+    async def forget(self, paths: list[str]):
+        for path in paths:
+            self._entries.pop(path, None)
+        await delete_media_file_ids(paths)
+
+    async def answer_photo(self, message: Message, path: str, **kwargs) -> Message:
+        cached = self.file_id(path) is not None
+        try:
+            sent = await message.answer_photo(photo=self.input_file(path), **kwargs)
+        except TelegramBadRequest:
+            if not cached:
+                raise
+            # file_id больше не принимается (например, сменился токен бота)
+            await self.forget([path])
+            sent = await message.answer_photo(photo=FSInputFile(path), **kwargs)
+
+        await self.remember(path, sent)
+        return sent
+
+    async def answer_album(
+        self,
+        message: Message,
+        paths: list[str],
+        caption: str | None = None,
+        parse_mode: str | None = None,
+        captions: list[str | None] | None = None
+    ) -> list[Message]:
+        """
+        Отправляет альбом; подпись ставится на последнее фото.
+        captions — своя подпись у каждого фото (вместо caption)
+        """
+        if captions is None:
+            captions = [None] * (len(paths) - 1) + [caption]
+
+        def build(use_cache: bool):
+            return [
+                InputMediaPhoto(
+                    media=self.input_file(path) if use_cache else FSInputFile(path),
+                    caption=text,
+                    parse_mode=parse_mode if text else None
+                )
+                for path, text in zip(paths, captions)
+            ]
+
+        cached = any(self.file_id(path) for path in paths)
+        try:
+            sent = await message.answer_media_group(build(use_cache=True))
+        except TelegramBadRequest:
+            if not cached:
+                raise
+            await self.forget(paths)
+            sent = await message.answer_media_group(build(use_cache=False))
+
+        for path, msg in zip(paths, sent):
+            await self.remember(path, msg)
+        return sent
+
+    async def warm_up(self, bot: Bot, chat_id: int) -> int:
+        """
+        Загружает в Telegram все ещё не закэшированные картинки,
+        отправляя их в служебный чат и сразу удаляя сообщения
+        """
+        uploaded = 0
+        for path in self.assets():
+            if self.file_id(path):
+                continue
+
+            try:
+                sent = await bot.send_photo(
+                    chat_id,
+                    FSInputFile(path),
+                    disable_notification=True
+                )
+            except Exception as e:
+                logging.error(f"Не удалось прогреть {path}: {e}")
+                continue
+
+            await self.remember(path, sent)
+            uploaded += 1
+
+            try:
+                await bot.delete_message(chat_id, sent.message_id)
+            except Exception:
+                pass
+
+        logging.info(f"🖼 Прогрев медиа: загружено {uploaded} файлов")
+        return uploaded
+
+
+media_cache = MediaCache()
@@ -0,0 +1,195 @@
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from config import METRICS_ENABLED
+
+# границы корзин гистограмм, секунды
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# поля stats() кэшей, которые только растут, — counter; остальные — gauge
+COUNTER_FIELDS = {"hits", "misses", "skipped"}
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля — верхняя граница корзины, в которую он попал"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Гистограммы времени выполнения в памяти процесса.
+    Ключ — имя метрики и одна метка (обработчик, запрос к БД,
+    метод Bot API...). Плюс счётчики кэшей (register_stats).
+    Отдаются в формате Prometheus или сводкой в лог.
+    Выключенные метрики (METRICS_ENABLED=0) ничего не стоят:
+    middleware и обёртки просто не подключаются.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        self._stats: dict[str, Callable[[], dict]] = {}
+        self._task: asyncio.Task | None = None
+
+    def observe(self, name: str, label: str, seconds: float):
+        hist = self._histograms.get((name, label))
+        if hist is None:
+            # вызывается и из потоков БД; гонка здесь — максимум
+            # одно потерянное наблюдение при создании гистограммы
+            hist = self._histograms.setdefault((name, label), Histogram())
+        hist.observe(seconds)
+
+    def register_stats(self, label: str, stats: Callable[[], dict]):
+        """
+        Счётчики кэша: stats() возвращает {"hits": ..., "misses": ...}
+        и отдаётся как cache_<поле>{name="<label>"}
+        """
+        self._stats[label] = stats
+
+    def _collect_stats(self) -> dict[str, dict]:
+        return {label: stats() for label, stats in sorted(self._stats.items())}
+
+    @contextmanager
+    def timer(self, name: str, label: str):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - start)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name in sorted({name for name, _ in self._histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (hist_name, label), hist in sorted(self._histograms.items()):
+                if hist_name != name:
+                    continue
+
+                cumulative = 0
+                for bound, n in zip(BUCKETS, hist.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{name="{label}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{name="{label}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{name="{label}"}} {hist.count}')
+
+        collected = self._collect_stats()
+        for stat in sorted({stat for values in collected.values() for stat in values}):
+            counter = stat in COUNTER_FIELDS
+            name = f"cache_{stat}_total" if counter else f"cache_{stat}"
+            lines.append(f"# TYPE {name} {'counter' if counter else 'gauge'}")
+            for label, values in collected.items():
+                if stat in values:
+                    lines.append(f'{name}{{name="{label}"}} {values[stat]:g}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[str]:
+        return [
+            f"{name}[{label}]: n={hist.count} "
+            f"avg={hist.sum / hist.count * 1000:.2f}ms "
+            f"p50<={hist.quantile(0.5) * 1000:g}ms p99<={hist.quantile(0.99) * 1000:g}ms"
+            for (name, label), hist in sorted(self._histograms.items())
+            if hist.count
+        ] + [
+            f"cache[{label}]: " + " ".join(
+                f"{stat}={value:.2f}" if isinstance(value, float) else f"{stat}={value}"
+                for stat, value in values.items()
+            )
+            for label, values in self._collect_stats().items()
+        ]
+
+    def start_log_dump(self, interval: float):
+        if self.enabled and interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._log_dump(interval))
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _log_dump(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for line in self.summary():
+                logging.info(f"📈 {line}")
+
+
+metrics = Metrics()
+
+
+# ===== aiogram =====
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Время работы каждого обработчика (inner-middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        label = handler_object.callback.__name__ if handler_object else "unknown"
+
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe("bot_handler_seconds", label, time.perf_counter() - start)
+
+
+class RequestTimingMiddleware(BaseRequestMiddleware):
+    """Длительность запросов к Bot API по методам"""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            metrics.observe("telegram_request_seconds", type(method).__name__, time.perf_counter() - start)
+
+
+def setup_metrics(dp, bot: Bot):
+    if not metrics.enabled:
+        return
+
+    middleware = HandlerTimingMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(RequestTimingMiddleware())
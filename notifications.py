@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config import NOTIFY_CONCURRENCY, NOTIFY_RATE, NOTIFY_MAX_ATTEMPTS
+from db import enqueue_notifications, claim_notifications, complete_notification, retry_notification
+
+
+class TokenBucket:
+    """Не больше rate отправок в секунду, с запасом burst на всплеск"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать (RetryAfter) — стоим все"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """
+    Отправка уведомлений через очередь в БД (notification_outbox).
+    notify() только записывает сообщения и сразу возвращается,
+    отправляет фоновая задача: параллельно (не больше concurrency),
+    с ограничением скорости и повторами с растущей паузой.
+    Неотправленное переживает перезапуск бота.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        rate: float = NOTIFY_RATE,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        poll_interval: float = 5.0,
+        lease: float = 120.0
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease = lease
+
+        self._bucket = TokenBucket(rate)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._sending: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self._bot: Bot | None = None
+
+    async def notify(self, chat_ids: list[int], text: str, parse_mode: str | None = None):
+        if not chat_ids:
+            return
+        await enqueue_notifications(chat_ids, text, parse_mode)
+        self._wakeup.set()
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # начатые отправки дожидаемся; остальное уйдёт после перезапуска
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                batch = await claim_notifications(self.concurrency * 4, self.lease)
+            except Exception as e:
+                logging.error(f"Не удалось прочитать очередь уведомлений: {e}")
+                batch = []
+
+            for row in batch:
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._send(*row))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            if batch:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _backoff(self, attempts: int) -> float:
+        return min(2 ** attempts, 300)
+
+    async def _send(self, notification_id: int, chat_id: int, text: str, parse_mode: str | None, attempts: int):
+        try:
+            await self._bucket.acquire()
+            try:
+                await self._bot.send_message(chat_id, text, parse_mode=parse_mode)
+            except TelegramRetryAfter as e:
+                self._bucket.pause(e.retry_after)
+                await retry_notification(notification_id, time.time() + e.retry_after, str(e))
+                return
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # бот заблокирован или чат не существует — повтор не поможет
+                logging.error(f"Уведомление в чат {chat_id} не доставлено: {e}")
+                await retry_notification(notification_id, None, str(e))
+                return
+            except Exception as e:
+                if attempts + 1 >= self.max_attempts:
+                    logging.error(f"Уведомление в чат {chat_id} не доставлено после {attempts + 1} попыток: {e}")
+                    await retry_notification(notification_id, None, str(e))
+                else:
+                    await retry_notification(notification_id, time.time() + self._backoff(attempts), str(e))
+                return
+
+            await complete_notification(notification_id)
+        except Exception as e:
+            # ошибка самой БД — запись вернётся в работу по истечении lease
+            logging.error(f"Ошибка очереди уведомлений ({notification_id}): {e}")
+        finally:
+            self._semaphore.release()
+
+
+notifier = NotificationDispatcher()
@@ -0,0 +1,289 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import tempfile
+from datetime import date, datetime
+
+from openpyxl import Workbook, load_workbook
+
+from db import REPORT_ORDER_FIELDS, open_reader, iter_orders
+from metrics import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXCEL_FILE = os.path.join(BASE_DIR, "orders.xlsx")
+JOURNAL_FILE = os.path.join(BASE_DIR, "orders_journal.jsonl")
+
+# сколько событий максимум пишем в журнал за один раз
+BATCH_SIZE = 500
+
+EXCEL_HEADERS = [
+    "Дата бронирования",
+    "ID бронирования",
+    "Экскурсия",
+    "Дата экскурсии",
+    "Время",
+    "ФИО",
+    "Телефон",
+    "Кол-во чел",
+    "Сумма",
+    "Предоплата",
+    "Место подачи",
+    "Маршрут",
+    "Статус"
+]
+
+# поля события в журнале — в том же порядке, что и колонки Excel
+EVENT_FIELDS = [
+    "created_at",
+    "booking_id",
+    "excursion",
+    "date",
+    "start_time",
+    "name",
+    "phone",
+    "count",
+    "price",
+    "prepayment",
+    "pickup_address",
+    "route",
+    "order_status"
+]
+
+
+def route_text(route: str) -> str:
+    """Маршрут заказа (JSON) одной строкой"""
+    return " → ".join([p["address"] for p in json.loads(route)])
+
+
+def order_event(order: dict) -> dict:
+    """Строка журнала: снимок заказа в момент события"""
+    return {
+        "created_at": datetime.now().strftime("%d.%m.%Y %H:%M"),
+        "booking_id": order["booking_id"],
+        "excursion": order["excursion"],
+        "date": order["date"],
+        "start_time": order.get("start_time", ""),
+        "name": order["name"],
+        "phone": order["phone"],
+        "count": order["count"],
+        "price": order["price"],
+        "prepayment": order.get("prepayment", 0),
+        "pickup_address": order["pickup_address"],
+        "route": route_text(order["route"]),
+        "order_status": order["order_status"]  # ← "Создан" или "Подписан"
+    }
+
+
+def event_row(event: dict) -> list:
+    return [event[field] for field in EVENT_FIELDS]
+
+
+def append_events(events: list[dict], journal_path: str = JOURNAL_FILE):
+    """Дописывает события в конец журнала (файл никогда не переписывается)"""
+    with metrics.timer("order_journal_write_seconds", "append"):
+        lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events)
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_events(journal_path: str = JOURNAL_FILE):
+    """Построчно читает журнал, не загружая его в память целиком"""
+    if not os.path.exists(journal_path):
+        return
+
+    with open(journal_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_legacy_excel(
+    excel_path: str = EXCEL_FILE,
+    journal_path: str = JOURNAL_FILE
+) -> int:
+    """
+    Однократно переносит строки старого orders.xlsx в журнал,
+    чтобы пересборка Excel не потеряла историю
+    """
+    if os.path.exists(journal_path) or not os.path.exists(excel_path):
+        return 0
+
+    wb = load_workbook(excel_path, read_only=True)
+    rows = wb.active.iter_rows(min_row=2, values_only=True)
+    events = [
+        dict(zip(EVENT_FIELDS, ["" if v is None else v for v in row]))
+        for row in rows
+    ]
+    wb.close()
+
+    append_events(events, journal_path)
+    logging.info(f"📥 Перенесено {len(events)} строк из {excel_path} в журнал")
+    return len(events)
+
+
+def build_xlsx(
+    excel_path: str = EXCEL_FILE,
+    journal_path: str = JOURNAL_FILE
+) -> int:
+    """
+    Собирает orders.xlsx из журнала в режиме write_only:
+    память не зависит от количества заказов, файл подменяется атомарно
+    """
+    with metrics.timer("excel_build_seconds", os.path.basename(excel_path)):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(EXCEL_HEADERS)
+
+        count = 0
+        for event in read_events(journal_path):
+            ws.append(event_row(event))
+            count += 1
+
+        tmp_path = excel_path + ".tmp"
+        wb.save(tmp_path)
+        os.replace(tmp_path, excel_path)
+    return count
+
+
+# =========================
+# 📤 ВЫГРУЗКА ПО ЗАПРОСУ
+# =========================
+# Отчёт строится прямо из orders, а не из журнала: фильтры по датам,
+# экскурсии и статусу, текущий статус каждого заказа.
+# Строки идут потоком — курсор SQLite → генератор → файл,
+# поэтому память не зависит от количества заказов.
+REPORT_FORMATS = ("xlsx", "csv")
+
+REPORT_HEADERS = EXCEL_HEADERS[1:] + ["Договор подписан"]
+
+# одна выгрузка за раз: остальные подождут, а не будут
+# параллельно читать базу и занимать потоки
+_report_lock = asyncio.Lock()
+
+
+def report_rows(orders):
+    for order in orders:
+        order["route"] = route_text(order["route"]) if order["route"] else ""
+        yield [order[field] for field in REPORT_ORDER_FIELDS]
+
+
+def write_report(path: str, fmt: str, rows) -> int:
+    with metrics.timer("report_build_seconds", fmt):
+        count = 0
+
+        if fmt == "csv":
+            # utf-8-sig и «;» — чтобы Excel открыл файл без мастера импорта
+            with open(path, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f, delimiter=";")
+                writer.writerow(REPORT_HEADERS)
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            return count
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Заказы")
+        ws.append(REPORT_HEADERS)
+        for row in rows:
+            ws.append(row)
+            count += 1
+        wb.save(path)
+        return count
+
+
+def build_report(path: str, fmt: str, **filters) -> int:
+    """Выгрузка в файл на отдельном соединении (в потоке, не в пуле БД)"""
+    conn = open_reader()
+    try:
+        return write_report(path, fmt, report_rows(iter_orders(conn, **filters)))
+    finally:
+        conn.close()
+
+
+async def export_report(
+    fmt: str = "xlsx",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    excursion_id: str | None = None,
+    status: str | None = None
+) -> tuple[str, int]:
+    """
+    Строит отчёт во временный файл и возвращает (путь, число заказов).
+    Файл удаляет вызывающий, когда отправит.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат {fmt!r}")
+
+    fd, path = tempfile.mkstemp(prefix="orders-", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        async with _report_lock:
+            count = await asyncio.to_thread(
+                build_report, path, fmt,
+                date_from=date_from, date_to=date_to,
+                excursion_id=excursion_id, status=status
+            )
+    except Exception:
+        os.remove(path)
+        raise
+    return path, count
+
+
+class OrderExporter:
+    """
+    Фоновая очередь событий по заказам.
+    Хендлеры только кладут событие в очередь, отдельная задача
+    пачками дописывает их в журнал в потоке, не блокируя event loop.
+    """
+
+    def __init__(self, journal_path: str = JOURNAL_FILE, batch_size: int = BATCH_SIZE):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def enqueue(self, order: dict):
+        self._queue.put_nowait(order_event(order))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает всё, что осталось в очереди, и останавливает задачу"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                await asyncio.to_thread(append_events, batch, self.journal_path)
+            except Exception as e:
+                logging.error(f"Не удалось записать {len(batch)} заказ(ов) в журнал: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+order_exporter = OrderExporter()
+
+
+if __name__ == "__main__":
+    # python order_export.py — пересобрать orders.xlsx из журнала
+    import_legacy_excel()
+    print(f"Собрано строк: {build_xlsx()} → {EXCEL_FILE}")
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from callbacks import ReviewsPage
+from media_cache import media_cache
+
+# больше 10 фото в одном альбоме Telegram не принимает
+ALBUM_SIZE = 10
+
+
+@dataclass(frozen=True)
+class _Page:
+    paths: list[str]
+    captions: list[str]
+    title: str
+    keyboard: InlineKeyboardMarkup | None
+
+
+class ReviewGallery:
+    """
+    Отзывы альбомами по ALBUM_SIZE фото — один запрос на страницу
+    вместо запроса на каждый отзыв. Страницы и кнопки листания
+    собираются один раз, при создании галереи.
+    """
+
+    def __init__(self, reviews: list[dict], album_size: int = ALBUM_SIZE):
+        chunks = [reviews[i:i + album_size] for i in range(0, len(reviews), album_size)]
+        self.pages = [
+            _Page(
+                paths=[review["photo"] for review in chunk],
+                captions=[review["text"] for review in chunk],
+                title=f"⭐ Отзывы: страница {number + 1} из {len(chunks)}",
+                keyboard=self._keyboard(number, len(chunks))
+            )
+            for number, chunk in enumerate(chunks)
+        ]
+
+    @staticmethod
+    def _keyboard(number: int, total: int) -> InlineKeyboardMarkup | None:
+        if total < 2:
+            return None
+
+        buttons = []
+        if number > 0:
+            buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=ReviewsPage(number=number - 1).pack()))
+        if number < total - 1:
+            buttons.append(InlineKeyboardButton(text="Ещё отзывы ➡️", callback_data=ReviewsPage(number=number + 1).pack()))
+        return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+    async def send(self, message: Message, number: int = 0):
+        if not self.pages:
+            return
+
+        page = self.pages[max(0, min(number, len(self.pages) - 1))]
+
+        # альбом — минимум из двух фото
+        if len(page.paths) == 1:
+            await media_cache.answer_photo(
+                message,
+                page.paths[0],
+                caption=page.captions[0],
+                parse_mode="HTML"
+            )
+        else:
+            await media_cache.answer_album(
+                message,
+                page.paths,
+                captions=page.captions,
+                parse_mode="HTML"
+            )
+
+        # у альбома не бывает кнопок — листание отдельным сообщением
+        if page.keyboard is not None:
+            await message.answer(page.title, reply_markup=page.keyboard)
@@ -0,0 +1,163 @@
+"""
+Стресс-проверка бронирования: мест не продаётся больше, чем есть.
+
+    python stress_booking.py --processes 4 --attempts 2000 --places 400
+
+Несколько процессов одновременно бронируют места на одну дату через
+book_places — как несколько экземпляров бота на одной базе. Внутри
+процесса попытки идут конкурентно (--concurrency). В конце проверяется:
+    booked_places <= total_places,
+    booked_places == сумме мест, о которых book_places сказал «забронировано».
+При нарушении скрипт завершается с кодом 1.
+
+База пишется во временный каталог — рабочая orders.db не трогается.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from loadtest import FAKE_TOKEN
+
+EXCURSION_ID = "new_year"
+
+
+def _environment(db_path: str):
+    # окружение — до импорта модулей бота: config читается один раз
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+
+
+async def _attempts(day: str, attempts: int, concurrency: int, seed: int) -> tuple[int, Counter]:
+    from db import book_places, close_db
+
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    reserved = 0
+    outcomes = Counter()
+
+    async def one():
+        nonlocal reserved
+        count = rng.randint(1, 3)
+        async with semaphore:
+            try:
+                result = await book_places(EXCURSION_ID, day, count)
+            except Exception as e:
+                outcomes[f"ошибка: {type(e).__name__}: {e}"] += 1
+                return
+        outcomes[result.status.value] += 1
+        if result.ok:
+            reserved += count
+
+    try:
+        await asyncio.gather(*(one() for _ in range(attempts)))
+    finally:
+        close_db()
+    return reserved, outcomes
+
+
+def _worker(db_path: str, day: str, attempts: int, concurrency: int, seed: int, start, results):
+    _environment(db_path)
+    start.wait()
+    results.put(asyncio.run(_attempts(day, attempts, concurrency, seed)))
+
+
+async def _prepare(places: int) -> str:
+    from calendar_horizon import calendar_horizon
+    from catalog import catalog
+    from db import DB_NAME, close_db, init_db
+
+    await init_db()
+    await catalog.reload(force=True)
+    await calendar_horizon.refresh()
+
+    day = (date.today() + timedelta(days=1)).isoformat()
+    with sqlite3.connect(DB_NAME) as conn:
+        conn.execute(
+            "UPDATE excursion_calendar SET total_places = ?, booked_places = 0 "
+            "WHERE excursion_id = ? AND date = ?",
+            (places, EXCURSION_ID, day)
+        )
+    close_db()
+    return day
+
+
+def main(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="stress-booking-")
+    db_path = os.path.join(workdir, "orders.db")
+    _environment(db_path)
+
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    day = asyncio.run(_prepare(args.places))
+
+    # spawn: каждый процесс заново импортирует бота со своим пулом соединений
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(
+            target=_worker,
+            args=(db_path, day, args.attempts, args.concurrency, seed, start, results)
+        )
+        for seed in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    began = time.perf_counter()
+    start.set()  # все процессы начинают одновременно
+    reserved = 0
+    outcomes = Counter()
+    for _ in processes:
+        process_reserved, process_outcomes = results.get()
+        reserved += process_reserved
+        outcomes += process_outcomes
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - began
+
+    with sqlite3.connect(db_path) as conn:
+        total, booked = conn.execute(
+            "SELECT total_places, booked_places FROM excursion_calendar "
+            "WHERE excursion_id = ? AND date = ?",
+            (EXCURSION_ID, day)
+        ).fetchone()
+
+    print(f"{args.processes} процессов × {args.attempts} попыток по 1–3 места, "
+          f"{elapsed:.1f} с")
+    print("Итоги: " + ", ".join(f"{k} — {v}" for k, v in outcomes.most_common()))
+    print(f"Забронировано по ответам book_places: {reserved}")
+    print(f"В календаре: {booked}/{total}")
+    print(f"\nДанные прогона: {workdir}")
+
+    failures = []
+    if booked > total:
+        failures.append(f"овербукинг: {booked} > {total}")
+    if booked != reserved:
+        failures.append(f"расхождение: в календаре {booked}, по ответам {reserved}")
+    if any(k.startswith("ошибка") for k in outcomes):
+        failures.append("были ошибки бронирования")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Овербукинга нет")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Стресс-проверка: нет овербукинга при конкурентных бронированиях")
+    parser.add_argument("--processes", type=int, default=4, help="сколько процессов бронируют одновременно")
+    parser.add_argument("--attempts", type=int, default=2000, help="попыток в каждом процессе")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных попыток в процессе")
+    parser.add_argument("--places", type=int, default=400, help="мест на дату")
+    sys.exit(main(parser.parse_args()))
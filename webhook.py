@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from metrics import metrics
+from config import (
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT
+)
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+
+def build_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    aiohttp-приложение для приёма апдейтов от Telegram.
+    Апдейт обрабатывается внутри запроса (handle_in_background=False):
+    при остановке aiohttp дожидается текущих запросов, поэтому
+    начатые апдейты не теряются.
+    """
+    app = web.Application()
+    app.router.add_get("/healthz", health)
+    if metrics.enabled:
+        app.router.add_get("/metrics", metrics_handler)
+
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    app = build_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    logging.info(f"🌐 Webhook-сервер слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    # без WEBHOOK_BASE_URL сервер работает локально: апдейты можно
+    # отправлять POST-запросом на WEBHOOK_PATH
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        logging.info("🛑 Останавливаем webhook-сервер")
+        # вебхук в Telegram не удаляем: за балансировщиком могут
+        # продолжать работать другие экземпляры бота
+        await runner.cleanup()